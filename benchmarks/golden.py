@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from src.ui.backends import BACKENDS
+from src.ui.wind_tunnel import WindTunnel
+
+SIM_WIDTH = 1000 / 700
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden')
+GOLDEN_FIELDS = ('u', 'v', 'p', 'm')
+SOLVERS = ('gauss_seidel', 'red_black', 'pcg')
+REFERENCE_BACKEND = 'loop'
+
+# Канонические сцены: параметры WindTunnel, перемещение препятствия (шаг, x, y),
+# число Куранта подшагов (None - фиксированный шаг dt, как в GUI и headless) и
+# допустимая относительная ошибка; steps/every задают длину сцены вместо --steps/--every.
+# При фиксированном dt разница эквивалентных реализаций из-за округления float32
+# (наибольшая по полям) растёт в 2-4 раза за шаг у gauss_seidel и pcg и до 10 раз
+# у red_black: около 2e-4 к 4-му шагу и 1e-2 к 6-му. Поэтому длинные сцены считаются
+# подшагами с числом Куранта 1, а фиксированный шаг проверяется короткой сценой
+# с более мягким допуском
+CFL = 1.0
+SCENES = {
+    'default': {'params': {}, 'move': None, 'cfl': CFL, 'tolerance': 1e-3},
+    'moving_obstacle': {'params': {}, 'move': (8, 0.3, 0.7), 'cfl': CFL, 'tolerance': 1e-3},
+    'gravity': {'params': {'gravity': -9.81}, 'move': None, 'cfl': CFL, 'tolerance': 1e-3},
+    'fixed_dt': {'params': {}, 'move': None, 'cfl': None, 'tolerance': 1e-2, 'steps': 4, 'every': 2},
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Comparison of Fluid backends against golden loop snapshots')
+    parser.add_argument('--generate', action='store_true',
+                        help='пересчитать эталонные снимки эталонной реализацией (backend loop)')
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=['numpy', 'numba', 'parallel'])
+    parser.add_argument('--solvers', nargs='+', choices=SOLVERS, default=list(SOLVERS))
+    parser.add_argument('--scenes', nargs='+', choices=sorted(SCENES), default=list(SCENES))
+    parser.add_argument('--workers', type=int, default=2, help='число процессов для backend parallel')
+    parser.add_argument('--res', type=int, default=24, help='число ячеек по высоте (только с --generate)')
+    parser.add_argument('--steps', type=int, default=16,
+                        help='число шагов (только с --generate, если у сцены не задано своё)')
+    parser.add_argument('--every', type=int, default=8,
+                        help='снимок каждые K шагов (только с --generate, если у сцены не задано своё)')
+    parser.add_argument('--golden', default=GOLDEN_DIR, help='каталог эталонных снимков')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='допустимая относительная ошибка ||x - x_ref|| / ||x_ref|| каждого поля '
+                             '(по умолчанию своя у каждой сцены, см. SCENES)')
+    parser.add_argument('--no-speedup', action='store_true',
+                        help='не считать эталонную реализацию заново для сравнения времени')
+    parser.add_argument('--out', default=None, help='файл для результатов сравнения (JSON)')
+    return parser.parse_args(argv)
+
+
+def golden_path(directory, scene, solver):
+    return os.path.join(directory, f'{scene}_{solver}.npz')
+
+
+def run_scene(scene, backend, solver, res, steps, every, workers=None):
+    """
+    Расчёт канонической сцены со снимками полей
+    :param scene: имя сцены (см. SCENES)
+    :param backend: реализация Fluid
+    :param solver: решатель давления
+    :param res: число ячеек по высоте
+    :param steps: число шагов
+    :param every: снимок каждые every шагов
+    :param workers: число процессов для backend parallel
+    :return: (словарь поле -> массив (снимки, num_x, num_y) float32, время шагов со второго в секундах)
+    """
+    tunnel = WindTunnel(SIM_WIDTH, res=res, **SCENES[scene]['params'])
+    tunnel.backend = backend
+    if backend == 'parallel':
+        # полосы и на маленькой сетке, иначе ParallelFluid считает в одном процессе
+        tunnel.backend_options = {'workers': workers, 'min_strip_cells': 0}
+    tunnel.pressure_solver = solver
+    tunnel.cfl = SCENES[scene]['cfl']
+    tunnel.setup()
+    move = SCENES[scene]['move']
+
+    snapshots = {name: [] for name in GOLDEN_FIELDS}
+    elapsed = 0.0
+    try:
+        for step in range(1, steps + 1):
+            start = time.perf_counter()
+            tunnel.simulate()
+            # первый шаг включает компиляцию Numba и запуск процессов, поэтому не замеряется
+            if step > 1:
+                elapsed += time.perf_counter() - start
+            if move is not None and step == move[0]:
+                tunnel.move_obstacle(x=move[1], y=move[2])
+            if step % every == 0:
+                for name in GOLDEN_FIELDS:
+                    snapshots[name].append(tunnel.fluid.grid(name).copy())
+    finally:
+        tunnel.close()
+    return {name: np.stack(frames) for name, frames in snapshots.items()}, elapsed
+
+
+def generate(args):
+    os.makedirs(args.golden, exist_ok=True)
+    for scene in args.scenes:
+        steps = SCENES[scene].get('steps', args.steps)
+        every = SCENES[scene].get('every', args.every)
+        for solver in args.solvers:
+            fields, elapsed = run_scene(scene, REFERENCE_BACKEND, solver, args.res, steps, every)
+            meta = {
+                'scene': scene,
+                'solver': solver,
+                'res': args.res,
+                'steps': steps,
+                'every': every,
+                'cfl': SCENES[scene]['cfl'],
+                'elapsed_s': elapsed,
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+            }
+            path = golden_path(args.golden, scene, solver)
+            np.savez_compressed(path, meta=np.array(json.dumps(meta)), **fields)
+            print(f'{path}: {elapsed:.2f} s')
+
+
+def error_norms(value, reference):
+    """
+    Ошибки поля относительно эталона по всем снимкам
+    :param value: массив (снимки, num_x, num_y)
+    :param reference: эталон той же формы
+    :return: словарь max_abs, rms, rel_l2 (наибольшая по снимкам ||x - x_ref|| / ||x_ref||)
+    """
+    diff = value.astype(np.float64) - reference
+    per_frame = np.linalg.norm(diff.reshape(len(diff), -1), axis=1)
+    scale = np.linalg.norm(reference.reshape(len(reference), -1).astype(np.float64), axis=1)
+    rel = np.divide(per_frame, scale, out=per_frame.copy(), where=scale > 0)
+    return {
+        'max_abs': float(np.abs(diff).max()),
+        'rms': float(np.sqrt(np.mean(diff * diff))),
+        'rel_l2': float(rel.max()),
+    }
+
+
+def check(args):
+    """
+    Сравнение реализаций с эталонными снимками
+    :return: (список результатов, список строк отчёта о расхождениях)
+    """
+    results = []
+    failures = []
+    for scene in args.scenes:
+        for solver in args.solvers:
+            path = golden_path(args.golden, scene, solver)
+            if not os.path.exists(path):
+                print(f'{path} is missing, run with --generate', file=sys.stderr)
+                continue
+            with np.load(path) as golden:
+                meta = json.loads(str(golden['meta']))
+                reference = {name: golden[name] for name in GOLDEN_FIELDS}
+            tolerance = SCENES[scene]['tolerance'] if args.tolerance is None else args.tolerance
+
+            # время эталона из файла снято на другой машине, поэтому для ускорения он считается заново
+            reference_elapsed = None
+            if not args.no_speedup:
+                _, reference_elapsed = run_scene(scene, REFERENCE_BACKEND, solver, meta['res'], meta['steps'],
+                                                 meta['every'])
+
+            for backend in args.backends:
+                if backend == 'parallel' and solver != 'red_black':
+                    continue
+                fields, elapsed = run_scene(scene, backend, solver, meta['res'], meta['steps'], meta['every'],
+                                            args.workers)
+                row = {
+                    'scene': scene,
+                    'solver': solver,
+                    'backend': backend,
+                    'elapsed_s': elapsed,
+                    'speedup': None,
+                    'tolerance': tolerance,
+                    'fields': {name: error_norms(fields[name], reference[name]) for name in GOLDEN_FIELDS},
+                }
+                if reference_elapsed is not None:
+                    row['speedup'] = reference_elapsed / elapsed if elapsed > 0 else float('inf')
+                row['passed'] = all(norms['rel_l2'] <= tolerance for norms in row['fields'].values())
+                results.append(row)
+                report(row)
+                if not row['passed']:
+                    failures.append(f'{scene} {solver} {backend}')
+    return results, failures
+
+
+def report(row):
+    speedup = '' if row['speedup'] is None else f"x{row['speedup']:.1f}"
+    print(f"{row['scene']:<16} {row['solver']:<12} {row['backend']:>8}  "
+          f"{speedup:<8} {'ok' if row['passed'] else 'FAILED'}")
+    for name, norms in row['fields'].items():
+        print(f"    {name}: max_abs={norms['max_abs']:.3e} rms={norms['rms']:.3e} rel_l2={norms['rel_l2']:.3e}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.generate:
+        generate(args)
+        return 0
+
+    results, failures = check(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'results': results}, f, indent=2)
+    if failures:
+        print('Mismatches:\n' + '\n'.join(failures), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
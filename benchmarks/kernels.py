@@ -0,0 +1,304 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from src.ui.backends import BACKENDS
+from src.ui.wind_tunnel import WindTunnel
+
+SIM_WIDTH = 1000 / 700
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# замеры запуска выполняются в новом процессе, поэтому в них входят импорт модулей и загрузка кэша Numba
+STARTUP_CODE = {
+    'first_step': '''
+import time
+start = time.perf_counter()
+from src.ui.wind_tunnel import WindTunnel
+tunnel = WindTunnel({width}, res={res}, iter_num={iter_num})
+tunnel.backend = {backend!r}
+tunnel.pressure_solver = {solver!r}
+tunnel.setup()
+tunnel.simulate()
+print(time.perf_counter() - start)
+tunnel.close()
+''',
+    'first_frame': '''
+import time
+start = time.perf_counter()
+from PyQt6.QtWidgets import QApplication
+from src.ui.scene import Scene
+app = QApplication([])
+scene = Scene(threaded=False, res={res}, started=start)
+scene.timer.stop()
+scene.draw()
+print(scene.first_frame_s)
+scene.shutdown()
+''',
+}
+KERNELS = ('integrate', 'solve_incompressibility', 'extrapolate', 'advect_vel', 'advect_smoke', 'simulate')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Kernel benchmarks for Fluid across grid resolutions')
+    parser.add_argument('--res', type=int, nargs='+', default=[50, 100, 200, 400], help='число ячеек по высоте')
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKENDS), default=['numpy'])
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help='число процессов для backend parallel (по умолчанию 1, 2, 4, ... до числа ядер)')
+    parser.add_argument('--solver', choices=('gauss_seidel', 'red_black', 'pcg'), default='red_black')
+    parser.add_argument('--iter-num', type=int, default=5, help='число прогонок решения')
+    parser.add_argument('--repeat', type=int, default=5, help='число замеров каждого ядра')
+    parser.add_argument('--warmup', type=int, default=3, help='шаги разгона потока перед замерами')
+    parser.add_argument('--no-draw', action='store_true', help='не замерять Scene.draw')
+    parser.add_argument('--no-startup', action='store_true', help='не замерять время до первого шага и кадра')
+    parser.add_argument('--out', default='bench_results.json', help='файл для результатов')
+    parser.add_argument('--compare', default=None, help='прошлые результаты для сравнения')
+    parser.add_argument('--threshold', type=float, default=1.2, help='замедление, считающееся регрессией')
+    return parser.parse_args(argv)
+
+
+def build_tunnel(res, backend, solver, iter_num, options=None):
+    tunnel = WindTunnel(SIM_WIDTH, res=res, iter_num=iter_num)
+    tunnel.backend = backend
+    tunnel.backend_options = options or {}
+    tunnel.pressure_solver = solver
+    tunnel.setup()
+    return tunnel
+
+
+def measure(func, repeat):
+    """
+    Замер времени выполнения
+    :param func: функция без аргументов
+    :param repeat: число замеров
+    :return: список времён в секундах
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def kernel_calls(tunnel):
+    fluid = tunnel.fluid
+    dt = tunnel.dt
+
+    def solve():
+        fluid.p.fill(0)
+        fluid.project(tunnel.iter_num, dt, tunnel.over_relaxation)
+
+    return {
+        'integrate': lambda: fluid.integrate(dt, tunnel.gravity),
+        'solve_incompressibility': solve,
+        'extrapolate': fluid.extrapolate,
+        'advect_vel': lambda: fluid.advect_vel(dt),
+        'advect_smoke': lambda: fluid.advect_smoke(dt),
+        'simulate': tunnel.simulate,
+    }
+
+
+def worker_counts(args):
+    if args.workers:
+        return args.workers
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    return counts
+
+
+def result(backend, solver, tunnel, kernel, times):
+    fluid = tunnel.fluid
+    cells = (fluid.num_x - 2) * (fluid.num_y - 2)
+    best = min(times)
+    return {
+        'backend': backend,
+        'workers': getattr(fluid, 'workers', 1),
+        'solver': solver,
+        'res': tunnel.res,
+        'num_x': fluid.num_x,
+        'num_y': fluid.num_y,
+        'cells': cells,
+        'kernel': kernel,
+        'repeat': len(times),
+        'best_s': best,
+        'median_s': statistics.median(times),
+        'cells_per_s': cells / best if best > 0 else float('inf'),
+    }
+
+
+def bench_kernels(args):
+    results = []
+    for backend in args.backends:
+        if backend == 'parallel':
+            results += bench_scaling(args)
+            continue
+        for res in args.res:
+            tunnel = build_tunnel(res, backend, args.solver, args.iter_num)
+            for _ in range(args.warmup):
+                tunnel.simulate()
+            for kernel, func in kernel_calls(tunnel).items():
+                results.append(result(backend, args.solver, tunnel, kernel, measure(func, args.repeat)))
+                report(results[-1])
+    return results
+
+
+def bench_scaling(args):
+    """
+    Замер полного шага ParallelFluid при разном числе процессов.
+    Отдельные ядра не замеряются: вне simulate они выполняются в главном процессе
+    :return: список результатов
+    """
+    results = []
+    for res in args.res:
+        base = None
+        for workers in worker_counts(args):
+            # min_strip_cells=0: замеряются полосы при любом размере, в том числе там, где
+            # ParallelFluid по умолчанию считал бы в одном процессе (см. MIN_STRIP_CELLS)
+            tunnel = build_tunnel(res, 'parallel', 'red_black', args.iter_num,
+                                  {'workers': workers, 'min_strip_cells': 0})
+            for _ in range(args.warmup):
+                tunnel.simulate()
+            row = result('parallel', 'red_black', tunnel, 'simulate', measure(tunnel.simulate, args.repeat))
+            tunnel.close()
+            base = base or row['best_s']
+            row['speedup'] = base / row['best_s'] if row['best_s'] > 0 else float('inf')
+            results.append(row)
+            report(row)
+    return results
+
+
+def bench_draw(args):
+    """
+    Замер Scene.draw с отрисовкой во внеэкранный буфер
+    :return: список результатов (пустой, если PyQt6 недоступен)
+    """
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt6.QtWidgets import QApplication
+    except ImportError:
+        print('PyQt6 is not available, skipping Scene.draw', file=sys.stderr)
+        return []
+    from src.ui.scene import Scene
+
+    app = QApplication.instance() or QApplication([])
+    scene = Scene(threaded=False)
+    scene.timer.stop()
+
+    results = []
+    for res in args.res:
+        scene.tunnel.res = res
+        scene.setup_scene()
+        results.append(result('qt', args.solver, scene.tunnel, 'draw', measure(scene.draw, args.repeat)))
+        report(results[-1])
+    scene.shutdown()
+    app.processEvents()
+    return results
+
+
+def run_startup(code):
+    """
+    Запуск замера в новом процессе интерпретатора
+    :param code: текст программы, которая печатает время в секундах последней строкой
+    :return: время в секундах
+    """
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.split()[-1])
+
+
+def bench_startup(args):
+    """
+    Время до первого шага для каждой реализации и до первого кадра Scene от начала процесса
+    :return: список результатов (без first_frame, если PyQt6 недоступен или задан --no-draw)
+    """
+    runs = [(backend, 'first_step') for backend in args.backends]
+    if not args.no_draw:
+        if importlib.util.find_spec('PyQt6') is None:
+            print('PyQt6 is not available, skipping first_frame', file=sys.stderr)
+        else:
+            runs.append(('qt', 'first_frame'))
+
+    results = []
+    for res in args.res:
+        tunnel = build_tunnel(res, 'numpy', args.solver, args.iter_num)
+        for backend, kernel in runs:
+            code = STARTUP_CODE[kernel].format(width=SIM_WIDTH, res=res, iter_num=args.iter_num,
+                                               backend=backend, solver=args.solver)
+            times = [run_startup(code) for _ in range(args.repeat)]
+            results.append(result(backend, args.solver, tunnel, kernel, times))
+            report(results[-1])
+    return results
+
+
+def report(row):
+    line = (f"{row['backend']:>8} res={row['res']:<4} {row['kernel']:<24} "
+            f"{row['best_s'] * 1000:9.3f} ms  {row['cells_per_s']:10.3e} cells/s")
+    if 'speedup' in row:
+        line += f"  workers={row['workers']} x{row['speedup']:.2f}"
+    print(line)
+
+
+def compare(results, path, threshold):
+    """
+    Сравнение с прошлым запуском
+    :return: список регрессий (строки отчёта)
+    """
+    with open(path) as f:
+        baseline = json.load(f)['results']
+    key = lambda row: (row['backend'], row.get('workers', 1), row['solver'], row['res'], row['kernel'])
+    previous = {key(row): row for row in baseline}
+
+    regressions = []
+    for row in results:
+        old = previous.get(key(row))
+        if old is None:
+            continue
+        ratio = row['best_s'] / old['best_s'] if old['best_s'] > 0 else 1.0
+        line = f"{row['backend']} workers={row['workers']} res={row['res']} {row['kernel']}: x{ratio:.2f}"
+        print(line)
+        if ratio > threshold:
+            regressions.append(line)
+    return regressions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = bench_kernels(args)
+    if not args.no_draw:
+        results += bench_draw(args)
+    if not args.no_startup:
+        results += bench_startup(args)
+
+    with open(args.out, 'w') as f:
+        json.dump({
+            'meta': {
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+                'args': vars(args),
+            },
+            'results': results,
+        }, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print('Regressions:\n' + '\n'.join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+# отметка до импорта модулей симуляции для времени до первого шага
+STARTED = time.perf_counter()
+
+from src.ui.backends import BACKENDS, backend_class
+
+OUTPUT_FIELDS = ('u', 'v', 'p', 'm')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fluid simulation without GUI')
+    parser.add_argument('--res', type=int, default=100, help='число ячеек по высоте')
+    parser.add_argument('--width', type=float, default=1000 / 700, help='ширина области (высота равна 1)')
+    parser.add_argument('--in-vel', type=float, default=2.5, help='скорость набегающего потока')
+    parser.add_argument('--obstacle', type=float, nargs=4, default=(0.1, 0.9, 0.09, 0.21),
+                        metavar=('X', 'Y', 'W', 'H'), help='препятствие: x, y, ширина, высота')
+    parser.add_argument('--dt', type=float, default=1.0 / 20.0, help='шаг времени')
+    parser.add_argument('--iter-num', type=int, default=5, help='число прогонок решения')
+    parser.add_argument('--gravity', type=float, default=0.0, help='значение гравитации')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='numpy')
+    parser.add_argument('--solver', choices=('gauss_seidel', 'red_black', 'pcg'), default='red_black')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='допустимая max |div|, при которой решатель останавливается (--iter-num - предел итераций)')
+    parser.add_argument('--warm-start', action='store_true', help='начинать решение с давления предыдущего шага')
+    parser.add_argument('--warm-start-probe', type=int, default=None, metavar='K',
+                        help='с --warm-start раз в K шагов решать и с нуля для iters_saved '
+                             '(удваивает время project на этих шагах)')
+    parser.add_argument('--cfl', type=float, default=None,
+                        help='целевое число Куранта: --dt делится на подшаги (по умолчанию фиксированный шаг)')
+    parser.add_argument('--budget', type=float, default=None, help='время счёта одного шага --dt в секундах')
+    parser.add_argument('--max-substeps', type=int, default=8, help='максимальное число подшагов')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='число процессов для --backend parallel (по умолчанию по числу ядер; '
+                             'сетки меньше MIN_STRIP_CELLS ячеек на процесс считаются в одном процессе)')
+    parser.add_argument('--steps', type=int, default=100, help='число шагов N')
+    parser.add_argument('--every', type=int, default=10, help='запись полей каждые K шагов (0 - не писать)')
+    parser.add_argument('--out', default='output', help='каталог для снимков полей')
+    parser.add_argument('--record', default=None,
+                        help='файл записи (memmap) вместо отдельных снимков в --out')
+    parser.add_argument('--stream', default=None, help='имя кольца кадров в общей памяти для src/viewer.py')
+    parser.add_argument('--stream-address', default=None,
+                        help="адрес для зрителей по сокету: 'unix:/путь' или '[host]:port'")
+    parser.add_argument('--stream-field', choices=('m', 'p'), default='m', help='транслируемое поле: дым или давление')
+    parser.add_argument('--layout', default=None,
+                        help='описание сцены в JSON (см. SceneLayout) вместо стандартной трубы с --in-vel')
+    parser.add_argument('--layout-cache', default=None, help='каталог готовых сеток сцены')
+    parser.add_argument('--restore', default=None,
+                        help='продолжить с контрольной точки (сетка, препятствие, --dt, --gravity и --iter-num берутся из неё)')
+    parser.add_argument('--checkpoint', default=None,
+                        help='файл контрольной точки: сохраняется в фоне и в конце расчёта')
+    parser.add_argument('--checkpoint-every', type=int, default=100, help='сохранять контрольную точку каждые K шагов')
+    args = parser.parse_args(argv)
+
+    solvers = backend_class(args.backend).SOLVERS
+    if args.solver not in solvers:
+        parser.error(f'--backend {args.backend} supports only --solver {", ".join(solvers)}')
+    return args
+
+
+def build_tunnel(args):
+    """
+    Сборка той же аэродинамической трубы, что и в Scene, по параметрам командной строки
+    :param args: результат parse_args
+    :return: подготовленный WindTunnel
+    """
+    # модули симуляции (и NumPy) импортируются здесь, чтобы --help не ждал их загрузки
+    from src.ui.layout import SceneLayout
+    from src.ui.wind_tunnel import WindTunnel
+
+    tunnel = WindTunnel(
+        args.width,
+        res=args.res,
+        in_vel=args.in_vel,
+        dt=args.dt,
+        iter_num=args.iter_num,
+        gravity=args.gravity,
+        obstacle=tuple(args.obstacle)
+    )
+    tunnel.backend = args.backend
+    if args.backend == 'parallel':
+        tunnel.backend_options = {'workers': args.workers}
+    tunnel.pressure_solver = args.solver
+    tunnel.tolerance = args.tolerance
+    tunnel.warm_start = args.warm_start
+    tunnel.warm_start_probe = args.warm_start_probe
+    tunnel.cfl = args.cfl
+    tunnel.step_budget = args.budget
+    tunnel.max_substeps = args.max_substeps
+    if args.layout:
+        tunnel.layout = SceneLayout.load(args.layout)
+    tunnel.layout_cache = args.layout_cache
+    if args.restore:
+        tunnel.load_checkpoint(args.restore)
+    else:
+        tunnel.setup()
+    return tunnel
+
+
+def write_snapshot(out_dir, tunnel):
+    """
+    Запись полей текущего шага в отдельный .npz файл
+    :param out_dir: каталог вывода
+    :param tunnel: объект WindTunnel
+    :return:
+    """
+    import numpy as np
+
+    fluid = tunnel.fluid
+    path = os.path.join(out_dir, f'frame_{tunnel.frame_num:06d}.npz')
+    np.savez(path, **{name: getattr(fluid, name) for name in OUTPUT_FIELDS})
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tunnel = build_tunnel(args)
+    fluid = tunnel.fluid
+
+    if args.record and args.every:
+        tunnel.start_recording(args.record, max(1, args.steps // args.every), every=args.every)
+    elif args.every:
+        os.makedirs(args.out, exist_ok=True)
+        with open(os.path.join(args.out, 'meta.json'), 'w') as f:
+            json.dump({
+                'num_x': fluid.num_x,
+                'num_y': fluid.num_y,
+                'h': fluid.h,
+                'dt': tunnel.dt,
+                'fields': OUTPUT_FIELDS,
+                'params': vars(args),
+            }, f, indent=2)
+    if args.stream or args.stream_address:
+        tunnel.start_streaming(args.stream, args.stream_field, args.stream_address)
+    if args.checkpoint and args.checkpoint_every:
+        tunnel.start_checkpoints(args.checkpoint, args.checkpoint_every)
+
+    start = time.perf_counter()
+    first_step = None
+    for step in range(args.steps):
+        tunnel.simulate()
+        if first_step is None:
+            first_step = time.perf_counter() - STARTED
+        if args.every and not args.record and tunnel.frame_num % args.every == 0:
+            write_snapshot(args.out, tunnel)
+    elapsed = time.perf_counter() - start
+    if args.checkpoint:
+        checkpointer = tunnel.checkpointer
+        tunnel.stop_checkpoints()
+        if checkpointer is not None and checkpointer.error is not None:
+            print(f'periodic checkpoint failed: {checkpointer.error!r}', file=sys.stderr)
+        tunnel.save_checkpoint(args.checkpoint)
+    tunnel.close()
+
+    cells = (fluid.num_x - 2) * (fluid.num_y - 2)
+    print(f'{args.steps} steps in {elapsed:.3f} s: '
+          f'{args.steps / elapsed:.1f} steps/s, {args.steps * cells / elapsed:.3e} cells/s')
+    if first_step is not None:
+        print(f'first step {first_step:.3f} s after start')
+
+
+if __name__ == '__main__':
+    main()
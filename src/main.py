@@ -1,3 +1,8 @@
+import time
+
+# отметка до импорта Qt и модулей симуляции: время до первого кадра включает и их загрузку
+STARTED = time.perf_counter()
+
 from src.ui import SimulationWindow
 
 from PyQt6.QtWidgets import QApplication
@@ -5,11 +10,11 @@ from PyQt6.QtWidgets import QApplication
 
 def main():
     app = QApplication([])
-    sim = SimulationWindow()
+    sim = SimulationWindow(started=STARTED)
 
     sim.show()
     app.exec()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
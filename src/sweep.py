@@ -0,0 +1,103 @@
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from src.ui.ensemble import EnsembleTunnel
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Parameter sweep over batched wind tunnel simulations')
+    parser.add_argument('--res', type=int, default=50, help='число ячеек по высоте')
+    parser.add_argument('--width', type=float, default=1000 / 700, help='ширина области (высота равна 1)')
+    parser.add_argument('--dt', type=float, default=1.0 / 20.0, help='шаг времени')
+    parser.add_argument('--iter-num', type=int, default=5, help='число прогонок решения')
+    parser.add_argument('--gravity', type=float, default=0.0, help='значение гравитации')
+    parser.add_argument('--steps', type=int, default=100, help='число шагов каждого расчёта')
+    parser.add_argument('--x', type=float, nargs='+', default=[0.1], help='х препятствия')
+    parser.add_argument('--y', type=float, nargs='+', default=[0.9], help='у препятствия')
+    parser.add_argument('--obstacle-width', type=float, nargs='+', default=[0.09], help='ширина препятствия')
+    parser.add_argument('--obstacle-height', type=float, nargs='+', default=[0.21], help='высота препятствия')
+    parser.add_argument('--in-vel', type=float, nargs='+', default=[2.5], help='скорость набегающего потока')
+    parser.add_argument('--over-relaxation', type=float, nargs='+', default=[1.9], help='коэф. успокоения')
+    parser.add_argument('--batch', type=int, default=8, help='число расчётов в одном ансамбле')
+    parser.add_argument('--processes', type=int, default=None, help='число процессов (по умолчанию по числу ядер)')
+    parser.add_argument('--out', default='sweep.json', help='файл для результатов')
+    return parser.parse_args(argv)
+
+
+def sweep_cases(args):
+    """
+    Декартово произведение значений параметров
+    :param args: результат parse_args
+    :return: список словарей параметров (см. EnsembleTunnel)
+    """
+    return [
+        {'obstacle': (x, y, width, height), 'in_vel': in_vel, 'over_relaxation': omega}
+        for x, y, width, height, in_vel, omega in itertools.product(
+            args.x, args.y, args.obstacle_width, args.obstacle_height, args.in_vel, args.over_relaxation
+        )
+    ]
+
+
+def run_batch(cases, steps, **params):
+    """
+    Расчёт одного ансамбля
+    :param cases: параметры расчётов ансамбля
+    :param steps: число шагов
+    :param params: общие параметры EnsembleTunnel (sim_width, res, dt, iter_num, gravity)
+    :return: список словарей: параметры расчёта и его сводные показатели
+    """
+    ensemble = EnsembleTunnel(cases, **params)
+    ensemble.setup()
+    start = time.perf_counter()
+    for _ in range(steps):
+        ensemble.simulate()
+    elapsed = time.perf_counter() - start
+    return [
+        dict(case, steps=steps, batch_time_s=elapsed, **metrics)
+        for case, metrics in zip(ensemble.cases, ensemble.metrics())
+    ]
+
+
+def run_sweep(cases, steps, batch=8, processes=None, **params):
+    """
+    Расчёт всех случаев ансамблями по batch штук, ансамбли распределяются по процессам
+    :param cases: список параметров расчётов
+    :param steps: число шагов каждого расчёта
+    :param batch: размер ансамбля
+    :param processes: число процессов (None - по числу ядер, 1 - в текущем процессе)
+    :param params: общие параметры EnsembleTunnel
+    :return: результаты run_batch в порядке cases
+    """
+    chunks = [cases[k:k + batch] for k in range(0, len(cases), batch)]
+    task = partial(run_batch, steps=steps, **params)
+    processes = min(processes or os.cpu_count() or 1, len(chunks))
+    if processes <= 1:
+        results = map(task, chunks)
+    else:
+        with ProcessPoolExecutor(processes, mp_context=mp.get_context('spawn')) as pool:
+            results = list(pool.map(task, chunks))
+    return [row for chunk in results for row in chunk]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cases = sweep_cases(args)
+
+    start = time.perf_counter()
+    results = run_sweep(cases, args.steps, args.batch, args.processes, sim_width=args.width, res=args.res,
+                        dt=args.dt, iter_num=args.iter_num, gravity=args.gravity)
+    elapsed = time.perf_counter() - start
+
+    with open(args.out, 'w') as f:
+        json.dump({'params': vars(args), 'results': results}, f, indent=2)
+    print(f'{len(cases)} cases x {args.steps} steps in {elapsed:.3f} s, results in {args.out}')
+
+
+if __name__ == '__main__':
+    main()
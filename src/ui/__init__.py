@@ -1 +1,6 @@
-from .main_window import SimulationWindow
+def __getattr__(name):
+    # окно импортируется лениво, чтобы модули симуляции работали без PyQt6
+    if name == 'SimulationWindow':
+        from .main_window import SimulationWindow
+        return SimulationWindow
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,133 @@
+import numpy as np
+
+ACTIVE_LISTS = ('v_faces', 'u_faces', 'cells', 'smoke', 'u_rest', 'v_rest', 'smoke_rest')
+# списки, которые хранятся масками (num_x, num_y); *_rest - их дополнения
+MASKS = ('v_faces', 'u_faces', 'cells', 'smoke')
+# список -> (маска, взять дополнение маски)
+LIST_MASKS = {
+    'v_faces': ('v_faces', False),
+    'u_faces': ('u_faces', False),
+    'cells': ('cells', False),
+    'smoke': ('smoke', False),
+    'u_rest': ('u_faces', True),
+    'v_rest': ('v_faces', True),
+    'smoke_rest': ('smoke', True),
+}
+
+
+class ActiveCells:
+    """
+    Плоские номера ячеек и граней, которые обрабатывают этапы Fluid, по маске s:
+    v_faces - грани v между двумя нетвёрдыми ячейками (integrate, advect_vel),
+    u_faces - такие же грани u (advect_vel), cells - ячейки решателя давления,
+    smoke - нетвёрдые внутренние ячейки (advect_smoke).
+    Списки *_rest - дополнения u_faces, v_faces и smoke до всей сетки: значения,
+    которые перенос не пересчитывает и копирует в задний буфер (см. Fluid.carry).
+    Номера идут в порядке циклов Fluid (j внешний, i внутренний), поэтому
+    Гаусс-Зейдель по списку даёт тот же результат, что и по всей сетке.
+    cell_mask - те же ячейки решателя маской (num_x, num_y).
+    После изменения s в прямоугольнике списки обновляются частично (update)
+    """
+
+    def __init__(self, s, num_x, num_y):
+        """
+        :param s: плоская маска твёрдых ячеек (0 - твёрдая)
+        :param num_x: число ячеек по х (с границами)
+        :param num_y: число ячеек по у (с границами)
+        """
+        self.num_x = num_x
+        self.num_y = num_y
+        self.masks = {name: np.zeros((num_x, num_y), dtype=bool) for name in MASKS}
+        self._fill(s.reshape(num_x, num_y), 0, num_x, 0, num_y)
+        self.cell_mask = self.masks['cells']
+
+        self.lists = {name: self._indices(self._list_mask(name)) for name in ACTIVE_LISTS}
+        self.strips = {}
+
+    def _list_mask(self, name, i0=0, i1=None, j0=0, j1=None):
+        mask, invert = LIST_MASKS[name]
+        mask = self.masks[mask][i0:i1, j0:j1]
+        return ~mask if invert else mask
+
+    def _fill(self, grid, i0, i1, j0, j1):
+        """
+        Пересчёт масок в прямоугольнике [i0, i1) x [j0, j1)
+        """
+        nx = self.num_x
+        ny = self.num_y
+        open_cell = grid != 0.0
+        for mask in self.masks.values():
+            mask[i0:i1, j0:j1] = False
+
+        # i in [1, num_x - 2], j in [1, num_y - 1]
+        a, b, c, d = max(i0, 1), min(i1, nx - 1), max(j0, 1), min(j1, ny)
+        if a < b and c < d:
+            self.masks['v_faces'][a:b, c:d] = open_cell[a:b, c:d] & open_cell[a:b, c - 1:d - 1]
+        # i in [1, num_x - 1], j in [1, num_y - 2]
+        a, b, c, d = max(i0, 1), min(i1, nx), max(j0, 1), min(j1, ny - 1)
+        if a < b and c < d:
+            self.masks['u_faces'][a:b, c:d] = open_cell[a:b, c:d] & open_cell[a - 1:b - 1, c:d]
+        # i in [1, num_x - 2], j in [1, num_y - 2]
+        a, b, c, d = max(i0, 1), min(i1, nx - 1), max(j0, 1), min(j1, ny - 1)
+        if a < b and c < d:
+            self.masks['smoke'][a:b, c:d] = open_cell[a:b, c:d]
+            self.masks['cells'][a:b, c:d] = open_cell[a:b, c:d] & (
+                (grid[a - 1:b - 1, c:d] + grid[a + 1:b + 1, c:d] +
+                 grid[a:b, c - 1:d - 1] + grid[a:b, c + 1:d + 1]) != 0.0)
+
+    def update(self, s, region):
+        """
+        Обновление после изменения маски s в прямоугольнике: маски пересчитываются
+        в нём и в соседних ячейках, в списках заменяются только номера из этого
+        прямоугольника (новые вставляются по порядку j, i)
+        :param s: плоская маска твёрдых ячеек
+        :param region: изменившиеся ячейки (i0, i1, j0, j1), полуинтервалы
+        :return:
+        """
+        nx = self.num_x
+        i0, i1, j0, j1 = region
+        i0, i1 = max(i0 - 1, 0), min(i1 + 1, nx)
+        j0, j1 = max(j0 - 1, 0), min(j1 + 1, self.num_y)
+        if i0 >= i1 or j0 >= j1:
+            return
+        self._fill(s.reshape(nx, self.num_y), i0, i1, j0, j1)
+
+        for name in ACTIVE_LISTS:
+            k, i, j = self.lists[name]
+            # номера столбцов j0..j1 - один отрезок списка, из него убираются номера прямоугольника
+            lo, hi = np.searchsorted(j, (j0, j1))
+            keep = (i[lo:hi] < i0) | (i[lo:hi] >= i1)
+            new = self._indices(self._list_mask(name, i0, i1, j0, j1), i0, j0)
+            slots = lo + np.flatnonzero(~keep)
+            if len(slots) == len(new[0]) and np.array_equal(j[slots], new[2]):
+                # в каждом столбце столько же номеров (препятствие сдвинулось): замена на месте
+                k[slots] = new[0]
+                i[slots] = new[1]
+                continue
+            old = [a[lo:hi][keep] for a in (k, i, j)]
+            at = np.searchsorted(old[2] * nx + old[1], new[2] * nx + new[1])
+            self.lists[name] = tuple(np.concatenate((a[:lo], np.insert(part, at, b), a[hi:]))
+                                     for a, part, b in zip((k, i, j), old, new))
+        self.strips = {}
+
+    def _indices(self, mask, i0=0, j0=0):
+        # номера по непрерывной копии в порядке (j, i): flatnonzero и divmod быстрее, чем nonzero по 2D
+        j, i = np.divmod(np.flatnonzero(np.ascontiguousarray(mask.T)), mask.shape[0])
+        i += i0
+        j += j0
+        return i * self.num_y + j, i, j
+
+    def get(self, name, rows=None):
+        """
+        :param name: имя списка (см. ACTIVE_LISTS)
+        :param rows: полоса строк по х (lo, hi), None - вся сетка
+        :return: (плоские номера, номера i, номера j)
+        """
+        if rows is None:
+            return self.lists[name]
+        key = (name, tuple(rows))
+        if key not in self.strips:
+            k, i, j = self.lists[name]
+            inside = (i >= rows[0]) & (i < rows[1])
+            self.strips[key] = (k[inside], i[inside], j[inside])
+        return self.strips[key]
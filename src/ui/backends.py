@@ -0,0 +1,50 @@
+import importlib
+import warnings
+
+# модуль и класс реализации; модули импортируются при создании жидкости,
+# чтобы запуски без Numba и multiprocessing не тратили время на их загрузку
+BACKENDS = {
+    'loop': ('.fluid', 'Fluid'),
+    'numpy': ('.fluid_numpy', 'NumpyFluid'),
+    'numba': ('.fluid_numba', 'NumbaFluid'),
+    'parallel': ('.fluid_parallel', 'ParallelFluid'),
+}
+
+
+def backend_class(backend):
+    """
+    Класс реализации Fluid (модуль импортируется при первом обращении)
+    :param backend: имя реализации (см. BACKENDS)
+    :return: подкласс Fluid
+    """
+    module, name = BACKENDS[backend]
+    return getattr(importlib.import_module(module, __package__), name)
+
+
+def create_fluid(backend, density, num_x, num_y, h, solver=None, **options):
+    """
+    Создание объекта жидкости с выбранной реализацией шагов симуляции
+    :param backend: имя реализации ('loop' - эталонные циклы, 'numpy' - векторизованная,
+                    'numba' - циклы под JIT, без Numba - эталонные циклы,
+                    'parallel' - numpy по полосам в нескольких процессах)
+    :param density: плотность
+    :param num_x: число ячеек по х
+    :param num_y: число ячеек по у
+    :param h: размер ячейки
+    :param solver: решатель давления (None - по умолчанию для реализации); проверяется
+                   до создания объекта, чтобы не выделять общую память и процессы зря
+    :param options: параметры реализации (например workers для 'parallel')
+    :return: объект Fluid
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown fluid backend: {backend!r}, expected one of {sorted(BACKENDS)}')
+    if backend == 'numba' and not importlib.import_module('.fluid_numba', __package__).NUMBA_AVAILABLE:
+        warnings.warn('Numba is not installed, falling back to the loop backend')
+        backend = 'loop'
+    cls = backend_class(backend)
+    if solver is not None and solver not in cls.SOLVERS:
+        raise ValueError(f'Backend {backend!r} supports only {", ".join(cls.SOLVERS)}, got solver {solver!r}')
+    fluid = cls(density, num_x, num_y, h, **options)
+    if solver is not None:
+        fluid.solver = solver
+    return fluid
@@ -0,0 +1,179 @@
+import json
+import os
+import queue
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b'FLUIDCKP'
+VERSION = 1
+# данные начинаются с границы страницы, поэтому поля отображаются в память без сдвигов
+HEADER_SIZE = 4096
+# magic, версия, длина JSON
+HEADER_STRUCT = struct.Struct('<8sII')
+
+# new_* не сохраняются: перенос целиком перезаписывает задние буферы
+CHECKPOINT_FIELDS = ('u', 'v', 'p', 's', 'm')
+
+
+def tunnel_state(tunnel):
+    """
+    Параметры сцены, которые нужны для продолжения расчёта с контрольной точки
+    :param tunnel: объект WindTunnel
+    :return: словарь, сериализуемый в JSON
+    """
+    fluid = tunnel.fluid
+    return {
+        'num_x': fluid.num_x,
+        'num_y': fluid.num_y,
+        'h': fluid.h,
+        'density': fluid.density,
+        'cnt': fluid.cnt,
+        'res': tunnel.res,
+        'sim_width': tunnel.sim_width,
+        'sim_height': tunnel.sim_height,
+        'in_vel': tunnel.in_vel,
+        'dt': tunnel.dt,
+        'gravity': tunnel.gravity,
+        'iter_num': tunnel.iter_num,
+        'over_relaxation': tunnel.over_relaxation,
+        'frame_num': tunnel.frame_num,
+        'obstacle': (tunnel.obstacle_x, tunnel.obstacle_y, tunnel.obstacle_width, tunnel.obstacle_height),
+        'layout': tunnel.scene_layout().to_dict(),
+    }
+
+
+def write_checkpoint(path, state, fields):
+    """
+    Запись контрольной точки: JSON-заголовок и поля float32 подряд с HEADER_SIZE.
+    Файл пишется рядом под именем path + '.tmp' и подменяется через os.replace,
+    поэтому на диске всегда лежит целая точка, а открытые Checkpoint не меняются
+    :param path: путь к файлу
+    :param state: параметры сцены (см. tunnel_state)
+    :param fields: словарь имя -> массив (num_x, num_y) float32 для CHECKPOINT_FIELDS
+    :return:
+    """
+    header = json.dumps(dict(state, fields=CHECKPOINT_FIELDS)).encode()
+    if HEADER_STRUCT.size + len(header) > HEADER_SIZE:
+        raise ValueError('Checkpoint header does not fit into the header block')
+
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER_STRUCT.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.seek(HEADER_SIZE)
+        for name in CHECKPOINT_FIELDS:
+            f.write(memoryview(np.ascontiguousarray(fields[name], dtype='<f4')))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Checkpoint:
+    """
+    Контрольная точка, открытая через np.memmap в режиме копирования при записи:
+    поля не читаются целиком и не копируются, страницы подгружаются при обращении,
+    а изменения остаются в памяти процесса и не попадают в файл
+    """
+
+    def __init__(self, path):
+        """
+        :param path: путь к файлу контрольной точки
+        """
+        with open(path, 'rb') as f:
+            magic, version, header_len = HEADER_STRUCT.unpack(f.read(HEADER_STRUCT.size))
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not a fluid checkpoint')
+            if version != VERSION:
+                raise ValueError(f'Unsupported checkpoint version {version}')
+            self.state = json.loads(f.read(header_len))
+
+        self.path = path
+        self.num_x = self.state['num_x']
+        self.num_y = self.state['num_y']
+        self.h = self.state['h']
+        self.fields = tuple(self.state['fields'])
+        self.data = np.memmap(path, dtype='<f4', mode='c', offset=HEADER_SIZE,
+                              shape=(len(self.fields), self.num_x, self.num_y))
+
+    def arrays(self):
+        """
+        Поля контрольной точки
+        :return: словарь имя -> изменяемое представление memmap формы (num_x, num_y)
+        """
+        return {name: self.data[k] for k, name in enumerate(self.fields)}
+
+
+class AutoCheckpoint:
+    """
+    Периодические контрольные точки. capture() только копирует поля в промежуточный
+    буфер, файл пишет фоновый поток. Буфер один: если предыдущая точка ещё
+    пишется, очередная пропускается, поэтому шаг симуляции никогда не ждёт диск
+    """
+
+    def __init__(self, path, every):
+        """
+        :param path: путь к файлу контрольной точки (перезаписывается каждый раз)
+        :param every: сохранять каждый every-й шаг
+        """
+        self.path = path
+        self.every = every
+        self.count = 0
+        self.skipped = 0
+        self.error = None
+
+        self.free = queue.SimpleQueue()
+        self.free.put(None)
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def capture(self, tunnel):
+        """
+        Постановка текущего состояния трубы в очередь записи
+        :param tunnel: объект WindTunnel
+        :return: False, если точка пропущена из-за незаконченной записи
+        """
+        try:
+            stage = self.free.get_nowait()
+        except queue.Empty:
+            self.skipped += 1
+            return False
+
+        fluid = tunnel.fluid
+        shape = (len(CHECKPOINT_FIELDS), fluid.num_x, fluid.num_y)
+        if stage is None or stage.shape != shape:
+            stage = np.empty(shape, dtype=np.float32)
+        for k, name in enumerate(CHECKPOINT_FIELDS):
+            np.copyto(stage[k], fluid.grid(name))
+
+        self.pending.put((tunnel_state(tunnel), stage))
+        return True
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            state, stage = item
+            try:
+                write_checkpoint(self.path, state, dict(zip(CHECKPOINT_FIELDS, stage)))
+                self.count += 1
+            except Exception as e:
+                # ошибка записи (диск, сериализация состояния) не должна останавливать ни симуляцию,
+                # ни этот поток, последняя сохраняется здесь
+                self.error = e
+            finally:
+                self.free.put(stage)
+
+    def close(self):
+        """
+        Дописать поставленную точку и остановить поток записи
+        :return:
+        """
+        if self.thread is None:
+            return
+        self.pending.put(None)
+        self.thread.join()
+        self.thread = None
@@ -0,0 +1,364 @@
+import numpy as np
+
+from .fluid import FIELDS, U_FIELD, V_FIELD, S_FIELD, sample_grid
+from .fluid_numpy import NumpyFluid
+from .pressure import max_divergence
+from .wind_tunnel import WindTunnel
+
+
+def _per_member(value):
+    # массив параметров (B,) приводится к (B, 1, 1) в float32, как скаляры Python в NumpyFluid
+    if np.ndim(value) == 0:
+        return float(value)
+    return np.asarray(value, dtype=np.float64).astype(np.float32).reshape(-1, 1, 1)
+
+
+class EnsembleFluid:
+    """
+    B независимых симуляций одного размера в массивах формы (B, num_x, num_y).
+    Каждый этап выполняется одной векторной операцией для всех членов ансамбля,
+    маски s и параметры (gravity, over_relaxation) у членов могут быть свои.
+    Давление решается red-black SOR, как solve_red_black для одного Fluid
+    """
+
+    def __init__(self, density, batch, num_x, num_y, h):
+        """
+        :param density: плотность
+        :param batch: число членов ансамбля B
+        :param num_x: число ячеек по х
+        :param num_y: число ячеек по у
+        :param h: размер ячейки
+        """
+        self.density = density
+        self.batch = batch
+        self.num_x = num_x + 2
+        self.num_y = num_y + 2
+        self.num_cells = self.num_x * self.num_y
+        self.h = h
+
+        shape = (batch, self.num_x, self.num_y)
+        self.u = np.zeros(shape, dtype=np.float32)
+        self.v = np.zeros(shape, dtype=np.float32)
+        self.p = np.zeros(shape, dtype=np.float32)
+        self.s = np.zeros(shape, dtype=np.float32)
+        self.m = np.ones(shape, dtype=np.float32)
+        self.new_u = np.zeros(shape, dtype=np.float32)
+        self.new_v = np.zeros(shape, dtype=np.float32)
+        self.new_m = np.zeros(shape, dtype=np.float32)
+
+        self.solver_iters = 0
+        self.solver_residual = None
+        self.members = {}
+
+    def member(self, b):
+        """
+        Отдельный член ансамбля как NumpyFluid без копирования полей
+        :param b: номер члена
+        :return: NumpyFluid, поля которого - представления b-го среза массивов ансамбля
+                 (после swap они переставляются вместе с ансамблем)
+        """
+        if b not in self.members:
+            fluid = NumpyFluid(self.density, self.num_x - 2, self.num_y - 2, self.h)
+            for name in FIELDS:
+                fluid.bind(name, getattr(self, name)[b])
+            self.members[b] = fluid
+        return self.members[b]
+
+    def swap(self, name):
+        """
+        Обмен переднего и заднего буферов поля у ансамбля и выданных членов (см. Fluid.swap)
+        :param name: имя поля (см. BUFFERED)
+        :return:
+        """
+        back = 'new_' + name
+        front = getattr(self, name)
+        setattr(self, name, getattr(self, back))
+        setattr(self, back, front)
+        for fluid in self.members.values():
+            fluid.swap(name)
+
+    def integrate(self, dt, gravity):
+        """
+        Суммирование скоростей
+        :param dt: шаг времени
+        :param gravity: значение ускорения св. падения (число или массив (B,))
+        :return:
+        """
+        s = self.s
+        v = self.v
+        mask = (s[:, 1:-1, 1:] != 0.0) & (s[:, 1:-1, :-1] != 0.0)
+        np.add(v[:, 1:-1, 1:], _per_member(np.multiply(gravity, dt)), out=v[:, 1:-1, 1:], where=mask)
+
+    def project(self, num_iters, dt, over_relaxation):
+        """
+        Выполнение условия несжимаемости red-black SOR для всех членов сразу
+        :param num_iters: число итераций (красный + чёрный проход)
+        :param dt: шаг времени
+        :param over_relaxation: коэф. успокоения (число или массив (B,))
+        :return:
+        """
+        cp = self.density * self.h / dt
+        s = self.s
+        u = self.u
+        v = self.v
+
+        sx0 = s[:, :-2, 1:-1]
+        sx1 = s[:, 2:, 1:-1]
+        sy0 = s[:, 1:-1, :-2]
+        sy1 = s[:, 1:-1, 2:]
+        s_sum = sx0 + sx1 + sy0 + sy1
+        cells = (s[:, 1:-1, 1:-1] != 0.0) & (s_sum != 0.0)
+
+        scale = np.zeros_like(s_sum)
+        np.divide(_per_member(over_relaxation), s_sum, out=scale, where=cells)
+        i, j = np.indices(s_sum.shape[1:])
+        red = (i + j) % 2 == 0
+        colours = (np.where(red, scale, 0.0), np.where(red, 0.0, scale))
+
+        u_left = u[:, 1:-1, 1:-1]
+        u_right = u[:, 2:, 1:-1]
+        v_down = v[:, 1:-1, 1:-1]
+        v_up = v[:, 1:-1, 2:]
+        p_cell = self.p[:, 1:-1, 1:-1]
+
+        for iter_num in range(num_iters):
+            for weight in colours:
+                div = u_right - u_left + v_up - v_down
+                pc = -div * weight
+                p_cell += cp * pc
+
+                u_left -= sx0 * pc
+                u_right += sx1 * pc
+                v_down -= sy0 * pc
+                v_up += sy1 * pc
+
+        div = np.abs(u_right - u_left + v_up - v_down)
+        self.solver_iters = num_iters
+        self.solver_residual = np.where(cells, div, 0.0).max(axis=(1, 2))
+
+    def extrapolate(self):
+        """
+        Распространиение скоростей на соседние клетки
+        :return:
+        """
+        self.u[:, :, 0] = self.u[:, :, 1]
+        self.u[:, :, -1] = self.u[:, :, -2]
+        self.v[:, 0, :] = self.v[:, 1, :]
+
+    def cells(self, mask):
+        """
+        Плоские номера ячеек ансамбля по маске
+        :param mask: булев массив формы (B, num_x, num_y)
+        :return: (номера k в плоских полях, смещение члена k - i * num_y - j, i, j)
+        """
+        n = self.num_y
+        k = np.flatnonzero(mask)
+        j = k % n
+        row = k // n
+        i = row % self.num_x
+        return k, (row - i) * n, i, j
+
+    def sample_fields(self, base, x, y, field):
+        """
+        Расчёт поля в точках разных членов ансамбля (см. sample_grid)
+        :param base: массив смещений членов в плоских полях (см. cells)
+        :param x: массив х координат
+        :param y: массив у координат
+        :param field: тип поля (U, V, S)
+        :return: массив значений поля в точках
+        """
+        if field == U_FIELD:
+            f = self.u
+        elif field == V_FIELD:
+            f = self.v
+        elif field == S_FIELD:
+            f = self.m
+        else:
+            raise ValueError(f'Unknown field: {field!r}')
+        return sample_grid(f.reshape(-1), self.num_x, self.num_y, self.h, field, x, y, base=base)
+
+    def advect_vel(self, dt):
+        """
+        Пересчёт предыдущей ячейки жидкости
+        :param dt: шаг времени
+        :return:
+        """
+        n = self.num_y
+        h = self.h
+        h2 = 0.5 * h
+        s = self.s
+        # плоские представления: выборка по одному индексу заметно быстрее, чем по (b, i, j)
+        u = self.u.reshape(-1)
+        v = self.v.reshape(-1)
+        mask = np.zeros(s.shape, dtype=bool)
+
+        # u component: i in [1, num_x - 1], j in [1, num_y - 2]
+        mask[:, 1:, 1:-1] = (s[:, 1:, 1:-1] != 0.0) & (s[:, :-1, 1:-1] != 0.0)
+        # непересчитываемые грани переносятся в задний буфер как есть
+        np.copyto(self.new_u, self.u, where=~mask)
+        k, base, i, j = self.cells(mask)
+        avg_v = (v[k - n] + v[k] + v[k - n + 1] + v[k + 1]) * 0.25
+        x = i * h - dt * u[k]
+        y = j * h + h2 - dt * avg_v
+        self.new_u.reshape(-1)[k] = self.sample_fields(base, x, y, U_FIELD)
+
+        # v component: i in [1, num_x - 2], j in [1, num_y - 1]
+        mask[:] = False
+        mask[:, 1:-1, 1:] = (s[:, 1:-1, 1:] != 0.0) & (s[:, 1:-1, :-1] != 0.0)
+        np.copyto(self.new_v, self.v, where=~mask)
+        k, base, i, j = self.cells(mask)
+        avg_u = (u[k - 1] + u[k] + u[k + n - 1] + u[k + n]) * 0.25
+        x = i * h + h2 - dt * avg_u
+        y = j * h - dt * v[k]
+        self.new_v.reshape(-1)[k] = self.sample_fields(base, x, y, V_FIELD)
+
+        self.swap('u')
+        self.swap('v')
+
+    def advect_smoke(self, dt):
+        """
+        Расчёт завихрений
+        :param dt: шаг времени
+        :return:
+        """
+        n = self.num_y
+        h = self.h
+        h2 = 0.5 * h
+        u = self.u.reshape(-1)
+        v = self.v.reshape(-1)
+
+        mask = np.zeros(self.s.shape, dtype=bool)
+        mask[:, 1:-1, 1:-1] = self.s[:, 1:-1, 1:-1] != 0.0
+        np.copyto(self.new_m, self.m, where=~mask)
+        k, base, i, j = self.cells(mask)
+        x = i * h + h2 - dt * (u[k] + u[k + n]) * 0.5
+        y = j * h + h2 - dt * (v[k] + v[k + 1]) * 0.5
+        self.new_m.reshape(-1)[k] = self.sample_fields(base, x, y, S_FIELD)
+
+        self.swap('m')
+
+    def simulate(self, dt, gravity, iter_num, over_relaxation=1.9):
+        """
+        Один шаг всех членов ансамбля
+        :param dt: шаг времени
+        :param gravity: значение гравитации (число или массив (B,))
+        :param iter_num: число прогонок решения
+        :param over_relaxation: коэф. успокоения (число или массив (B,))
+        :return:
+        """
+        self.integrate(dt, gravity)
+        self.p.fill(0)
+        self.project(iter_num, dt, over_relaxation)
+        self.extrapolate()
+        self.advect_vel(dt)
+        self.advect_smoke(dt)
+
+
+def case_metrics(tunnel):
+    """
+    Сводные показатели одного расчёта
+    :param tunnel: объект WindTunnel
+    :return: словарь: сила давления на препятствие (drag, lift), перепад давления
+             вход - выход, максимальная скорость и max |div|
+    """
+    fluid = tunnel.fluid
+    h = fluid.h
+    s = fluid.grid('s')
+    p = fluid.grid('p')
+    u = fluid.grid('u')
+    v = fluid.grid('v')
+
+    open_cell = s != 0.0
+    # твёрдые ячейки препятствия, без стенок трубы
+    solid = ~open_cell
+    solid[0, :] = False
+    solid[:, 0] = False
+    solid[:, -1] = False
+
+    drag = (p[:-1][open_cell[:-1] & solid[1:]].sum() - p[1:][solid[:-1] & open_cell[1:]].sum()) * h
+    lift = (p[:, :-1][open_cell[:, :-1] & solid[:, 1:]].sum() - p[:, 1:][solid[:, :-1] & open_cell[:, 1:]].sum()) * h
+
+    inner = open_cell[1:-1, 1:-1]
+    speed = np.hypot((u[1:-1, 1:-1] + u[2:, 1:-1]) * 0.5, (v[1:-1, 1:-1] + v[1:-1, 2:]) * 0.5)
+    inlet = p[1][open_cell[1]]
+    outlet = p[-2][open_cell[-2]]
+
+    return {
+        'drag': float(drag),
+        'lift': float(lift),
+        'pressure_drop': float(inlet.mean() - outlet.mean()) if inlet.size and outlet.size else 0.0,
+        'max_speed': float(speed[inner].max()) if inner.any() else 0.0,
+        'max_divergence': max_divergence(fluid),
+    }
+
+
+class EnsembleTunnel:
+    """
+    Набор WindTunnel с общими сеткой, шагом и гравитацией, но своими препятствием,
+    скоростью потока и over_relaxation. Поля всех труб лежат в одном EnsembleFluid,
+    tunnels[b].fluid - представление b-го члена, поэтому move_obstacle и
+    case_metrics работают с отдельной трубой как обычно
+    """
+
+    def __init__(self, cases, sim_width, sim_height=1.0, res=100, dt=1.0 / 20.0, iter_num=5, gravity=0.0):
+        """
+        :param cases: список словарей с ключами obstacle (x, y, ширина, высота), in_vel,
+                      over_relaxation; отсутствующие ключи берутся по умолчанию WindTunnel
+        :param sim_width: ширина области симуляции
+        :param sim_height: высота области симуляции
+        :param res: число ячеек по высоте
+        :param dt: шаг времени
+        :param iter_num: число прогонок решения
+        :param gravity: значение гравитации
+        """
+        self.cases = [dict(case) for case in cases]
+        self.sim_width = sim_width
+        self.sim_height = sim_height
+        self.res = res
+        self.dt = dt
+        self.iter_num = iter_num
+        self.gravity = gravity
+        self.frame_num = 0
+        self.tunnels = []
+        self.fluid = None
+        self.over_relaxation = None
+
+    def setup(self):
+        """
+        Подготовка всех труб: каждая собирается своим WindTunnel.setup(),
+        затем поля переносятся в общий EnsembleFluid
+        :return:
+        """
+        self.tunnels = []
+        for case in self.cases:
+            kwargs = {key: case[key] for key in ('in_vel', 'obstacle') if key in case}
+            tunnel = WindTunnel(self.sim_width, self.sim_height, self.res, dt=self.dt,
+                                iter_num=self.iter_num, gravity=self.gravity, **kwargs)
+            tunnel.over_relaxation = case.get('over_relaxation', tunnel.over_relaxation)
+            tunnel.setup()
+            self.tunnels.append(tunnel)
+
+        first = self.tunnels[0].fluid
+        self.fluid = EnsembleFluid(first.density, len(self.tunnels), first.num_x - 2, first.num_y - 2, first.h)
+        for b, tunnel in enumerate(self.tunnels):
+            member = self.fluid.member(b)
+            for name in FIELDS:
+                getattr(member, name)[:] = getattr(tunnel.fluid, name)
+            tunnel.fluid = member
+        self.over_relaxation = np.array([tunnel.over_relaxation for tunnel in self.tunnels])
+
+    def simulate(self):
+        """
+        Один шаг всех труб
+        :return:
+        """
+        self.fluid.simulate(self.dt, self.gravity, self.iter_num, self.over_relaxation)
+        self.frame_num += 1
+        for tunnel in self.tunnels:
+            tunnel.frame_num = self.frame_num
+
+    def metrics(self):
+        """
+        :return: список case_metrics по трубам
+        """
+        return [case_metrics(tunnel) for tunnel in self.tunnels]
@@ -1,28 +1,303 @@
+import time
+
 import numpy as np
 
+from .active import ActiveCells
+from .pressure import (PoissonSystem, max_divergence, red_black_weights, solve_pcg, solve_red_black,
+                       warm_start_pressure)
+from .profiling import NULL_PROFILER
+
 U_FIELD = 0
 V_FIELD = 1
 S_FIELD = 2
 
+SIM_STAGES = ('integrate', 'project', 'extrapolate', 'advect_vel', 'advect_smoke')
+
+FIELDS = ('u', 'v', 'p', 's', 'm', 'new_u', 'new_v', 'new_m')
+# поля с задним буфером new_<имя>: перенос пишет в задний буфер, затем буферы меняются местами
+BUFFERED = ('u', 'v', 'm')
+
+
+def _new_array(key, shape, dtype=np.float64):
+    return np.empty(shape, dtype=dtype)
+
+
+def sample_grid(grid, num_x, num_y, h, field, x, y, out=None, base=None, scratch=None):
+    """
+    Билинейная выборка поля на сетке с границами в массиве точек.
+    Ограничение координат и смещение h2 для U/V/S такие же, как в Fluid.sample_field.
+    Общая выборка для Fluid.sample_fields, ансамбля и линий тока по кадрам
+    :param grid: плоский массив поля с индексом i * num_y + j (у ансамбля - все члены подряд)
+    :param num_x: число ячеек по х с границами
+    :param num_y: число ячеек по у с границами
+    :param h: размер ячейки
+    :param field: тип поля (U, V, S) - задаёт смещение узлов поля
+    :param x: массив х координат
+    :param y: массив у координат (той же формы, что и x)
+    :param out: массив float64 для результата (None - новый массив)
+    :param base: смещения полей членов ансамбля в grid для каждой точки (None - одно поле)
+    :param scratch: функция (имя, форма, тип) -> рабочий массив, как Fluid.scratch (None - новые массивы)
+    :return: массив значений поля в точках
+    """
+    h1 = 1.0 / h
+    h2 = 0.5 * h
+
+    if field == U_FIELD:
+        dx = 0.0
+        dy = h2
+    elif field == V_FIELD:
+        dx = h2
+        dy = 0.0
+    elif field == S_FIELD:
+        dx = h2
+        dy = h2
+    else:
+        raise ValueError(f'Unknown field: {field!r}')
+    if scratch is None:
+        scratch = _new_array
+
+    shape = np.shape(x)
+    if out is None:
+        out = np.empty(shape)
+
+    # x0 = min(int((x - dx) / h), num_x - 1), tx = ((x - dx) - x0 * h) / h, то же по у
+    corners = []
+    for key, c, d, last in (('x', x, dx, num_x), ('y', y, dy, num_y)):
+        pos = scratch('sample_' + key, shape)
+        t = scratch('sample_t' + key, shape)
+        c0 = scratch('sample_' + key + '0', shape, np.intp)
+        c1 = scratch('sample_' + key + '1', shape, np.intp)
+        np.clip(c, h, last * h, out=pos)
+        pos -= d
+        np.multiply(pos, h1, out=t)
+        np.copyto(c0, t, casting='unsafe')
+        np.minimum(c0, last - 1, out=c0)
+        np.multiply(c0, h, out=t)
+        np.subtract(pos, t, out=t)
+        t *= h1
+        np.add(c0, 1, out=c1)
+        np.minimum(c1, last - 1, out=c1)
+        # pos больше не нужен: в нём 1 - t
+        np.subtract(1.0, t, out=pos)
+        corners.append((c0, c1, t, pos))
+    (x0, x1, tx, sx), (y0, y1, ty, sy) = corners
+
+    index = scratch('sample_index', shape, np.intp)
+    value = scratch('sample_value', shape, grid.dtype)
+    weight = scratch('sample_weight', shape)
+    out.fill(0.0)
+    for xc, yc, wx, wy in ((x0, y0, sx, sy), (x1, y0, tx, sy), (x1, y1, tx, ty), (x0, y1, sx, ty)):
+        np.multiply(xc, num_y, out=index)
+        index += yc
+        if base is not None:
+            index += base
+        np.take(grid, index, out=value)
+        np.multiply(wx, wy, out=weight)
+        weight *= value
+        out += weight
+
+    return out
+
 
 class Fluid:
+    # решатели давления, которые поддерживает реализация; первый - по умолчанию
+    SOLVERS = ('gauss_seidel', 'red_black', 'pcg')
+
     def __init__(self, density, num_x, num_y, h):
         self.density = density
         self.num_x = num_x + 2
         self.num_y = num_y + 2
         self.num_cells = self.num_x * self.num_y
-        self.p = np.zeros(self.num_cells, dtype=np.float32)
         self.h = h
-        self.u = np.zeros(self.num_cells, dtype=np.float32)
-        self.v = np.zeros(self.num_cells, dtype=np.float32)
-        self.new_u = np.zeros(self.num_cells, dtype=np.float32)
-        self.new_v = np.zeros(self.num_cells, dtype=np.float32)
-        self.s = np.zeros(self.num_cells, dtype=np.float32)
-        self.m = np.ones(self.num_cells, dtype=np.float32)
-        self.new_m = np.zeros(self.num_cells, dtype=np.float32)
+        self.grids = {}
+        for name in FIELDS:
+            self.bind(name, np.zeros((self.num_x, self.num_y), dtype=np.float32))
+        self.m.fill(1.0)
+        self.work = {}
 
         self.cnt = 0
 
+        self.solver = self.SOLVERS[0]
+        self.tolerance = None
+        self.warm_start = False
+        self.warm_start_probe = None
+        self.warm_steps = 0
+        self.cold_iters = None
+        self.iters_saved = None
+        self.substeps = 1
+        self.step_dt = None
+        self.frame_dt = None
+        self.solver_iters = 0
+        self.solver_residual = None
+        self.poisson = None
+        self.red_black = {}
+        self.active = None
+        self.smoke_tolerance = None
+        self.profiler = NULL_PROFILER
+
+    @property
+    def solver(self):
+        """
+        Решатель давления (см. project)
+        """
+        return self._solver
+
+    @solver.setter
+    def solver(self, name):
+        if name not in self.SOLVERS:
+            raise ValueError(f'{type(self).__name__} supports only {", ".join(self.SOLVERS)}, got solver {name!r}')
+        self._solver = name
+
+    def bind(self, name, grid):
+        """
+        Установка массива поля. Поле хранится 2D-массивом (num_x, num_y) с границами
+        в порядке C (grids[name]), атрибут name - его плоское представление с индексом i * num_y + j
+        :param name: имя поля (см. FIELDS)
+        :param grid: массив формы (num_x, num_y)
+        :return:
+        """
+        if grid.shape != (self.num_x, self.num_y) or not grid.flags.c_contiguous:
+            raise ValueError(f'Field {name!r} needs a C-contiguous ({self.num_x}, {self.num_y}) array')
+        self.grids[name] = grid
+        setattr(self, name, grid.reshape(-1))
+
+    def grid(self, name):
+        """
+        2D-представление поля
+        :param name: имя поля (см. FIELDS)
+        :return: массив формы (num_x, num_y), общий с плоским атрибутом поля
+        """
+        return self.grids[name]
+
+    def swap(self, name):
+        """
+        Обмен переднего и заднего буферов поля без копирования данных.
+        Плоские атрибуты тоже меняются, поэтому ссылки на fluid.u, взятые до шага, устаревают
+        :param name: имя поля (см. BUFFERED)
+        :return:
+        """
+        back = 'new_' + name
+        front = self.grids[name]
+        self.bind(name, self.grids[back])
+        self.bind(back, front)
+
+    def load_fields(self, fields):
+        """
+        Установка полей из готовых массивов без копирования (например, memmap контрольной точки).
+        После загрузки s нужно вызвать solid_changed
+        :param fields: словарь имя -> массив формы (num_x, num_y) float32
+        :return:
+        """
+        for name, grid in fields.items():
+            self.bind(name, grid)
+
+    def scratch(self, key, shape, dtype=np.float64):
+        """
+        Рабочий массив, который переиспользуется между шагами (растёт только при нехватке)
+        :param key: имя массива
+        :param shape: нужная форма
+        :param dtype: тип элементов
+        :return: массив формы shape с неопределённым содержимым
+        """
+        size = int(np.prod(shape))
+        buf = self.work.get(key)
+        if buf is None or buf.size < size or buf.dtype != dtype:
+            buf = self.work[key] = np.empty(size, dtype=dtype)
+        return buf[:size].reshape(shape)
+
+    def carry(self, name, rest, rows=None):
+        """
+        Перенос в задний буфер значений поля, которые этап не пересчитывает
+        (стенки, твёрдые ячейки), чтобы после swap они остались прежними
+        :param name: имя поля (см. BUFFERED)
+        :param rest: имя списка непересчитываемых ячеек (см. ActiveCells)
+        :param rows: полоса строк по х (lo, hi), None - вся сетка
+        :return:
+        """
+        k = self.active_cells().get(rest, rows)[0]
+        values = self.scratch(rest, k.shape, np.float32)
+        np.take(getattr(self, name), k, out=values)
+        getattr(self, 'new_' + name)[k] = values
+
+    def solid_changed(self, region=None):
+        """
+        Уведомление об изменении маски твёрдых ячеек s. Для прямоугольника списки
+        активных ячеек и веса red-black пересчитываются только рядом с ним;
+        система PCG глобальна (предобуславливатель) и собирается заново
+        :param region: изменившиеся ячейки (i0, i1, j0, j1), полуинтервалы; None - вся сетка
+        :return:
+        """
+        if region is None:
+            self.poisson = None
+            self.red_black = {}
+            self.active = None
+            return
+
+        i0, i1, j0, j1 = region
+        if i0 >= i1 or j0 >= j1:
+            return
+        self.poisson = None
+        if self.active is not None:
+            self.active.update(self.s, region)
+        s = self.grid('s')
+        for (a, b, over_relaxation), colours in self.red_black.items():
+            # вес ячейки зависит от неё и от соседей
+            lo = max(a, i0 - 1)
+            hi = min(b, i1 + 1)
+            if lo < hi:
+                for colour, weights in zip(colours, red_black_weights(s, lo, hi, over_relaxation)):
+                    colour[lo - a:hi - a] = weights
+
+    def active_cells(self):
+        """
+        Списки ячеек и граней жидкости, которые обрабатывают этапы (строятся по s при первом обращении)
+        :return: ActiveCells
+        """
+        if self.active is None:
+            self.active = ActiveCells(self.s, self.num_x, self.num_y)
+        return self.active
+
+    def smoke_cells(self, dt, rows=None):
+        """
+        Ячейки, в которых нужно переносить дым. При smoke_tolerance пропускаются ячейки,
+        где перенос заведомо ничего не меняет: точка отбора остаётся в соседних ячейках
+        (|скорость| * dt < h), а разброс m по ним не больше smoke_tolerance
+        :param dt: шаг времени
+        :param rows: полоса строк по х (lo, hi), None - вся сетка
+        :return: плоские номера ячеек
+        """
+        cells = self.active_cells().get('smoke', rows)[0]
+        if self.smoke_tolerance is None:
+            return cells
+
+        nx = self.num_x
+        ny = self.num_y
+        lo, hi = (0, nx) if rows is None else rows
+        a = max(lo, 1)
+        b = max(a, min(hi, nx - 1))
+        m = self.grid('m')
+        u = self.grid('u')
+        v = self.grid('v')
+        low = m[a:b, 1:-1].copy()
+        high = low.copy()
+        for di in (-1, 0, 1):
+            for dj in (0, 1, 2):
+                np.minimum(low, m[a + di:b + di, dj:ny - 2 + dj], out=low)
+                np.maximum(high, m[a + di:b + di, dj:ny - 2 + dj], out=high)
+        reach = self.h / dt
+        quiet = np.zeros((nx, ny), dtype=bool)
+        quiet[a:b, 1:-1] = ((high - low <= self.smoke_tolerance) &
+                            (np.abs(u[a:b, 1:-1] + u[a + 1:b + 1, 1:-1]) * 0.5 < reach) &
+                            (np.abs(v[a:b, 1:-1] + v[a:b, 2:]) * 0.5 < reach))
+        return cells[~quiet.reshape(-1)[cells]]
+
+    def close(self):
+        """
+        Освобождение ресурсов реализации (процессов, общей памяти)
+        :return:
+        """
+        pass
+
     def integrate(self, dt, gravity):
         """
         Суммирование скоростей
@@ -30,11 +305,8 @@ class Fluid:
         :param gravity: значение ускорения св. падения
         :return:
         """
-        n = self.num_y
-        for j in range(1, self.num_y):
-            for i in range(1, self.num_x - 1):
-                if self.s[i * n + j] != 0.0 and self.s[i * n + j - 1] != 0.0:
-                    self.v[i * n + j] += gravity * dt
+        for k in self.active_cells().get('v_faces')[0].tolist():
+            self.v[k] += gravity * dt
 
     def solve_incompressibility(self, num_iters, dt, over_relaxation):
         """
@@ -46,33 +318,84 @@ class Fluid:
         """
         n = self.num_y
         cp = self.density * self.h / dt
-
+        # только ячейки жидкости с хотя бы одним нетвёрдым соседом, в порядке j, i
+        cells = self.active_cells().get('cells')[0].tolist()
 
         for iter_num in range(num_iters):
-            for j in range(1, self.num_y - 1):
-                for i in range(1, self.num_x - 1):
-                    if self.s[i * n + j] == 0.0:
-                        continue
-
-                    s = self.s[i * n + j]
-                    sx0 = self.s[(i - 1) * n + j]
-                    sx1 = self.s[(i + 1) * n + j]
-                    sy0 = self.s[i * n + j - 1]
-                    sy1 = self.s[i * n + j + 1]
-                    s = sx0 + sx1 + sy0 + sy1
-                    if s == 0.0:
-                        continue
-
-                    div = self.u[(i + 1) * n + j] - self.u[i * n + j] + self.v[i * n + j + 1] - self.v[i * n + j]
-
-                    p = -div / s
-                    p *= over_relaxation
-                    self.p[i * n + j] += cp * p
-
-                    self.u[i * n + j] -= sx0 * p
-                    self.u[(i + 1) * n + j] += sx1 * p
-                    self.v[i * n + j] -= sy0 * p
-                    self.v[i * n + j + 1] += sy1 * p
+            for k in cells:
+                sx0 = self.s[k - n]
+                sx1 = self.s[k + n]
+                sy0 = self.s[k - 1]
+                sy1 = self.s[k + 1]
+                s = sx0 + sx1 + sy0 + sy1
+
+                div = self.u[k + n] - self.u[k] + self.v[k + 1] - self.v[k]
+
+                p = -div / s
+                p *= over_relaxation
+                self.p[k] += cp * p
+
+                self.u[k] -= sx0 * p
+                self.u[k + n] += sx1 * p
+                self.v[k] -= sy0 * p
+                self.v[k + 1] += sy1 * p
+
+    def project(self, num_iters, dt, over_relaxation):
+        """
+        Выполнение условия несжимаемости выбранным решателем (self.solver)
+        :param num_iters: максимальное число итераций
+        :param dt: шаг времени
+        :param over_relaxation: коэф. успокоения (для устойчивости решения)
+        :return:
+        """
+        if self.solver == 'red_black':
+            self.solver_iters, self.solver_residual = solve_red_black(
+                self, num_iters, dt, over_relaxation, self.tolerance
+            )
+        elif self.solver == 'pcg':
+            if self.poisson is None:
+                self.poisson = PoissonSystem(self.s, self.num_x, self.num_y)
+            self.solver_iters, self.solver_residual = solve_pcg(
+                self, self.poisson, num_iters, dt, self.tolerance
+            )
+        elif self.tolerance is not None:
+            self.solver_iters = num_iters
+            for iter_num in range(num_iters):
+                self.solve_incompressibility(1, dt, over_relaxation)
+                self.solver_residual = max_divergence(self)
+                if self.solver_residual <= self.tolerance:
+                    self.solver_iters = iter_num + 1
+                    break
+        else:
+            self.solve_incompressibility(num_iters, dt, over_relaxation)
+            self.solver_iters = num_iters
+            self.solver_residual = None
+
+    def warm_project(self, num_iters, dt, over_relaxation):
+        """
+        project с начальным приближением из давления предыдущего шага (см. warm_start_pressure).
+        Раз в warm_start_probe шагов (None - никогда) то же решение выполняется с нуля на копии полей,
+        разница числа итераций на этом шаге сохраняется в iters_saved. Проба удваивает время
+        project на своём шаге, поэтому включается только для замеров
+        :param num_iters: максимальное число итераций
+        :param dt: шаг времени
+        :param over_relaxation: коэф. успокоения (для устойчивости решения)
+        :return:
+        """
+        probe = self.warm_start_probe and self.warm_steps % self.warm_start_probe == 0
+        if probe:
+            saved = self.u.copy(), self.v.copy(), self.p.copy()
+            self.p.fill(0)
+            self.project(num_iters, dt, over_relaxation)
+            self.cold_iters = self.solver_iters
+            self.u[:], self.v[:], self.p[:] = saved
+        self.warm_steps += 1
+
+        warm_start_pressure(self, dt)
+        self.project(num_iters, dt, over_relaxation)
+        # между пробами iters_saved остаётся значением последней пробы
+        if probe:
+            self.iters_saved = self.cold_iters - self.solver_iters
 
     def extrapolate(self):
         """
@@ -134,6 +457,26 @@ class Fluid:
 
         return val
 
+    def sample_fields(self, x, y, field, out=None):
+        """
+        Расчёт поля сразу для массива точек (векторный аналог sample_field, см. sample_grid).
+        Промежуточные массивы берутся из scratch, поэтому вызов не выделяет памяти
+        :param x: одномерный массив х координат
+        :param y: массив у координат (той же формы, что и x)
+        :param field: тип поля (U, V, S)
+        :param out: массив float64 для результата (None - новый массив)
+        :return: массив значений поля в точках
+        """
+        if field == U_FIELD:
+            f = self.u
+        elif field == V_FIELD:
+            f = self.v
+        elif field == S_FIELD:
+            f = self.m
+        else:
+            raise ValueError(f'Unknown field: {field!r}')
+        return sample_grid(f, self.num_x, self.num_y, self.h, field, x, y, out=out, scratch=self.scratch)
+
     def avg_u(self, i, j):
         """
         Усреднение U-составляющей скорости
@@ -164,40 +507,39 @@ class Fluid:
         :param dt: шаг времени
         :return:
         """
-        self.new_u[:] = self.u
-        self.new_v[:] = self.v
+        self.carry('u', 'u_rest')
+        self.carry('v', 'v_rest')
 
         n = self.num_y
         h = self.h
         h2 = 0.5 * h
-
-        for j in range(1, self.num_y):
-            for i in range(1, self.num_x):
-                self.cnt += 1
-                # u component
-                if self.s[i * n + j] != 0.0 and self.s[(i - 1) * n + j] != 0.0 and j < self.num_y - 1:
-                    x = i * h
-                    y = j * h + h2
-                    u = self.u[i * n + j]
-                    v = self.avg_v(i, j)
-                    x -= dt * u
-                    y -= dt * v
-                    u = self.sample_field(x, y, U_FIELD)
-                    self.new_u[i * n + j] = u
-
-                # v component
-                if self.s[i * n + j] != 0.0 and self.s[i * n + j - 1] != 0.0 and i < self.num_x - 1:
-                    x = i * h + h2
-                    y = j * h
-                    u = self.avg_u(i, j)
-                    v = self.v[i * n + j]
-                    x -= dt * u
-                    y -= dt * v
-                    v = self.sample_field(x, y, V_FIELD)
-                    self.new_v[i * n + j] = v
-
-        self.u[:] = self.new_u
-        self.v[:] = self.new_v
+        active = self.active_cells()
+        self.cnt += (self.num_x - 1) * (self.num_y - 1)
+
+        # u component
+        for k in active.get('u_faces')[0].tolist():
+            i, j = divmod(k, n)
+            x = i * h
+            y = j * h + h2
+            u = self.u[k]
+            v = self.avg_v(i, j)
+            x -= dt * u
+            y -= dt * v
+            self.new_u[k] = self.sample_field(x, y, U_FIELD)
+
+        # v component
+        for k in active.get('v_faces')[0].tolist():
+            i, j = divmod(k, n)
+            x = i * h + h2
+            y = j * h
+            u = self.avg_u(i, j)
+            v = self.v[k]
+            x -= dt * u
+            y -= dt * v
+            self.new_v[k] = self.sample_field(x, y, V_FIELD)
+
+        self.swap('u')
+        self.swap('v')
 
     def advect_smoke(self, dt):
         """
@@ -205,38 +547,101 @@ class Fluid:
         :param dt: шаг времени
         :return:
         """
-        self.new_m[:] = self.m
+        if self.smoke_tolerance is None:
+            self.carry('m', 'smoke_rest')
+        else:
+            # пропущенные спокойные ячейки тоже должны остаться прежними
+            np.copyto(self.new_m, self.m)
 
         n = self.num_y
         h = self.h
         h2 = 0.5 * h
 
-        for j in range(1, self.num_y - 1):
-            for i in range(1, self.num_x - 1):
-                if self.s[i * n + j] != 0.0:
-                    u = (self.u[i * n + j] + self.u[(i + 1) * n + j]) * 0.5
-                    v = (self.v[i * n + j] + self.v[i * n + j + 1]) * 0.5
-                    x = i * h + h2 - dt * u
-                    y = j * h + h2 - dt * v
+        for k in self.smoke_cells(dt).tolist():
+            i, j = divmod(k, n)
+            u = (self.u[k] + self.u[k + n]) * 0.5
+            v = (self.v[k] + self.v[k + 1]) * 0.5
+            x = i * h + h2 - dt * u
+            y = j * h + h2 - dt * v
 
-                    self.new_m[i * n + j] = self.sample_field(x, y, S_FIELD)
+            self.new_m[k] = self.sample_field(x, y, S_FIELD)
 
-        self.m[:] = self.new_m
+        self.swap('m')
 
-    def simulate(self, dt, gravity, iter_num):
+    def max_velocity(self, gravity=0.0):
         """
-        Вычислить параметры симуляции
+        Оценка максимальной скорости для условия CFL
+        :param gravity: значение гравитации (добавляет запас sqrt(5 h |g|) на разгон за шаг)
+        :return: max |u|, |v| по всем граням с запасом на гравитацию
+        """
+        # max(|min|, |max|) вместо np.abs(...).max(): без временного массива
+        vel = max(-float(self.u.min()), float(self.u.max()), -float(self.v.min()), float(self.v.max()))
+        return vel + float(np.sqrt(5.0 * self.h * abs(gravity)))
+
+    def step(self, dt, gravity, iter_num):
+        """
+        Один шаг симуляции без фиксации счётчиков профилировщика
         :param dt: шаг времени
         :param gravity: значение гравитации
         :param iter_num: число прогонок решения
         :return:
         """
-        self.integrate(dt, gravity)
+        prof = self.profiler
+        t = prof.start()
 
-        self.p.fill(0)
+        self.integrate(dt, gravity)
+        t = prof.lap('integrate', t)
 
-        self.solve_incompressibility(iter_num, dt, 1.9)
+        if self.warm_start:
+            self.warm_project(iter_num, dt, 1.9)
+        else:
+            self.p.fill(0)
+            self.project(iter_num, dt, 1.9)
+        t = prof.lap('project', t)
 
         self.extrapolate()
+        t = prof.lap('extrapolate', t)
         self.advect_vel(dt)
+        t = prof.lap('advect_vel', t)
         self.advect_smoke(dt)
+        prof.lap('advect_smoke', t)
+
+    def simulate(self, dt, gravity, iter_num, cfl=None, budget=None, max_substeps=8):
+        """
+        Вычислить параметры симуляции
+        :param dt: шаг времени (при cfl - время кадра, которое делится на подшаги)
+        :param gravity: значение гравитации
+        :param iter_num: число прогонок решения
+        :param cfl: целевое число Куранта, подшаг не длиннее cfl * h / max_velocity (None - один шаг dt)
+        :param budget: время счёта кадра в секундах; подшаги, которые в него не укладываются,
+                       отбрасываются, и кадр продвигает симуляцию меньше чем на dt (None - без ограничения)
+        :param max_substeps: максимальное число подшагов; если их не хватает на dt при заданном cfl,
+                             кадр продвигает симуляцию меньше чем на dt (см. frame_dt)
+        :return:
+        """
+        start = time.perf_counter()
+        remaining = dt
+        done = 0
+        while True:
+            sub_dt = remaining
+            if cfl is not None:
+                # скорость пересчитывается перед каждым подшагом: поток мог разогнаться
+                vel = self.max_velocity(gravity)
+                if vel > 0.0:
+                    substeps = max(1, int(np.ceil(remaining * vel / (cfl * self.h))))
+                    # подшагов не хватает - подшаг остаётся устойчивым, а кадр продвигается меньше чем на dt
+                    sub_dt = remaining / substeps if done + substeps <= max_substeps else cfl * self.h / vel
+            self.step(sub_dt, gravity, iter_num)
+            remaining = remaining - sub_dt if sub_dt < remaining else 0.0
+            done += 1
+            if remaining == 0.0 or done >= max_substeps:
+                break
+            # следующий подшаг не начинается, если по средней длительности он выйдет за бюджет
+            if budget is not None and (time.perf_counter() - start) / done * (done + 1) > budget:
+                break
+        self.substeps = done
+        self.step_dt = sub_dt
+        self.frame_dt = dt - remaining
+
+        self.profiler.commit(cnt=self.cnt, solver_iters=self.solver_iters, solver_residual=self.solver_residual,
+                             iters_saved=self.iters_saved, substeps=done, dt=self.frame_dt)
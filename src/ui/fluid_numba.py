@@ -0,0 +1,181 @@
+import numpy as np
+
+from .fluid import Fluid, U_FIELD, V_FIELD
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+NUMBA_AVAILABLE = njit is not None
+
+
+def _jit(func):
+    # cache=True сохраняет скомпилированный код в __pycache__ (или NUMBA_CACHE_DIR),
+    # поэтому повторные запуски не компилируют ядра заново
+    if njit is None:
+        return func
+    return njit(cache=True)(func)
+
+
+@_jit
+def _integrate(v, faces, dt, gravity):
+    for k in faces:
+        v[k] += gravity * dt
+
+
+@_jit
+def _solve_incompressibility(u, v, p, s, cells, num_y, num_iters, cp, over_relaxation):
+    n = num_y
+    for iter_num in range(num_iters):
+        for k in cells:
+            sx0 = s[k - n]
+            sx1 = s[k + n]
+            sy0 = s[k - 1]
+            sy1 = s[k + 1]
+            s_sum = sx0 + sx1 + sy0 + sy1
+
+            div = u[k + n] - u[k] + v[k + 1] - v[k]
+
+            pc = -div / s_sum
+            pc *= over_relaxation
+            p[k] += cp * pc
+
+            u[k] -= sx0 * pc
+            u[k + n] += sx1 * pc
+            v[k] -= sy0 * pc
+            v[k + 1] += sy1 * pc
+
+
+@_jit
+def _extrapolate(u, v, num_x, num_y):
+    n = num_y
+    for i in range(num_x):
+        u[i * n + 0] = u[i * n + 1]
+        u[i * n + num_y - 1] = u[i * n + num_y - 2]
+    for j in range(num_y):
+        v[0 * n + j] = v[1 * n + j]
+
+
+@_jit
+def _sample_field(x, y, field, u, v, m, num_x, num_y, h):
+    n = num_y
+    h1 = 1.0 / h
+    h2 = 0.5 * h
+
+    x = max(min(x, num_x * h), h)
+    y = max(min(y, num_y * h), h)
+
+    dx = h2
+    dy = h2
+    f = m
+    if field == U_FIELD:
+        f = u
+        dx = 0.0
+    elif field == V_FIELD:
+        f = v
+        dy = 0.0
+
+    x0 = min(int((x - dx) * h1), num_x - 1)
+    tx = ((x - dx) - x0 * h) * h1
+    x1 = min(x0 + 1, num_x - 1)
+
+    y0 = min(int((y - dy) * h1), num_y - 1)
+    ty = ((y - dy) - y0 * h) * h1
+    y1 = min(y0 + 1, num_y - 1)
+
+    sx = 1.0 - tx
+    sy = 1.0 - ty
+
+    return (sx * sy * f[x0 * n + y0] +
+            tx * sy * f[x1 * n + y0] +
+            tx * ty * f[x1 * n + y1] +
+            sx * ty * f[x0 * n + y1])
+
+
+@_jit
+def _advect_vel(u, v, new_u, new_v, m, u_faces, v_faces, u_rest, v_rest, num_x, num_y, h, dt):
+    n = num_y
+    h2 = 0.5 * h
+    for k in u_rest:
+        new_u[k] = u[k]
+    for k in v_rest:
+        new_v[k] = v[k]
+
+    # u component
+    for k in u_faces:
+        i = k // n
+        j = k % n
+        x = i * h
+        y = j * h + h2
+        avg_v = (v[k - n] + v[k] + v[k - n + 1] + v[k + 1]) * 0.25
+        x -= dt * u[k]
+        y -= dt * avg_v
+        new_u[k] = _sample_field(x, y, 0, u, v, m, num_x, num_y, h)
+
+    # v component
+    for k in v_faces:
+        i = k // n
+        j = k % n
+        x = i * h + h2
+        y = j * h
+        avg_u = (u[k - 1] + u[k] + u[k + n - 1] + u[k + n]) * 0.25
+        x -= dt * avg_u
+        y -= dt * v[k]
+        new_v[k] = _sample_field(x, y, 1, u, v, m, num_x, num_y, h)
+
+
+@_jit
+def _advect_smoke(u, v, m, new_m, cells, rest, num_x, num_y, h, dt):
+    n = num_y
+    h2 = 0.5 * h
+    for k in rest:
+        new_m[k] = m[k]
+
+    for k in cells:
+        i = k // n
+        j = k % n
+        cu = (u[k] + u[k + n]) * 0.5
+        cv = (v[k] + v[k + 1]) * 0.5
+        x = i * h + h2 - dt * cu
+        y = j * h + h2 - dt * cv
+
+        new_m[k] = _sample_field(x, y, 2, u, v, m, num_x, num_y, h)
+
+
+class NumbaFluid(Fluid):
+    """
+    Реализация Fluid с теми же циклами, скомпилированными Numba.
+    Без Numba ядра остаются обычными функциями Python и работают как эталонные циклы
+    """
+
+    def integrate(self, dt, gravity):
+        _integrate(self.v, self.active_cells().get('v_faces')[0], dt, gravity)
+
+    def solve_incompressibility(self, num_iters, dt, over_relaxation):
+        cp = self.density * self.h / dt
+        _solve_incompressibility(self.u, self.v, self.p, self.s, self.active_cells().get('cells')[0],
+                                 self.num_y, num_iters, cp, over_relaxation)
+
+    def extrapolate(self):
+        _extrapolate(self.u, self.v, self.num_x, self.num_y)
+
+    def advect_vel(self, dt):
+        self.cnt += (self.num_x - 1) * (self.num_y - 1)
+        active = self.active_cells()
+        _advect_vel(self.u, self.v, self.new_u, self.new_v, self.m,
+                    active.get('u_faces')[0], active.get('v_faces')[0],
+                    active.get('u_rest')[0], active.get('v_rest')[0], self.num_x, self.num_y, self.h, dt)
+        self.swap('u')
+        self.swap('v')
+
+    def advect_smoke(self, dt):
+        if self.smoke_tolerance is None:
+            rest = self.active_cells().get('smoke_rest')[0]
+        else:
+            # пропущенные спокойные ячейки тоже должны остаться прежними
+            np.copyto(self.new_m, self.m)
+            rest = self.active_cells().get('smoke_rest')[0][:0]
+        _advect_smoke(self.u, self.v, self.m, self.new_m, self.smoke_cells(dt), rest,
+                      self.num_x, self.num_y, self.h, dt)
+        self.swap('m')
@@ -0,0 +1,172 @@
+import numpy as np
+
+from .fluid import Fluid, U_FIELD, V_FIELD, S_FIELD
+
+
+def row_range(rows, first, last):
+    """
+    Пересечение полосы строк [lo, hi) с диапазоном [first, last)
+    :param rows: полоса строк по х (lo, hi), None - вся сетка
+    :param first: первая строка, которую обновляет этап
+    :param last: строка после последней
+    :return: (a, b), полуинтервал строк для обновления (может быть пустым)
+    """
+    if rows is None:
+        return first, last
+    a = max(rows[0], first)
+    return a, max(a, min(rows[1], last))
+
+
+class NumpyFluid(Fluid):
+    """
+    Векторизованная реализация Fluid.
+    Каждый этап считается целиком над списками ячеек жидкости (см. ActiveCells)
+    и 2D-представлениями полей, а промежуточные массивы берутся из scratch,
+    поэтому шаг не выделяет память.
+    Параметр rows ограничивает этап полосой строк по х (см. ParallelFluid)
+    """
+
+    def gather(self, key, field, k, offset=0):
+        """
+        Выборка field[k + offset] в рабочий массив
+        :param key: имя рабочего массива (см. scratch)
+        :param field: плоский массив поля
+        :param k: плоские номера ячеек
+        :param offset: сдвиг номеров (например, -num_y - соседняя ячейка по х)
+        :return: массив float32 формы k.shape
+        """
+        index = self.scratch('gather_index', k.shape, np.intp)
+        np.add(k, offset, out=index)
+        return np.take(field, index, out=self.scratch(key, k.shape, np.float32))
+
+    def integrate(self, dt, gravity, rows=None):
+        """
+        Суммирование скоростей
+        :param dt: шаг времени
+        :param gravity: значение ускорения св. падения
+        :param rows: полоса строк по х (lo, hi), None - вся сетка
+        :return:
+        """
+        faces = self.active_cells().get('v_faces', rows)[0]
+        values = self.gather('value', self.v, faces)
+        values += gravity * dt
+        self.v[faces] = values
+
+    def extrapolate(self, rows=None):
+        """
+        Распространиение скоростей на соседние клетки
+        :param rows: полоса строк по х (lo, hi), None - вся сетка
+        :return:
+        """
+        u = self.grid('u')
+        v = self.grid('v')
+        a, b = row_range(rows, 0, self.num_x)
+        u[a:b, 0] = u[a:b, 1]
+        u[a:b, -1] = u[a:b, -2]
+        if a == 0:
+            v[0, :] = v[1, :]
+
+    def advect_vel(self, dt, rows=None):
+        """
+        Пересчёт предыдущей ячейки жидкости.
+        Результат пишется в new_u, new_v, после чего буферы меняются местами (см. swap)
+        :param dt: шаг времени
+        :param rows: полоса строк по х (lo, hi), None - вся сетка
+        :return:
+        """
+        h = self.h
+        h2 = 0.5 * h
+        n = self.num_y
+        u = self.u
+        v = self.v
+        active = self.active_cells()
+
+        self.carry('u', 'u_rest', rows)
+        self.carry('v', 'v_rest', rows)
+
+        if rows is None:
+            self.cnt += (self.num_x - 1) * (self.num_y - 1)
+
+        # u component: i in [1, num_x - 1], j in [1, num_y - 2]
+        k, i, j = active.get('u_faces', rows)
+        # avg_v = (v[k - n] + v[k] + v[k - n + 1] + v[k + 1]) * 0.25
+        avg = self.gather('avg', v, k, -n)
+        avg += self.gather('value', v, k)
+        avg += self.gather('value', v, k, 1 - n)
+        avg += self.gather('value', v, k, 1)
+        avg *= 0.25
+        x = np.multiply(i, h, out=self.scratch('x', k.shape))
+        vel = self.gather('value', u, k)
+        vel *= dt
+        x -= vel
+        y = np.multiply(j, h, out=self.scratch('y', k.shape))
+        y += h2
+        avg *= dt
+        y -= avg
+        self.new_u[k] = self.sample_fields(x, y, U_FIELD, out=self.scratch('sampled', k.shape))
+
+        # v component: i in [1, num_x - 2], j in [1, num_y - 1]
+        k, i, j = active.get('v_faces', rows)
+        # avg_u = (u[k - 1] + u[k] + u[k + n - 1] + u[k + n]) * 0.25
+        avg = self.gather('avg', u, k, -1)
+        avg += self.gather('value', u, k)
+        avg += self.gather('value', u, k, n - 1)
+        avg += self.gather('value', u, k, n)
+        avg *= 0.25
+        x = np.multiply(i, h, out=self.scratch('x', k.shape))
+        x += h2
+        avg *= dt
+        x -= avg
+        y = np.multiply(j, h, out=self.scratch('y', k.shape))
+        vel = self.gather('value', v, k)
+        vel *= dt
+        y -= vel
+        self.new_v[k] = self.sample_fields(x, y, V_FIELD, out=self.scratch('sampled', k.shape))
+
+        # запись шла только в задние буферы, поэтому полосам не нужен барьер перед ней;
+        # каждый процесс меняет местами свои ссылки на общие массивы
+        self.swap('u')
+        self.swap('v')
+
+    def advect_smoke(self, dt, rows=None):
+        """
+        Расчёт завихрений.
+        Результат пишется в new_m, после чего буферы меняются местами (см. swap)
+        :param dt: шаг времени
+        :param rows: полоса строк по х (lo, hi), None - вся сетка
+        :return:
+        """
+        n = self.num_y
+        h = self.h
+        h2 = 0.5 * h
+        u = self.u
+        v = self.v
+
+        if self.smoke_tolerance is None:
+            k, i, j = self.active_cells().get('smoke', rows)
+            self.carry('m', 'smoke_rest', rows)
+        else:
+            # пропущенные спокойные ячейки тоже должны остаться прежними
+            lo, hi = row_range(rows, 0, self.num_x)
+            np.copyto(self.grid('new_m')[lo:hi], self.grid('m')[lo:hi])
+            k = self.smoke_cells(dt, rows)
+            i, j = np.divmod(k, n)
+
+        # x = i * h + h2 - dt * (u[k] + u[k + n]) * 0.5, то же по у
+        vel = self.gather('avg', u, k)
+        vel += self.gather('value', u, k, n)
+        vel *= dt
+        vel *= 0.5
+        x = np.multiply(i, h, out=self.scratch('x', k.shape))
+        x += h2
+        x -= vel
+        vel = self.gather('avg', v, k)
+        vel += self.gather('value', v, k, 1)
+        vel *= dt
+        vel *= 0.5
+        y = np.multiply(j, h, out=self.scratch('y', k.shape))
+        y += h2
+        y -= vel
+        self.new_m[k] = self.sample_fields(x, y, S_FIELD, out=self.scratch('sampled', k.shape))
+
+        self.swap('m')
@@ -0,0 +1,391 @@
+import multiprocessing as mp
+import os
+import threading
+import time
+import weakref
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+from .fluid import BUFFERED, FIELDS, SIM_STAGES
+from .fluid_numpy import NumpyFluid
+from .pressure import solve_red_black, warm_start_pressure
+
+# ячейки управляющего массива в общей памяти
+(DT, GRAVITY, ITER_NUM, OVER_RELAXATION, TOLERANCE, SMOKE_TOLERANCE, WARM,
+ COMMAND, ITERS, RESIDUAL, COLD_ITERS, SOLID_VERSION) = range(12)
+# изменившиеся с прошлого шага ячейки маски s: i0, i1, j0, j1 (nan - вся сетка)
+SOLID_REGION = 12
+CONTROL_SIZE = 16
+# меньше ячеек на полосу не делится: барьеры шага (2 на итерацию решателя и 4 на этапы)
+# стоят около 0.5-1 мс, а шаг numpy на 5-6 тыс. ячеек - около 1.5 мс; ниже этого
+# (res ~60 и меньше) несколько процессов медленнее одного, и расчёт идёт в текущем процессе
+MIN_STRIP_CELLS = 6000
+STEP = 1.0
+EXIT = 0.0
+# режимы ячейки WARM: решение с нуля, с давления прошлого шага, то же с замером решения с нуля
+COLD = 0.0
+WARM_START = 1.0
+WARM_PROBE = 2.0
+
+
+def split_rows(num_x, workers, min_rows=2):
+    """
+    Разбиение строк сетки по х на непрерывные полосы
+    :param num_x: число строк (с границами)
+    :param workers: желаемое число полос
+    :param min_rows: наименьшее число строк в полосе (не меньше 2)
+    :return: список полос (lo, hi), не меньше min_rows строк в каждой
+    """
+    workers = max(1, min(workers, num_x // max(2, min_rows)))
+    bounds = np.linspace(0, num_x, workers + 1).round().astype(int).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _attach(buf, shape, workers):
+    """
+    Представления управляющих массивов и полей поверх блока общей памяти
+    :param shape: форма полей (num_x, num_y)
+    :return: (control, residuals, stage_ms, словарь 2D-массивов полей)
+    """
+    control = np.ndarray((CONTROL_SIZE,), dtype=np.float64, buffer=buf)
+    offset = control.nbytes
+    residuals = np.ndarray((workers,), dtype=np.float64, buffer=buf, offset=offset)
+    offset += residuals.nbytes
+    stage_ms = np.ndarray((len(SIM_STAGES),), dtype=np.float64, buffer=buf, offset=offset)
+    offset += stage_ms.nbytes
+    offset += -offset % 64
+
+    fields = {}
+    for name in FIELDS:
+        fields[name] = np.ndarray(shape, dtype=np.float32, buffer=buf, offset=offset)
+        offset += fields[name].nbytes
+    return control, residuals, stage_ms, fields
+
+
+def _shared_size(num_cells, workers):
+    size = (CONTROL_SIZE + workers + len(SIM_STAGES)) * 8
+    size += -size % 64
+    return size + len(FIELDS) * num_cells * 4
+
+
+class StripComm:
+    """
+    Синхронизация полос внутри шага: общий барьер и максимум по полосам
+    """
+
+    def __init__(self, index, phase, residuals):
+        """
+        :param index: номер полосы
+        :param phase: барьер на все рабочие процессы
+        :param residuals: общий массив для значений полос
+        """
+        self.index = index
+        self.phase = phase
+        self.residuals = residuals
+
+    def barrier(self):
+        self.phase.wait()
+
+    def max(self, value):
+        """
+        :param value: значение этой полосы
+        :return: максимум по всем полосам
+        """
+        self.residuals[self.index] = value
+        self.phase.wait()
+        result = float(self.residuals.max())
+        # никто не перезапишет residuals, пока остальные не прочитали максимум
+        self.phase.wait()
+        return result
+
+
+def strip_step(fluid, rows, comm, control, stage_ms=None):
+    """
+    Шаг Fluid.simulate для одной полосы строк. Поля общие, поэтому обмен
+    граничными строками соседей сводится к барьерам между этапами
+    :param fluid: NumpyFluid над общей памятью
+    :param rows: полоса строк по х (lo, hi)
+    :param comm: StripComm
+    :param control: управляющий массив (dt, gravity, ...)
+    :param stage_ms: массив для времён этапов (None - не замерять)
+    :return: (число итераций решателя, итоговая max |div|, число итераций решения с нуля или None)
+    """
+    # скаляры float64 из numpy повышали бы точность выражений с float32 полями
+    dt, gravity, iter_num, over_relaxation, tolerance, smoke_tolerance, warm = control[:COMMAND].tolist()
+    tolerance = None if np.isnan(tolerance) else tolerance
+    fluid.smoke_tolerance = None if np.isnan(smoke_tolerance) else smoke_tolerance
+    iter_num = int(iter_num)
+    lo, hi = rows
+    times = [time.perf_counter()]
+
+    # integrate и решатель до первого барьера трогают только строки своей полосы
+    fluid.integrate(dt, gravity, rows)
+    times.append(time.perf_counter())
+
+    cold_iters = None
+    if warm == WARM_PROBE:
+        # как в Fluid.warm_project: решение с нуля на копии своих строк, затем откат
+        saved = [fluid.grid(name)[lo:hi].copy() for name in ('u', 'v', 'p')]
+        fluid.grid('p')[lo:hi] = 0
+        comm.barrier()
+        cold_iters, _ = solve_red_black(fluid, iter_num, dt, over_relaxation, tolerance, rows, comm)
+        comm.barrier()
+        for name, grid in zip(('u', 'v', 'p'), saved):
+            fluid.grid(name)[lo:hi] = grid
+        comm.barrier()
+    if warm == COLD:
+        fluid.grid('p')[lo:hi] = 0
+    else:
+        warm_start_pressure(fluid, dt, rows, comm)
+    iters, residual = solve_red_black(fluid, iter_num, dt, over_relaxation, tolerance, rows, comm)
+    times.append(time.perf_counter())
+
+    fluid.extrapolate(rows)
+    comm.barrier()
+    times.append(time.perf_counter())
+
+    fluid.advect_vel(dt, rows)
+    comm.barrier()
+    times.append(time.perf_counter())
+
+    fluid.advect_smoke(dt, rows)
+    times.append(time.perf_counter())
+
+    if stage_ms is not None:
+        stage_ms[:] = np.diff(times) * 1000.0
+    return iters, residual, cold_iters
+
+
+def _worker_main(name, index, rows, workers, density, num_x, num_y, h, start, done, phase):
+    # процессы spawn пользуются resource_tracker родителя, повторная регистрация блока безвредна
+    shm = shared_memory.SharedMemory(name=name)
+
+    fluid = NumpyFluid(density, num_x, num_y, h)
+    control, residuals, stage_ms, fields = _attach(shm.buf, (fluid.num_x, fluid.num_y), workers)
+    for field, array in fields.items():
+        fluid.bind(field, array)
+    comm = StripComm(index, phase, residuals)
+
+    try:
+        _worker_loop(fluid, index, rows, control, stage_ms, comm, start, done, phase)
+    except threading.BrokenBarrierError:
+        # барьеры прервал другой процесс или _watch_workers, причину сообщает ParallelFluid.step
+        pass
+
+
+def _worker_loop(fluid, index, rows, control, stage_ms, comm, start, done, phase):
+    solid_version = 0.0
+    while True:
+        start.wait()
+        if control[COMMAND] == EXIT:
+            break
+        if control[SOLID_VERSION] != solid_version:
+            # маска s изменилась в главном процессе: списки ячеек обновляются
+            solid_version = control[SOLID_VERSION]
+            region = control[SOLID_REGION:SOLID_REGION + 4]
+            fluid.solid_changed(None if np.isnan(region[0]) else tuple(int(c) for c in region))
+        try:
+            iters, residual, cold_iters = strip_step(fluid, rows, comm, control, stage_ms if index == 0 else None)
+        except BaseException:
+            # остальные процессы и ParallelFluid не должны ждать на барьерах вечно
+            for barrier in (start, done, phase):
+                barrier.abort()
+            raise
+        if index == 0:
+            control[ITERS] = iters
+            control[RESIDUAL] = np.nan if residual is None else residual
+            if cold_iters is not None:
+                control[COLD_ITERS] = cold_iters
+        done.wait()
+
+
+def _watch_workers(processes, barriers):
+    """
+    Прерывание барьеров, когда завершился любой рабочий процесс (в том числе убитый
+    сигналом или упавший при запуске), чтобы главный процесс не ждал на них вечно
+    :param processes: запущенные рабочие процессы
+    :param barriers: барьеры главного и рабочих процессов
+    :return:
+    """
+    connection.wait([process.sentinel for process in processes])
+    for barrier in barriers:
+        barrier.abort()
+
+
+def _shutdown(shm, processes, start):
+    if processes:
+        np.ndarray((CONTROL_SIZE,), dtype=np.float64, buffer=shm.buf)[COMMAND] = EXIT
+        try:
+            start.wait(timeout=5.0)
+        except threading.BrokenBarrierError:
+            pass
+        for process in processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+    shm.unlink()
+
+
+class ParallelFluid(NumpyFluid):
+    """
+    Реализация NumpyFluid для нескольких ядер: поля лежат в общей памяти,
+    сетка делится на полосы строк по х, каждую полосу считает свой процесс.
+    Давление решается red-black SOR: ячейки одного цвета на границе полос
+    не имеют общих граней, поэтому полосы синхронизируются только барьерами.
+    Если на полосу приходится меньше min_strip_cells ячеек, полос меньше, а при
+    одной полосе процессы и общая память не создаются и шаг считает NumpyFluid
+    """
+
+    SOLVERS = ('red_black',)
+
+    def __init__(self, density, num_x, num_y, h, workers=None, min_strip_cells=MIN_STRIP_CELLS):
+        """
+        :param density: плотность
+        :param num_x: число ячеек по х
+        :param num_y: число ячеек по у
+        :param h: размер ячейки
+        :param workers: число рабочих процессов (None - по числу ядер)
+        :param min_strip_cells: наименьшее число ячеек в полосе (0 - делить при любом размере)
+        """
+        super().__init__(density, num_x, num_y, h)
+        min_rows = -(-min_strip_cells // self.num_y)
+        self.strips = split_rows(self.num_x, workers or os.cpu_count() or 1, min_rows)
+        self.workers = len(self.strips)
+        self.control = None
+        self.shm = None
+        if self.workers == 1:
+            return
+
+        self.shm = shared_memory.SharedMemory(create=True, size=_shared_size(self.num_cells, self.workers))
+        self.control, _, self.stage_ms, fields = _attach(self.shm.buf, (self.num_x, self.num_y), self.workers)
+        for name, array in fields.items():
+            array[:] = self.grid(name)
+            self.bind(name, array)
+
+        ctx = mp.get_context('spawn')
+        self.start_barrier = ctx.Barrier(self.workers + 1)
+        self.done_barrier = ctx.Barrier(self.workers + 1)
+        self.phase_barrier = ctx.Barrier(self.workers)
+        self.processes = []
+        self.solid_pending = False
+        self._finalizer = weakref.finalize(self, _shutdown, self.shm, self.processes, self.start_barrier)
+
+    def _start_workers(self):
+        # процессы запускаются при первом шаге, чтобы создание объекта оставалось дешёвым
+        ctx = mp.get_context('spawn')
+        for index, rows in enumerate(self.strips):
+            process = ctx.Process(
+                target=_worker_main,
+                args=(self.shm.name, index, rows, self.workers, self.density,
+                      self.num_x - 2, self.num_y - 2, self.h,
+                      self.start_barrier, self.done_barrier, self.phase_barrier),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+        barriers = (self.start_barrier, self.done_barrier, self.phase_barrier)
+        threading.Thread(target=_watch_workers, args=(list(self.processes), barriers), daemon=True).start()
+
+    def solid_changed(self, region=None):
+        """
+        Обновление кэшей, зависящих от маски s, здесь и в рабочих процессах (см. Fluid.solid_changed)
+        :param region: изменившиеся ячейки (i0, i1, j0, j1), полуинтервалы; None - вся сетка
+        :return:
+        """
+        super().solid_changed(region)
+        control = self.control
+        if control is None:
+            return
+        # до следующего шага изменения объединяются: рабочие процессы видят только последнюю версию
+        old = control[SOLID_REGION:SOLID_REGION + 4]
+        if region is None or (self.solid_pending and np.isnan(old[0])):
+            old[:] = np.nan
+        elif self.solid_pending:
+            old[:] = (min(old[0], region[0]), max(old[1], region[1]), min(old[2], region[2]), max(old[3], region[3]))
+        else:
+            old[:] = region
+        self.solid_pending = True
+        control[SOLID_VERSION] += 1
+
+    def load_fields(self, fields):
+        """
+        Загрузка полей: рабочие процессы видят только общую память, поэтому массивы копируются в неё
+        :param fields: словарь имя -> массив формы (num_x, num_y) float32
+        :return:
+        """
+        if self.shm is None:
+            super().load_fields(fields)
+            return
+        for name, grid in fields.items():
+            if grid.shape != (self.num_x, self.num_y):
+                raise ValueError(f'Field {name!r} needs a ({self.num_x}, {self.num_y}) array')
+            self.grid(name)[:] = grid
+
+    def step(self, dt, gravity, iter_num):
+        """
+        Один шаг симуляции в рабочих процессах
+        :param dt: шаг времени
+        :param gravity: значение гравитации
+        :param iter_num: число прогонок решения
+        :return:
+        """
+        if self.shm is None:
+            super().step(dt, gravity, iter_num)
+            return
+        if not self.processes:
+            self._start_workers()
+
+        warm = COLD
+        if self.warm_start:
+            warm = WARM_START
+            if self.warm_start_probe and self.warm_steps % self.warm_start_probe == 0:
+                warm = WARM_PROBE
+            self.warm_steps += 1
+
+        control = self.control
+        control[DT] = dt
+        control[GRAVITY] = gravity
+        control[ITER_NUM] = iter_num
+        control[OVER_RELAXATION] = 1.9
+        control[TOLERANCE] = np.nan if self.tolerance is None else self.tolerance
+        control[SMOKE_TOLERANCE] = np.nan if self.smoke_tolerance is None else self.smoke_tolerance
+        control[WARM] = warm
+        control[COMMAND] = STEP
+        self.solid_pending = False
+        try:
+            self.start_barrier.wait()
+            self.done_barrier.wait()
+        except threading.BrokenBarrierError:
+            raise RuntimeError('ParallelFluid worker process failed') from None
+
+        # рабочие процессы поменяли местами буферы переноса, ссылки здесь меняются так же
+        for name in BUFFERED:
+            self.swap(name)
+        self.cnt += (self.num_x - 1) * (self.num_y - 1)
+        self.solver_iters = int(control[ITERS])
+        self.solver_residual = None if np.isnan(control[RESIDUAL]) else float(control[RESIDUAL])
+        if warm == WARM_PROBE:
+            self.cold_iters = int(control[COLD_ITERS])
+            self.iters_saved = self.cold_iters - self.solver_iters
+
+        prof = self.profiler
+        if prof.enabled:
+            for stage, ms in zip(SIM_STAGES, self.stage_ms.tolist()):
+                prof.add(stage, ms)
+
+    def close(self):
+        """
+        Остановка рабочих процессов и освобождение общей памяти.
+        Поля копируются в обычные массивы, дальше шаги считаются в одном процессе
+        :return:
+        """
+        if self.shm is None:
+            return
+        for name in FIELDS:
+            self.bind(name, self.grid(name).copy())
+        self.control = None
+        self.stage_ms = None
+        self._finalizer()
+        self.shm.close()
+        self.shm = None
@@ -0,0 +1,100 @@
+import threading
+
+import numpy as np
+
+FRAME_FIELDS = ('u', 'v', 'p', 'm', 's')
+
+
+class Frame:
+    """
+    Снимок полей жидкости, готовый к отрисовке
+    """
+
+    def __init__(self, num_x, num_y, h):
+        """
+        :param num_x: число ячеек по х (с границами)
+        :param num_y: число ячеек по у (с границами)
+        :param h: размер ячейки
+        """
+        self.num_x = num_x
+        self.num_y = num_y
+        self.h = h
+        for name in FRAME_FIELDS:
+            setattr(self, name, np.zeros(num_x * num_y, dtype=np.float32))
+        self.frame_num = 0
+        self.obstacle = (0.0, 0.0, 0.0, 0.0)
+
+    def matches(self, fluid):
+        """
+        Совпадает ли размер сетки снимка с сеткой жидкости
+        :param fluid: объект Fluid
+        :return:
+        """
+        return self.num_x == fluid.num_x and self.num_y == fluid.num_y and self.h == fluid.h
+
+    def capture(self, tunnel):
+        """
+        Копирование текущего состояния модели в снимок
+        :param tunnel: объект WindTunnel
+        :return:
+        """
+        fluid = tunnel.fluid
+        for name in FRAME_FIELDS:
+            np.copyto(getattr(self, name), getattr(fluid, name))
+        self.frame_num = tunnel.frame_num
+        self.obstacle = (
+            tunnel.obstacle_x,
+            tunnel.obstacle_y,
+            tunnel.obstacle_width,
+            tunnel.obstacle_height
+        )
+
+
+class FrameBuffer:
+    """
+    Тройная буферизация кадров между потоком симуляции и потоком отрисовки.
+    Писатель всегда пишет в слот, который не является ни последним
+    опубликованным, ни читаемым, поэтому ни одна из сторон не ждёт другую
+    """
+
+    def __init__(self, slots=3):
+        """
+        :param slots: число слотов (не меньше 3)
+        """
+        if slots < 3:
+            raise ValueError('FrameBuffer needs at least 3 slots')
+        self.slots = [None] * slots
+        self.lock = threading.Lock()
+        self.latest = None
+        self.reading = None
+        self.published = 0
+
+    def publish(self, tunnel):
+        """
+        Запись нового кадра (вызывается только из потока симуляции)
+        :param tunnel: объект WindTunnel
+        :return:
+        """
+        with self.lock:
+            index = next(k for k in range(len(self.slots)) if k != self.latest and k != self.reading)
+
+        frame = self.slots[index]
+        if frame is None or not frame.matches(tunnel.fluid):
+            frame = Frame(tunnel.fluid.num_x, tunnel.fluid.num_y, tunnel.fluid.h)
+            self.slots[index] = frame
+        frame.capture(tunnel)
+
+        with self.lock:
+            self.latest = index
+            self.published += 1
+
+    def read(self):
+        """
+        Последний опубликованный кадр; он не перезаписывается до следующего вызова read
+        :return: Frame или None, если кадров ещё не было
+        """
+        with self.lock:
+            if self.latest is None:
+                return None
+            self.reading = self.latest
+            return self.slots[self.reading]
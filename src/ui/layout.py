@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+WALLS = ('left', 'right', 'bottom', 'top')
+LAYOUT_FIELDS = ('u', 'v', 'm')
+# собранные сетки для последних описаний и размеров (смена разрешения туда и обратно, ансамбли)
+CACHE_SIZE = 8
+_built = {}
+
+
+def obstacle_mask(num_x, num_y, h, sim_height, x, y, width, height):
+    """
+    Ячейки прямоугольного препятствия
+    :param num_x: число ячеек по х с границами
+    :param num_y: число ячеек по у с границами
+    :param h: размер ячейки
+    :param sim_height: высота области симуляции
+    :param x: левая граница
+    :param y: верхняя граница (в экранных координатах Scene)
+    :param width: ширина
+    :param height: высота
+    :return: bool массив (num_x, num_y)
+    """
+    # y - верхняя граница, нижняя отсчитывается как в экранных координатах Scene
+    y_min = y + height - sim_height
+    x_max = x + width
+
+    # препятствие ставится в ячейки i in [1, num_x - 3], j in [1, num_y - 3]
+    cur_x = (np.arange(1, num_x - 2) + 0.5) * h
+    cur_y = (np.arange(1, num_y - 2) + 0.5) * h
+    inside = np.zeros((num_x, num_y), dtype=bool)
+    inside[1:-2, 1:-2] = (((x <= cur_x) & (cur_x <= x_max))[:, None] &
+                          ((y_min <= cur_y) & (cur_y <= y))[None, :])
+    return inside
+
+
+class SceneLayout:
+    """
+    Декларативное описание начального состояния трубы: стенки, входящий поток,
+    полоса дыма на входе и неподвижные препятствия.
+    По описанию строятся маски s и значения u, v, m (build); результат кэшируется
+    в памяти и, если задан каталог, в .npz файлах, которые загружаются готовыми
+    """
+
+    def __init__(self, walls=('left', 'bottom', 'top'), in_vel=2.5, smoke_band=0.9, obstacles=()):
+        """
+        :param walls: твёрдые стороны сетки из WALLS
+        :param in_vel: скорость потока на входе (первая грань по х)
+        :param smoke_band: доля высоты входа, из которой идёт дым
+        :param obstacles: неподвижные препятствия (x, y, ширина, высота), как у WindTunnel
+        """
+        unknown = set(walls) - set(WALLS)
+        if unknown:
+            raise ValueError(f'Unknown walls: {sorted(unknown)}, expected some of {WALLS}')
+        self.walls = tuple(walls)
+        self.in_vel = in_vel
+        self.smoke_band = smoke_band
+        self.obstacles = tuple(tuple(obstacle) for obstacle in obstacles)
+
+    def to_dict(self):
+        return {
+            'walls': list(self.walls),
+            'in_vel': self.in_vel,
+            'smoke_band': self.smoke_band,
+            'obstacles': [list(obstacle) for obstacle in self.obstacles],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Чтение описания из JSON
+        :param path: путь к файлу
+        :return: SceneLayout
+        """
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path):
+        """
+        Запись описания в JSON
+        :param path: путь к файлу
+        :return:
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def build(self, num_x, num_y, h, sim_height, cache_dir=None):
+        """
+        Сетки сцены для заданного размера (из кэша, если уже строились)
+        :param num_x: число ячеек по х с границами
+        :param num_y: число ячеек по у с границами
+        :param h: размер ячейки
+        :param sim_height: высота области симуляции
+        :param cache_dir: каталог готовых сеток (None - только кэш в памяти)
+        :return: словарь: 's' - маска (num_x, num_y) float32, 'static' - bool маска препятствий,
+                 для u, v, m - (плоские номера, значения); массивы только для чтения
+        """
+        key = json.dumps([self.to_dict(), num_x, num_y, h, sim_height], sort_keys=True)
+        grids = _built.get(key)
+        if grids is not None:
+            return grids
+
+        path = None
+        if cache_dir is not None:
+            digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+            path = os.path.join(cache_dir, f'layout_{digest}.npz')
+        if path is not None and os.path.exists(path):
+            with np.load(path) as data:
+                grids = {'s': data['s'], 'static': data['static']}
+                for name in LAYOUT_FIELDS:
+                    grids[name] = (data[name + '_index'], data[name + '_value'])
+        else:
+            grids = self._build(num_x, num_y, h, sim_height)
+            if path is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+                arrays = {'s': grids['s'], 'static': grids['static']}
+                for name in LAYOUT_FIELDS:
+                    arrays[name + '_index'], arrays[name + '_value'] = grids[name]
+                # np.savez дописывает .npz к имени без этого расширения
+                tmp = path + '.tmp.npz'
+                np.savez(tmp, **arrays)
+                os.replace(tmp, path)
+
+        for value in grids.values():
+            for array in value if isinstance(value, tuple) else (value,):
+                array.flags.writeable = False
+        if len(_built) >= CACHE_SIZE:
+            _built.pop(next(iter(_built)))
+        _built[key] = grids
+        return grids
+
+    def _build(self, num_x, num_y, h, sim_height):
+        s = np.ones((num_x, num_y), dtype=np.float32)
+        if 'left' in self.walls:
+            s[0, :] = 0.0
+        if 'right' in self.walls:
+            s[-1, :] = 0.0
+        if 'bottom' in self.walls:
+            s[:, 0] = 0.0
+        if 'top' in self.walls:
+            s[:, -1] = 0.0
+
+        u = np.zeros((num_x, num_y), dtype=bool)
+        u[1, :] = True
+        u_value = np.zeros((num_x, num_y), dtype=np.float32)
+        u_value[1, :] = self.in_vel
+
+        pipe_h = self.smoke_band * num_y
+        min_j = int(0.5 * num_y - 0.5 * pipe_h)
+        max_j = int(0.5 * num_y + 0.5 * pipe_h)
+        m = np.zeros((num_x, num_y), dtype=bool)
+        m[0, min_j:max_j] = True
+        m_value = np.zeros((num_x, num_y), dtype=np.float32)
+
+        static = np.zeros((num_x, num_y), dtype=bool)
+        for obstacle in self.obstacles:
+            static |= obstacle_mask(num_x, num_y, h, sim_height, *obstacle)
+        s[static] = 0.0
+        m[static] = True
+        m_value[static] = 1.0
+        # неподвижное препятствие: нулевая скорость на всех его гранях
+        face_u = static.copy()
+        face_u[1:] |= static[:-1]
+        u |= face_u
+        u_value[face_u] = 0.0
+        v = static.copy()
+        v[:, 1:] |= static[:, :-1]
+
+        grids = {'s': s, 'static': static}
+        for name, mask, values in (('u', u, u_value), ('v', v, None), ('m', m, m_value)):
+            index = np.flatnonzero(mask)
+            grids[name] = (index, np.zeros(len(index), np.float32) if values is None else values.reshape(-1)[index])
+        return grids
+
+    def apply(self, fluid, sim_height, cache_dir=None):
+        """
+        Запись сцены в поля жидкости: s целиком, u, v, m - только в ячейках,
+        которые задаёт описание (остальное, например перенесённое при resize, не меняется)
+        :param fluid: объект Fluid
+        :param sim_height: высота области симуляции
+        :param cache_dir: каталог готовых сеток (см. build)
+        :return: bool маска (num_x, num_y) неподвижных препятствий
+        """
+        grids = self.build(fluid.num_x, fluid.num_y, fluid.h, sim_height, cache_dir)
+        np.copyto(fluid.grid('s'), grids['s'])
+        for name in LAYOUT_FIELDS:
+            index, values = grids[name]
+            getattr(fluid, name)[index] = values
+        return grids['static']
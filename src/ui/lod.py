@@ -0,0 +1,63 @@
+import math
+
+
+class ResolutionGovernor:
+    """
+    Автоматический выбор разрешения сетки по времени шага.
+    Среднее время шага считается по окнам из window шагов: если оно больше бюджета
+    кадра, сетка уменьшается в factor раз (не ниже min_res), если меньше
+    headroom * budget - возвращается к заданному разрешению target
+    """
+
+    def __init__(self, target, budget, min_res=20, window=30, factor=0.8, headroom=0.4):
+        """
+        :param target: заданное разрешение (число ячеек по высоте), выше него сетка не растёт
+        :param budget: бюджет времени шага в секундах
+        :param min_res: минимальное разрешение
+        :param window: число шагов, по которым усредняется время
+        :param factor: множитель разрешения при уменьшении (при увеличении - 1 / factor)
+        :param headroom: доля бюджета, ниже которой разрешение увеличивается
+        """
+        self.target = target
+        self.budget = budget
+        self.min_res = min_res
+        self.window = window
+        self.factor = factor
+        self.headroom = headroom
+        self.total = 0.0
+        self.count = 0
+
+    def choose(self, res, mean):
+        """
+        Новое разрешение по среднему времени шага
+        :param res: текущее разрешение
+        :param mean: среднее время шага в секундах
+        :return: новое разрешение или None, если менять не нужно
+        """
+        if mean > self.budget and res > self.min_res:
+            return max(self.min_res, int(res * self.factor))
+        if mean < self.budget * self.headroom and res < self.target:
+            return min(self.target, math.ceil(res / self.factor))
+        return None
+
+    def update(self, tunnel, elapsed):
+        """
+        Учёт времени очередного шага; по окончании окна при необходимости меняет разрешение трубы
+        :param tunnel: объект WindTunnel
+        :param elapsed: время шага в секундах
+        :return: новое разрешение или None
+        """
+        if tunnel.paused:
+            return None
+        self.total += elapsed
+        self.count += 1
+        if self.count < self.window:
+            return None
+
+        mean = self.total / self.count
+        self.total = 0.0
+        self.count = 0
+        res = self.choose(tunnel.res, mean)
+        if res is not None:
+            tunnel.resize(res)
+        return res
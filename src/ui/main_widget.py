@@ -4,13 +4,13 @@ from .tool_widget import ToolWidget
 
 
 class MainWidget(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, started=None):
         super().__init__(parent)
         layout = QVBoxLayout()
         self.tool_widget = ToolWidget(self)
         layout.addWidget(self.tool_widget)
 
-        self.scene = Scene(self)
+        self.scene = Scene(self, started=started)
 
         layout.addWidget(self.scene)
 
@@ -34,6 +34,34 @@ class MainWidget(QWidget):
             self.scene.height_change
         )
 
+        self.tool_widget.stats_checkbox.toggled.connect(
+            self.scene.set_show_stats
+        )
+
+        self.tool_widget.res_spinbox.valueChanged.connect(
+            self.scene.set_resolution
+        )
+
+        self.tool_widget.auto_res_checkbox.toggled.connect(
+            self.scene.set_auto_resolution
+        )
+
+        self.tool_widget.smoke_checkbox.toggled.connect(
+            self.scene.set_show_smoke
+        )
+
+        self.tool_widget.pressure_checkbox.toggled.connect(
+            self.scene.set_show_pressure
+        )
+
+        self.tool_widget.velocities_checkbox.toggled.connect(
+            self.scene.set_show_velocities
+        )
+
+        self.tool_widget.streamlines_checkbox.toggled.connect(
+            self.scene.set_show_streamlines
+        )
+
 
 
 
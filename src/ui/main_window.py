@@ -4,13 +4,17 @@ from .main_widget import MainWidget
 
 
 class SimulationWindow(QMainWindow):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, started=None):
         super().__init__(parent)
         self.setWindowTitle('Fluid Simulation')
         self.setGeometry(0, 0, 1000, 700)
-        self.main_widget = MainWidget(self)
+        self.main_widget = MainWidget(self, started)
         self.setCentralWidget(self.main_widget)
 
+    def closeEvent(self, event):
+        self.main_widget.scene.shutdown()
+        super().closeEvent(event)
+
 
 
 
@@ -0,0 +1,350 @@
+import numpy as np
+
+
+def _interior_rows(num_x, rows):
+    """
+    Пересечение полосы строк [lo, hi) с внутренними ячейками 1..num_x - 2
+    """
+    lo, hi = (0, num_x) if rows is None else rows
+    a = max(lo, 1)
+    return a, max(a, min(hi, num_x - 1))
+
+
+def max_divergence(fluid, rows=None):
+    """
+    Максимальная по модулю дивергенция скорости в ячейках жидкости
+    :param fluid: объект Fluid
+    :param rows: полоса строк по х (lo, hi), None - вся сетка
+    :return: max |div| по ячейкам, которые обрабатывает решатель
+    """
+    a, b = _interior_rows(fluid.num_x, rows)
+    u = fluid.grid('u')
+    v = fluid.grid('v')
+
+    cells = fluid.active_cells().cell_mask[a:b, 1:-1]
+    div = fluid.scratch('divergence', cells.shape, np.float32)
+    np.subtract(u[a + 1:b + 1, 1:-1], u[a:b, 1:-1], out=div)
+    div += v[a:b, 2:]
+    div -= v[a:b, 1:-1]
+    np.abs(div, out=div)
+    return float(div.max(where=cells, initial=0.0))
+
+
+def warm_start_pressure(fluid, dt, rows=None, comm=None):
+    """
+    Начальное приближение решателя из давления предыдущего шага.
+    Поправки решателей накапливаются в p = cp * φ, поэтому φ = p / cp при новом dt
+    применяется к скоростям так же, как накопленные поправки (с учётом смены dt)
+    :param fluid: объект Fluid
+    :param dt: шаг времени
+    :param rows: полоса строк по х (lo, hi), которую обновляет вызывающий, None - вся сетка
+    :param comm: синхронизация полос (barrier()), None - один процесс
+    :return:
+    """
+    nx = fluid.num_x
+    lo, hi = (0, nx) if rows is None else rows
+    cp = fluid.density * fluid.h / dt
+    s = fluid.grid('s')
+    u = fluid.grid('u')
+    v = fluid.grid('v')
+    p = fluid.grid('p')
+
+    # давление остаётся только в ячейках, которые обновляет решатель (маска могла измениться)
+    p[lo:hi][~fluid.active_cells().cell_mask[lo:hi]] = 0.0
+    # грани u на границе полосы читают давление соседней полосы
+    if comm is not None:
+        comm.barrier()
+
+    a = max(lo, 1)
+    phi = p[a - 1:hi] / cp
+    u[a:hi, :] += s[a:hi, :] * phi[:-1, :] - s[a - 1:hi - 1, :] * phi[1:, :]
+    phi = phi[lo - a + 1:]
+    v[lo:hi, 1:] += s[lo:hi, 1:] * phi[:, :-1] - s[lo:hi, :-1] * phi[:, 1:]
+    # решатель меняет давление и грани u соседей, которые ещё могут читаться
+    if comm is not None:
+        comm.barrier()
+
+
+def red_black_weights(s, a, b, over_relaxation):
+    """
+    Веса красных и чёрных ячеек SOR: over_relaxation / (число нетвёрдых соседей)
+    в ячейках решателя и 0 в остальных и в ячейках другого цвета
+    :param s: маска твёрдых ячеек (num_x, num_y)
+    :param a: первая строка по х
+    :param b: строка после последней
+    :param over_relaxation: коэф. успокоения
+    :return: (красные, чёрные) - массивы (b - a, num_y - 2) для строк [a, b) и внутренних j
+    """
+    s_sum = s[a - 1:b - 1, 1:-1] + s[a + 1:b + 1, 1:-1] + s[a:b, :-2] + s[a:b, 2:]
+    cells = (s[a:b, 1:-1] != 0.0) & (s_sum != 0.0)
+    scale = np.zeros_like(s_sum)
+    np.divide(over_relaxation, s_sum, out=scale, where=cells)
+    i, j = np.indices(scale.shape)
+    red = (i + a - 1 + j) % 2 == 0
+    return np.where(red, scale, 0.0), np.where(red, 0.0, scale)
+
+
+def solve_red_black(fluid, num_iters, dt, over_relaxation, tolerance=None, rows=None, comm=None):
+    """
+    Выполнение условия несжимаемости методом SOR с шахматным (red-black) порядком.
+    Ячейки одного цвета не имеют общих граней, поэтому каждый цвет
+    обновляется одной векторной операцией
+    :param fluid: объект Fluid
+    :param num_iters: максимальное число итераций (красный + чёрный проход)
+    :param dt: шаг времени
+    :param over_relaxation: коэф. успокоения (для устойчивости решения)
+    :param tolerance: допустимая max |div|, при достижении которой решение прекращается (None - без проверки)
+    :param rows: полоса строк по х (lo, hi), которую обновляет вызывающий, None - вся сетка
+    :param comm: синхронизация полос (barrier() после каждого цвета, max() для невязки), None - один процесс
+    :return: (число выполненных итераций, итоговая max |div| или None без tolerance)
+    """
+    nx = fluid.num_x
+    cp = fluid.density * fluid.h / dt
+    a, b = _interior_rows(nx, rows)
+
+    s = fluid.grid('s')
+    u = fluid.grid('u')
+    v = fluid.grid('v')
+    p = fluid.grid('p')
+
+    sx0 = s[a - 1:b - 1, 1:-1]
+    sx1 = s[a + 1:b + 1, 1:-1]
+    sy0 = s[a:b, :-2]
+    sy1 = s[a:b, 2:]
+
+    # веса цветов зависят только от маски s, поэтому хранятся до solid_changed
+    key = (a, b, over_relaxation)
+    colours = fluid.red_black.get(key)
+    if colours is None:
+        colours = fluid.red_black[key] = red_black_weights(s, a, b, over_relaxation)
+
+    u_left = u[a:b, 1:-1]
+    u_right = u[a + 1:b + 1, 1:-1]
+    v_down = v[a:b, 1:-1]
+    v_up = v[a:b, 2:]
+    p_cell = p[a:b, 1:-1]
+
+    # div = u_right - u_left + v_up - v_down, pc = -div * weight; всё в рабочих массивах fluid
+    pc = fluid.scratch('red_black_pc', p_cell.shape, np.float32)
+    change = fluid.scratch('red_black_change', p_cell.shape, np.float32)
+
+    def residual():
+        value = max_divergence(fluid, rows)
+        return value if comm is None else comm.max(value)
+
+    # без tolerance невязка не считается: это лишний проход по сетке, а в полосах ещё барьер и max()
+    value = None
+    for iter_num in range(num_iters):
+        for weight in colours:
+            np.subtract(u_right, u_left, out=pc)
+            pc += v_up
+            pc -= v_down
+            np.negative(pc, out=pc)
+            pc *= weight
+            np.multiply(pc, cp, out=change)
+            p_cell += change
+
+            np.multiply(sx0, pc, out=change)
+            u_left -= change
+            np.multiply(sx1, pc, out=change)
+            u_right += change
+            np.multiply(sy0, pc, out=change)
+            v_down -= change
+            np.multiply(sy1, pc, out=change)
+            v_up += change
+            if comm is not None:
+                comm.barrier()
+
+        if tolerance is not None:
+            value = residual()
+            if value <= tolerance:
+                return iter_num + 1, value
+
+    return num_iters, value
+
+
+class PoissonSystem:
+    """
+    Уравнение Пуассона для поправки давления, собранное по маске твёрдых ячеек s.
+    Неизвестные - ячейки, которые обновляет solve_incompressibility; соседние
+    ячейки жидкости вне области решения дают условие φ = 0 (выток).
+    Неизвестные упорядочены по антидиагоналям i + j, чтобы треугольные решения
+    предобуславливателя MIC(0) выполнялись векторно по диагоналям
+    """
+
+    TAU = 0.97
+    SIGMA = 0.25
+
+    def __init__(self, s, num_x, num_y):
+        """
+        Сборка системы и предобуславливателя
+        :param s: плоская маска твёрдых ячеек (0 - твёрдая)
+        :param num_x: число ячеек по х (с границами)
+        :param num_y: число ячеек по у (с границами)
+        """
+        self.num_x = num_x
+        self.num_y = num_y
+
+        s = s.reshape(num_x, num_y).astype(np.float64)
+        unknown = np.zeros((num_x, num_y), dtype=bool)
+        s_sum = s[:-2, 1:-1] + s[2:, 1:-1] + s[1:-1, :-2] + s[1:-1, 2:]
+        unknown[1:-1, 1:-1] = (s[1:-1, 1:-1] != 0.0) & (s_sum != 0.0)
+
+        i, j = np.nonzero(unknown)
+        order = np.lexsort((i, i + j))
+        i = i[order]
+        j = j[order]
+        size = len(i)
+        self.size = size
+        self.cells = i * num_y + j
+
+        # границы антидиагоналей в упорядоченном списке неизвестных
+        diag_num = i + j
+        bounds = np.searchsorted(diag_num, np.arange(diag_num.min(initial=0), diag_num.max(initial=0) + 2))
+        self.slices = [slice(bounds[k], bounds[k + 1]) for k in range(len(bounds) - 1)]
+
+        # номер неизвестной в каждой ячейке сетки, size - "нулевая" ячейка
+        index = np.full((num_x, num_y), size, dtype=np.intp)
+        index[i, j] = np.arange(size)
+        self.left = index[i - 1, j]
+        self.right = index[i + 1, j]
+        self.down = index[i, j - 1]
+        self.up = index[i, j + 1]
+
+        # веса граней: грань открыта, если обе соседние ячейки не твёрдые
+        self.diag = s[i - 1, j] + s[i + 1, j] + s[i, j - 1] + s[i, j + 1]
+        self.plus_i = np.zeros(size + 1)
+        self.plus_j = np.zeros(size + 1)
+        self.plus_i[:size] = np.where(self.right < size, s[i + 1, j], 0.0)
+        self.plus_j[:size] = np.where(self.up < size, s[i, j + 1], 0.0)
+
+        # грани, которые меняет решение (хотя бы одна сторона - неизвестная)
+        self.face_u = s[:-1, :] * s[1:, :] * (unknown[:-1, :] | unknown[1:, :])
+        self.face_v = s[:, :-1] * s[:, 1:] * (unknown[:, :-1] | unknown[:, 1:])
+
+        self.precon = np.zeros(size + 1)
+        self._build_preconditioner()
+
+    def _build_preconditioner(self):
+        """
+        Неполное разложение Холецкого MIC(0)
+        :return:
+        """
+        pc = self.precon
+        for sl in self.slices:
+            left = self.left[sl]
+            down = self.down[sl]
+            a_l = self.plus_i[left] * pc[left]
+            a_d = self.plus_j[down] * pc[down]
+            diag = self.diag[sl]
+            e = (diag - a_l * a_l - a_d * a_d
+                 - self.TAU * (self.plus_i[left] * self.plus_j[left] * pc[left] ** 2 +
+                               self.plus_j[down] * self.plus_i[down] * pc[down] ** 2))
+            e = np.where(e < self.SIGMA * diag, diag, e)
+            pc[sl] = 1.0 / np.sqrt(e)
+
+        # коэффициенты треугольных множителей, постоянные до смены маски s
+        self.lower_l = self.plus_i[self.left] * pc[self.left]
+        self.lower_d = self.plus_j[self.down] * pc[self.down]
+        self.upper_r = self.plus_i[:-1] * pc[:-1]
+        self.upper_u = self.plus_j[:-1] * pc[:-1]
+
+    def multiply(self, x):
+        """
+        Умножение матрицы системы на вектор
+        :param x: вектор длины size + 1 (последний элемент равен 0)
+        :return: A x, вектор длины size + 1
+        """
+        out = np.zeros_like(x)
+        out[:-1] = (self.diag * x[:-1]
+                    - self.plus_i[:-1] * x[self.right] - self.plus_i[self.left] * x[self.left]
+                    - self.plus_j[:-1] * x[self.up] - self.plus_j[self.down] * x[self.down])
+        return out
+
+    def precondition(self, r):
+        """
+        Применение предобуславливателя MIC(0): решение L L^T z = r
+        :param r: вектор длины size + 1
+        :return: z, вектор длины size + 1
+        """
+        pc = self.precon
+        q = np.zeros_like(r)
+        for sl in self.slices:
+            q[sl] = (r[sl] + self.lower_l[sl] * q[self.left[sl]]
+                     + self.lower_d[sl] * q[self.down[sl]]) * pc[sl]
+
+        z = np.zeros_like(r)
+        for sl in reversed(self.slices):
+            z[sl] = (q[sl] + self.upper_r[sl] * z[self.right[sl]]
+                     + self.upper_u[sl] * z[self.up[sl]]) * pc[sl]
+        return z
+
+    def solve(self, b, max_iters, tolerance=None):
+        """
+        Метод сопряжённых градиентов с предобуславливателем MIC(0)
+        :param b: правая часть (-div), длины size
+        :param max_iters: максимальное число итераций
+        :param tolerance: допустимая max |невязки| (None - выполнить все итерации)
+        :return: (решение длины size, число итераций, итоговая max |невязки|)
+        """
+        x = np.zeros(self.size + 1)
+        r = np.zeros(self.size + 1)
+        r[:-1] = b
+        residual = float(np.abs(r).max()) if self.size else 0.0
+        if self.size == 0 or (tolerance is not None and residual <= tolerance):
+            return x[:-1], 0, residual
+
+        z = self.precondition(r)
+        d = z.copy()
+        sigma = z @ r
+
+        iters = 0
+        for iters in range(1, max_iters + 1):
+            z = self.multiply(d)
+            alpha = sigma / (z @ d)
+            x += alpha * d
+            r -= alpha * z
+            residual = float(np.abs(r).max())
+            if tolerance is not None and residual <= tolerance:
+                break
+
+            z = self.precondition(r)
+            sigma_new = z @ r
+            d *= sigma_new / sigma
+            d += z
+            sigma = sigma_new
+
+        return x[:-1], iters, residual
+
+
+def solve_pcg(fluid, system, num_iters, dt, tolerance=None):
+    """
+    Выполнение условия несжимаемости решением уравнения Пуассона (MIC(0)-PCG).
+    Результат записывается в p, u, v так же, как в solve_incompressibility
+    :param fluid: объект Fluid
+    :param system: PoissonSystem, собранная по текущей маске fluid.s
+    :param num_iters: максимальное число итераций
+    :param dt: шаг времени
+    :param tolerance: допустимая max |div| (None - выполнить все итерации)
+    :return: (число выполненных итераций, итоговая max |div|)
+    """
+    nx = fluid.num_x
+    ny = fluid.num_y
+    cp = fluid.density * fluid.h / dt
+
+    u = fluid.grid('u')
+    v = fluid.grid('v')
+
+    div = np.zeros((nx, ny), dtype=np.float64)
+    div[:-1, :-1] = u[1:, :-1] - u[:-1, :-1] + v[:-1, 1:] - v[:-1, :-1]
+    phi_cells, iters, residual = system.solve(-div.ravel()[system.cells], num_iters, tolerance)
+
+    phi = np.zeros(nx * ny, dtype=np.float64)
+    phi[system.cells] = phi_cells
+    fluid.p += (cp * phi).astype(np.float32)
+
+    phi = phi.reshape(nx, ny)
+    u[1:, :] += system.face_u * (phi[:-1, :] - phi[1:, :])
+    v[:, 1:] += system.face_v * (phi[:, :-1] - phi[:, 1:])
+
+    return iters, residual
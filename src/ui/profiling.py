@@ -0,0 +1,137 @@
+import time
+
+import numpy as np
+
+
+class NullProfiler:
+    """
+    Профилировщик-заглушка: ничего не замеряет, стоит несколько пустых вызовов за шаг
+    """
+
+    enabled = False
+
+    def start(self):
+        return 0.0
+
+    def lap(self, stage, start):
+        return 0.0
+
+    def add(self, stage, ms):
+        pass
+
+    def commit(self, **values):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageProfiler:
+    """
+    Время этапов (мс) и счётчики за последние capacity шагов в кольцевом буфере
+    """
+
+    enabled = True
+
+    def __init__(self, stages, capacity=120):
+        """
+        :param stages: имена этапов в порядке выполнения
+        :param capacity: размер кольцевого буфера (число шагов)
+        """
+        self.stages = tuple(stages)
+        self.stage_index = {name: k for k, name in enumerate(self.stages)}
+        self.capacity = capacity
+        self.times = np.zeros((capacity, len(self.stages)))
+        self.stamps = np.zeros(capacity)
+        self.values = {}
+        self.current = np.zeros(len(self.stages))
+        self.row = 0
+        self.count = 0
+
+    def start(self):
+        """
+        :return: отметка времени начала этапа
+        """
+        return time.perf_counter()
+
+    def lap(self, stage, start):
+        """
+        Добавить время этапа, прошедшее с отметки start
+        :param stage: имя этапа
+        :param start: отметка времени начала этапа
+        :return: отметка времени конца этапа (начало следующего)
+        """
+        now = time.perf_counter()
+        self.current[self.stage_index[stage]] += (now - start) * 1000.0
+        return now
+
+    def add(self, stage, ms):
+        """
+        Добавить время этапа, замеренное в другом месте (например, в рабочем процессе)
+        :param stage: имя этапа
+        :param ms: время в мс
+        :return:
+        """
+        self.current[self.stage_index[stage]] += ms
+
+    def commit(self, **values):
+        """
+        Закончить шаг: сохранить времена этапов и счётчики
+        :param values: счётчики шага (например cnt, solver_iters)
+        :return:
+        """
+        row = self.row
+        self.times[row] = self.current
+        self.current[:] = 0.0
+        self.stamps[row] = time.perf_counter()
+        for name, value in values.items():
+            if name not in self.values:
+                self.values[name] = np.full(self.capacity, np.nan)
+            self.values[name][row] = np.nan if value is None else value
+        self.row = (row + 1) % self.capacity
+        self.count += 1
+
+    def _filled(self):
+        return min(self.count, self.capacity)
+
+    def stage_ms(self):
+        """
+        :return: среднее время этапов в мс по буферу
+        """
+        filled = self._filled()
+        if not filled:
+            return {name: 0.0 for name in self.stages}
+        means = self.times[:filled].mean(axis=0)
+        return dict(zip(self.stages, means.tolist()))
+
+    def rate(self):
+        """
+        :return: число шагов в секунду по отметкам в буфере
+        """
+        filled = self._filled()
+        if filled < 2:
+            return 0.0
+        stamps = self.stamps[:filled]
+        span = stamps.max() - stamps.min()
+        return float((filled - 1) / span) if span > 0 else 0.0
+
+    def last(self, name):
+        """
+        :param name: имя счётчика
+        :return: последнее значение счётчика или None
+        """
+        if name not in self.values or not self.count:
+            return None
+        value = self.values[name][(self.row - 1) % self.capacity]
+        return None if np.isnan(value) else value.item()
+
+    def summary(self):
+        """
+        :return: словарь с временами этапов, частотой шагов и последними счётчиками
+        """
+        return {
+            'stages_ms': self.stage_ms(),
+            'rate': self.rate(),
+            'values': {name: self.last(name) for name in self.values},
+            'steps': self.count,
+        }
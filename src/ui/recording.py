@@ -0,0 +1,204 @@
+import json
+import queue
+import struct
+import threading
+
+import numpy as np
+
+MAGIC = b'FLUIDREC'
+VERSION = 1
+HEADER_SIZE = 4096
+# magic, версия, длина JSON, число записанных кадров
+HEADER_STRUCT = struct.Struct('<8sIIQ')
+COUNT_OFFSET = 16
+
+RECORD_FIELDS = ('u', 'v', 'p', 'm', 's')
+# промежуточных буферов кадров: столько кадров может ждать записи на диск
+STAGING_BUFFERS = 4
+FRAME_INFO = np.dtype([('frame_num', '<i8'), ('obstacle', '<f8', (4,))])
+
+
+def _layout(capacity, num_fields, num_cells):
+    """
+    Смещения таблицы кадров и блока данных в файле записи
+    :return: (смещение таблицы, смещение данных, полный размер файла)
+    """
+    info_offset = HEADER_SIZE
+    data_offset = info_offset + FRAME_INFO.itemsize * capacity
+    data_offset += -data_offset % 64
+    size = data_offset + capacity * num_fields * num_cells * 4
+    return info_offset, data_offset, size
+
+
+class FrameRecorder:
+    """
+    Запись кадров в заранее выделенный файл, отображаемый в память.
+    record() только копирует поля в промежуточный буфер, запись в файл
+    выполняет фоновый поток, поэтому шаг симуляции не ждёт диск.
+    Буферов фиксированное число: если диск не успевает и все заняты,
+    кадр пропускается (dropped), а память не растёт
+    """
+
+    def __init__(self, path, fluid, dt, capacity, fields=RECORD_FIELDS, every=1, buffers=STAGING_BUFFERS):
+        """
+        :param path: путь к файлу записи
+        :param fluid: объект Fluid (размер сетки и h)
+        :param dt: шаг времени
+        :param capacity: максимальное число кадров
+        :param fields: записываемые поля Fluid
+        :param every: записывать каждый every-й шаг
+        :param buffers: число промежуточных буферов
+        """
+        self.path = path
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.every = every
+        self.num_cells = fluid.num_cells
+        self.count = 0
+        self.dropped = 0
+
+        header = json.dumps({
+            'num_x': fluid.num_x,
+            'num_y': fluid.num_y,
+            'h': fluid.h,
+            'dt': dt,
+            'fields': self.fields,
+            'capacity': capacity,
+        }).encode()
+        if HEADER_STRUCT.size + len(header) > HEADER_SIZE:
+            raise ValueError('Recording header does not fit into the header block')
+
+        info_offset, data_offset, size = _layout(capacity, len(self.fields), self.num_cells)
+        with open(path, 'wb') as f:
+            f.write(HEADER_STRUCT.pack(MAGIC, VERSION, len(header), 0))
+            f.write(header)
+            f.truncate(size)
+
+        self.counter = np.memmap(path, dtype='<u8', mode='r+', offset=COUNT_OFFSET, shape=(1,))
+        self.info = np.memmap(path, dtype=FRAME_INFO, mode='r+', offset=info_offset, shape=(capacity,))
+        self.data = np.memmap(path, dtype=np.float32, mode='r+', offset=data_offset,
+                              shape=(capacity, len(self.fields), self.num_cells))
+
+        self.free = queue.SimpleQueue()
+        # буферы выделяются при первом использовании
+        for _ in range(buffers):
+            self.free.put(None)
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, tunnel):
+        """
+        Постановка текущего кадра в очередь записи
+        :param tunnel: объект WindTunnel
+        :return: False, если файл уже заполнен или кадр пропущен из-за незаконченной записи
+        """
+        if self.count >= self.capacity:
+            self.dropped += 1
+            return False
+
+        try:
+            stage = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        if stage is None:
+            stage = np.empty((len(self.fields), self.num_cells), dtype=np.float32)
+
+        fluid = tunnel.fluid
+        for k, name in enumerate(self.fields):
+            np.copyto(stage[k], getattr(fluid, name))
+        obstacle = (tunnel.obstacle_x, tunnel.obstacle_y, tunnel.obstacle_width, tunnel.obstacle_height)
+
+        self.pending.put((self.count, tunnel.frame_num, obstacle, stage))
+        self.count += 1
+        return True
+
+    def _write_loop(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            index, frame_num, obstacle, stage = item
+            self.data[index] = stage
+            self.info[index] = (frame_num, obstacle)
+            self.counter[0] = index + 1
+            self.free.put(stage)
+
+    def close(self):
+        """
+        Дописать очередь и закрыть файл
+        :return:
+        """
+        if self.thread is None:
+            return
+        self.pending.put(None)
+        self.thread.join()
+        self.thread = None
+        self.data.flush()
+        self.info.flush()
+        self.counter.flush()
+
+
+class RecordedFrame:
+    """
+    Кадр записи: поля - представления memmap без копирования
+    """
+
+    def __init__(self, reader, index):
+        self.num_x = reader.num_x
+        self.num_y = reader.num_y
+        self.h = reader.h
+        self.index = index
+        self.frame_num = int(reader.info[index]['frame_num'])
+        self.obstacle = tuple(float(x) for x in reader.info[index]['obstacle'])
+        for k, name in enumerate(reader.fields):
+            setattr(self, name, reader.data[index, k])
+
+
+class FrameReader:
+    """
+    Чтение записи через np.memmap: доступ к любому кадру за O(1),
+    в память подгружаются только страницы нужного кадра
+    """
+
+    def __init__(self, path):
+        """
+        :param path: путь к файлу записи
+        """
+        with open(path, 'rb') as f:
+            magic, version, header_len, count = HEADER_STRUCT.unpack(f.read(HEADER_STRUCT.size))
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not a fluid recording')
+            if version != VERSION:
+                raise ValueError(f'Unsupported recording version {version}')
+            header = json.loads(f.read(header_len))
+
+        self.path = path
+        self.num_x = header['num_x']
+        self.num_y = header['num_y']
+        self.h = header['h']
+        self.dt = header['dt']
+        self.fields = tuple(header['fields'])
+        self.capacity = header['capacity']
+
+        num_cells = self.num_x * self.num_y
+        info_offset, data_offset, size = _layout(self.capacity, len(self.fields), num_cells)
+        self.counter = np.memmap(path, dtype='<u8', mode='r', offset=COUNT_OFFSET, shape=(1,))
+        self.info = np.memmap(path, dtype=FRAME_INFO, mode='r', offset=info_offset, shape=(self.capacity,))
+        self.data = np.memmap(path, dtype=np.float32, mode='r', offset=data_offset,
+                              shape=(self.capacity, len(self.fields), num_cells))
+
+    def __len__(self):
+        # число кадров читается из заголовка, поэтому запись можно смотреть во время работы
+        return int(self.counter[0])
+
+    def frame(self, index):
+        """
+        Кадр записи по номеру
+        :param index: номер кадра (0 <= index < len(reader))
+        :return: RecordedFrame
+        """
+        if not 0 <= index < len(self):
+            raise IndexError(f'Frame {index} is out of range 0..{len(self) - 1}')
+        return RecordedFrame(self, index)
@@ -0,0 +1,272 @@
+import numpy as np
+from PyQt6.QtGui import QImage, QPolygonF
+
+from .fluid import U_FIELD, V_FIELD, sample_grid
+
+
+def sci_colormap(size=256):
+    """
+    Таблица цветов научной шкалы: синий - голубой - зелёный - жёлтый - красный
+    :param size: число цветов
+    :return: массив (size, 3) uint8
+    """
+    val = np.linspace(0.0, 1.0 - 1e-4, size)
+    num = np.floor(val / 0.25).astype(int)
+    s = (val - num * 0.25) / 0.25
+    one = np.ones(size)
+    zero = np.zeros(size)
+    r = np.choose(num, [zero, zero, s, one])
+    g = np.choose(num, [s, one, one, 1.0 - s])
+    b = np.choose(num, [one, 1.0 - s, zero, zero])
+    return (np.stack([r, g, b], axis=1) * 255.0).astype(np.uint8)
+
+
+PRESSURE_LUT = sci_colormap()
+
+
+def polygon_view(polygon, count):
+    """
+    Массив точек поверх памяти QPolygonF: координаты пишутся NumPy без объектов QPointF
+    :param polygon: QPolygonF
+    :param count: число точек
+    :return: массив (count, 2) float64, общий с polygon
+    """
+    polygon.resize(count)
+    ptr = polygon.data()
+    ptr.setsize(count * 16)
+    return np.frombuffer(ptr, dtype=np.float64).reshape(count, 2)
+
+
+class FieldRenderer:
+    """
+    Отрисовка поля сетки в QImage без покадровых вызовов Qt на каждую ячейку.
+    RGB-буфер выделяется один раз, QImage ссылается на его память без копирования.
+    Изображение не больше области вывода: если ячеек больше, чем пикселей,
+    берётся ячейка под центром каждого пикселя, а меньшую сетку растягивает Qt,
+    поэтому работа за кадр не растёт с разрешением сетки
+    """
+
+    def __init__(self, num_x, num_y, width=None, height=None):
+        """
+        :param num_x: число ячеек по х
+        :param num_y: число ячеек по у
+        :param width: ширина области вывода в пикселях (None - по числу ячеек)
+        :param height: высота области вывода в пикселях (None - по числу ячеек)
+        """
+        self.num_x = num_x
+        self.num_y = num_y
+        self.target = (width, height)
+        self.width = num_x if width is None else max(1, min(num_x, int(width)))
+        self.height = num_y if height is None else max(1, min(num_y, int(height)))
+
+        # плоский номер ячейки под центром каждого пикселя, строка 0 - верх области (j = num_y - 1);
+        # без прореживания поле берётся транспонированным представлением без выборки
+        self.index = None
+        if (self.width, self.height) != (num_x, num_y):
+            i = ((np.arange(self.width) + 0.5) * (num_x / self.width)).astype(np.intp)
+            j = num_y - 1 - ((np.arange(self.height) + 0.5) * (num_y / self.height)).astype(np.intp)
+            self.index = i[None, :] * num_y + j[:, None]
+
+        self.buffer = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self.scratch = np.zeros((self.height, self.width), dtype=np.float32)
+        self.values = np.zeros((self.height, self.width), dtype=np.float32)
+        self.gray = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.image = QImage(self.buffer.data, self.width, self.height, self.width * 3, QImage.Format.Format_RGB888)
+
+    def matches(self, num_x, num_y, width=None, height=None):
+        """
+        Подходит ли отрисовщик для сетки и области вывода такого размера
+        :return:
+        """
+        return self.num_x == num_x and self.num_y == num_y and self.target == (width, height)
+
+    def sample(self, field, out):
+        """
+        Значения плоского поля в пикселях изображения
+        :param field: плоский массив поля
+        :param out: массив (height, width) для выборки (не используется без прореживания)
+        :return: массив (height, width), строка 0 - верх области
+        """
+        if self.index is None:
+            return field.reshape(self.num_x, self.num_y).T[::-1]
+        return np.take(field, self.index, out=out)
+
+    def render(self, fluid, show_smoke=True, show_pressure=False):
+        """
+        Заполнение буфера значениями поля
+        :param fluid: объект Fluid или Frame того же размера
+        :param show_smoke: рисовать дым
+        :param show_pressure: рисовать давление цветовой шкалой (дым затемняет её)
+        :return: QImage поверх буфера, строка 0 - верх области (j = num_y - 1)
+        """
+        if show_pressure:
+            self.render_pressure(fluid, show_smoke)
+            return self.image
+
+        if show_smoke:
+            np.multiply(self.sample(fluid.m, self.scratch), 255.0, out=self.scratch)
+            np.clip(self.scratch, 0.0, 255.0, out=self.scratch)
+            self.gray[:] = self.scratch
+        else:
+            np.not_equal(self.sample(fluid.s, self.scratch), 0.0, out=self.gray)
+            self.gray *= 255
+
+        self.buffer[:] = self.gray[:, :, None]
+        return self.image
+
+    def render_pressure(self, fluid, show_smoke):
+        """
+        Давление через таблицу PRESSURE_LUT, диапазон шкалы - min..max p по сетке.
+        Твёрдые ячейки чёрные, дым вычитается из цвета (как m * 255)
+        :param fluid: объект Fluid или Frame того же размера
+        :param show_smoke: затемнять цвет дымом
+        :return:
+        """
+        low = float(fluid.p.min())
+        high = float(fluid.p.max())
+        top = len(PRESSURE_LUT) - 1
+        scale = top / (high - low) if high > low else 0.0
+
+        p = self.sample(fluid.p, self.values)
+        np.subtract(p, low, out=self.scratch)
+        self.scratch *= scale
+        np.clip(self.scratch, 0.0, top, out=self.scratch)
+        self.gray[:] = self.scratch
+        np.take(PRESSURE_LUT, self.gray, axis=0, out=self.buffer)
+
+        if show_smoke:
+            # насыщающее вычитание: max(c, g) - g = max(c - g, 0)
+            np.multiply(self.sample(fluid.m, self.values), 255.0, out=self.scratch)
+            np.clip(self.scratch, 0.0, 255.0, out=self.scratch)
+            self.gray[:] = self.scratch
+            smoke = self.gray[:, :, None]
+            np.maximum(self.buffer, smoke, out=self.buffer)
+            self.buffer -= smoke
+
+        np.not_equal(self.sample(fluid.s, self.values), 0.0, out=self.gray)
+        self.buffer *= self.gray[:, :, None]
+
+
+class FlowOverlay:
+    """
+    Векторные слои поверх поля: стрелки скорости и линии тока.
+    Геометрия считается сразу для всех стрелок и линий массивами NumPy и
+    передаётся в QPainter через память QPolygonF, без объектов Python на точку
+    """
+
+    def __init__(self, spacing=5, arrow_scale=0.02, steps=15, step_dt=0.01):
+        """
+        :param spacing: шаг прореживания ячеек для стрелок и начал линий тока
+        :param arrow_scale: длина стрелки на единицу скорости
+        :param steps: число шагов RK2 на линию тока
+        :param step_dt: шаг интегрирования линии тока
+        """
+        self.spacing = spacing
+        self.arrow_scale = arrow_scale
+        self.steps = steps
+        self.step_dt = step_dt
+        self.arrows = QPolygonF()
+        self.lines = []
+
+    def seeds(self, frame):
+        """
+        Центры прореженных нетвёрдых ячеек
+        :param frame: объект Fluid или Frame
+        :return: (i, j) номера ячеек
+        """
+        nx = frame.num_x
+        ny = frame.num_y
+        i, j = np.meshgrid(np.arange(1, nx - 1, self.spacing), np.arange(1, ny - 1, self.spacing), indexing='ij')
+        i = i.ravel()
+        j = j.ravel()
+        fluid = frame.s[i * ny + j] != 0.0
+        return i[fluid], j[fluid]
+
+    def arrow_points(self, frame):
+        """
+        Стрелки средней скорости в центрах прореженных ячеек
+        :param frame: объект Fluid или Frame
+        :return: массив (6 * N, 2) координат симуляции: пары точек стержня и двух половин наконечника
+        """
+        n = frame.num_y
+        h = frame.h
+        i, j = self.seeds(frame)
+        k = i * n + j
+        vel = np.stack([(frame.u[k] + frame.u[k + n]) * 0.5, (frame.v[k] + frame.v[k + 1]) * 0.5], axis=1)
+
+        start = np.stack([(i + 0.5) * h, (j + 0.5) * h], axis=1)
+        end = start + vel * self.arrow_scale
+        back = (start - end) * 0.3
+        cos = np.cos(0.4)
+        sin = np.sin(0.4)
+        left = end + np.stack([back[:, 0] * cos - back[:, 1] * sin, back[:, 0] * sin + back[:, 1] * cos], axis=1)
+        right = end + np.stack([back[:, 0] * cos + back[:, 1] * sin, -back[:, 0] * sin + back[:, 1] * cos], axis=1)
+        return np.stack([start, end, end, left, end, right], axis=1).reshape(-1, 2)
+
+    def streamline_points(self, frame):
+        """
+        Линии тока из центров прореженных ячеек: все линии интегрируются
+        одновременно шагами RK2 (метод средней точки) по u, v.
+        Линия, вышедшая из области, остаётся в последней точке
+        :param frame: объект Fluid или Frame
+        :return: массив (N, steps + 1, 2) координат симуляции
+        """
+        h = frame.h
+        width = frame.num_x * h
+        height = frame.num_y * h
+        i, j = self.seeds(frame)
+
+        points = np.empty((len(i), self.steps + 1, 2))
+        x = (i + 0.5) * h
+        y = (j + 0.5) * h
+        points[:, 0, 0] = x
+        points[:, 0, 1] = y
+        dt = self.step_dt
+        for step in range(1, self.steps + 1):
+            u1 = sample_grid(frame.u, frame.num_x, frame.num_y, h, U_FIELD, x, y)
+            v1 = sample_grid(frame.v, frame.num_x, frame.num_y, h, V_FIELD, x, y)
+            mid_x = x + 0.5 * dt * u1
+            mid_y = y + 0.5 * dt * v1
+            u2 = sample_grid(frame.u, frame.num_x, frame.num_y, h, U_FIELD, mid_x, mid_y)
+            v2 = sample_grid(frame.v, frame.num_x, frame.num_y, h, V_FIELD, mid_x, mid_y)
+            new_x = x + dt * u2
+            new_y = y + dt * v2
+            inside = (new_x >= 0.0) & (new_x <= width) & (new_y >= 0.0) & (new_y <= height)
+            x = np.where(inside, new_x, x)
+            y = np.where(inside, new_y, y)
+            points[:, step, 0] = x
+            points[:, step, 1] = y
+        return points
+
+    def draw_velocities(self, painter, frame, scale, canvas_height):
+        """
+        Все стрелки скорости одним вызовом drawLines
+        :param painter: активный QPainter
+        :param frame: объект Fluid или Frame
+        :param scale: пикселей на единицу длины
+        :param canvas_height: высота холста (ось у направлена вверх)
+        :return:
+        """
+        points = self.arrow_points(frame)
+        view = polygon_view(self.arrows, len(points))
+        np.multiply(points, scale, out=view)
+        np.subtract(canvas_height, view[:, 1], out=view[:, 1])
+        painter.drawLines(self.arrows)
+
+    def draw_streamlines(self, painter, frame, scale, canvas_height):
+        """
+        Линии тока, каждая - одним вызовом drawPolyline
+        :param painter: активный QPainter
+        :param frame: объект Fluid или Frame
+        :param scale: пикселей на единицу длины
+        :param canvas_height: высота холста (ось у направлена вверх)
+        :return:
+        """
+        points = self.streamline_points(frame)
+        while len(self.lines) < len(points):
+            self.lines.append(QPolygonF())
+        for line, polygon in zip(points, self.lines):
+            view = polygon_view(polygon, len(line))
+            np.multiply(line, scale, out=view)
+            np.subtract(canvas_height, view[:, 1], out=view[:, 1])
+            painter.drawPolyline(polygon)
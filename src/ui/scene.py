@@ -1,10 +1,16 @@
-import math
+import time
 
-from PyQt6.QtCore import QTimer, Qt, QRect
-from PyQt6.QtGui import QPixmap, QPainter, QPen, QColor
-from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout
+from PyQt6.QtCore import QTimer, Qt, QRect, QRectF, QThread
+from PyQt6.QtGui import QPixmap, QPainter
+from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout, QSizePolicy
 
-from .fluid import Fluid
+from .fluid import SIM_STAGES
+from .frames import FrameBuffer
+from .profiling import NULL_PROFILER, StageProfiler
+from .recording import FrameReader
+from .renderer import FieldRenderer, FlowOverlay
+from .wind_tunnel import WindTunnel
+from .worker import SimulationWorker
 
 
 CANVAS_WIDTH = 1000
@@ -12,61 +18,81 @@ CANVAS_HEIGHT = 700
 
 
 class Scene(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, threaded=True, res=100, started=None):
+        """
+        :param parent: родительский виджет
+        :param threaded: считать симуляцию в отдельном потоке
+        :param res: число ячеек по высоте
+        :param started: отметка time.perf_counter() начала запуска для времени до первого кадра
+                        (None - момент создания сцены)
+        """
         super().__init__(parent)
+        self.started = time.perf_counter() if started is None else started
+        self.first_frame_s = None
 
         layout = QVBoxLayout(self)
 
         self.label = QLabel()
-
-        self.frame_num = 0
+        # холст следует за размером виджета, поэтому метка не должна навязывать свой размер
+        self.label.setMinimumSize(1, 1)
+        self.label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
 
         layout.addWidget(self.label)
-        self.canvas = QPixmap(CANVAS_WIDTH, CANVAS_HEIGHT)
-        self.canvas.fill(Qt.GlobalColor.white)
-        self.label.setPixmap(self.canvas)
-
         self.setLayout(layout)
 
-        self.painter = QPainter(self.canvas)
+        self.painter = QPainter()
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_scene)
         self.timer.start(int(1/30 * 1000))
 
-        self.gravity = -9.81
-        self.dt = 1.0 / 20.0
-        self.iter_num = 20
-        self.frame_num = 0
-        self.over_relaxation = 1.9
-        self.obstacle_x = 0.1
-        self.obstacle_y = 0.9
-        self.obstacle_width = 0.09
-        self.obstacle_height = 0.21
-        self.paused = False
         self.scene_num = 0
         self.show_obstacle = False
         self.show_streamlines = False
         self.show_velocities = False
         self.show_pressure = False
         self.show_smoke = True
-        self.fluid = None
+        self.show_stats = False
+        self.renderer = None
+        self.overlay = FlowOverlay()
+        self.sim_profiler = NULL_PROFILER
+        self.render_profiler = NULL_PROFILER
 
         self.sim_height = 1
         self.cScale = CANVAS_HEIGHT / self.sim_height
         self.sim_width = CANVAS_WIDTH / self.cScale
+        self.canvas = None
+        self.canvas_width = 0
+        self.canvas_height = 0
+        self.resize_canvas(CANVAS_WIDTH, CANVAS_HEIGHT)
+
+        self.tunnel = WindTunnel(self.sim_width, self.sim_height, res=res)
+        self.frames = FrameBuffer()
+        self.worker = SimulationWorker(self.tunnel, self.frames)
+        self.threaded = threaded
+        self.thread = None
+        self.replay = None
+        self.replay_index = 0
 
         self.setup_scene()
 
+        if self.threaded:
+            self.thread = QThread()
+            self.worker.moveToThread(self.thread)
+            self.thread.started.connect(self.worker.run)
+            self.thread.start()
+
+    @property
+    def fluid(self):
+        return self.tunnel.fluid
+
     def x_coord_change(self, new_x_coord: float):
         """
         Слот для изменения значения слайдера для x координаты
         :param new_x_coord: новое значение x
         :return:
         """
-        self.set_obstacle(new_x_coord / 100, self.obstacle_y, False)
-        self.simulate()
-        self.draw()
+        self.worker.post_obstacle(x=new_x_coord / 100)
 
     def y_coord_change(self, new_y_coord: float):
         """
@@ -74,9 +100,7 @@ class Scene(QWidget):
         :param new_y_coord: новое значение y
         :return:
         """
-        self.set_obstacle(self.obstacle_x, new_y_coord / 100, False)
-        self.simulate()
-        self.draw()
+        self.worker.post_obstacle(y=new_y_coord / 100)
 
     def width_change(self, new_w):
         """
@@ -84,10 +108,7 @@ class Scene(QWidget):
         :param new_w: новое значение ширины
         :return:
         """
-        self.obstacle_width = new_w / 100
-        self.set_obstacle(self.obstacle_x, self.obstacle_y, False)
-        self.simulate()
-        self.draw()
+        self.worker.post_obstacle(width=new_w / 100)
 
     def height_change(self, new_h):
         """
@@ -95,183 +116,355 @@ class Scene(QWidget):
         :param new_h: новое значение высоты
         :return:
         """
-        self.obstacle_height = new_h / 100
-        self.set_obstacle(self.obstacle_x, self.obstacle_y, False)
-        self.simulate()
-        self.draw()
+        self.worker.post_obstacle(height=new_h / 100)
+
+    def set_resolution(self, res):
+        """
+        Слот для изменения разрешения сетки: текущее состояние переносится на новую сетку
+        :param res: число ячеек по высоте
+        :return:
+        """
+        self.worker.set_resolution(int(res))
+
+    def set_auto_resolution(self, enabled):
+        """
+        Слот для автоматического подбора разрешения под время кадра
+        :param enabled: включить подбор
+        :return:
+        """
+        self.worker.set_auto_resolution(bool(enabled))
+
+    def resize_canvas(self, width, height):
+        """
+        Холст под фактический размер виджета; масштаб выбирается так,
+        чтобы область симуляции целиком помещалась на холсте
+        :param width: ширина в пикселях
+        :param height: высота в пикселях
+        :return:
+        """
+        width = max(1, width)
+        height = max(1, height)
+        if (width, height) == (self.canvas_width, self.canvas_height):
+            return
+        self.canvas_width = width
+        self.canvas_height = height
+        self.cScale = min(height / self.sim_height, width / self.sim_width)
+        self.canvas = QPixmap(width, height)
+        self.canvas.fill(Qt.GlobalColor.white)
+        self.label.setPixmap(self.canvas)
+
+    def resizeEvent(self, event):
+        margins = self.layout().contentsMargins()
+        self.resize_canvas(
+            event.size().width() - margins.left() - margins.right(),
+            event.size().height() - margins.top() - margins.bottom()
+        )
+        super().resizeEvent(event)
 
     def cX(self, x):  # пересчёт координаты х
         return x * self.cScale
 
     def cY(self, y):  # пересчёт координаты х
-        return CANVAS_HEIGHT - y * self.cScale
+        return self.canvas_height - y * self.cScale
 
     def setup_scene(self):
         """
         Подготовка симуляции
         :return:
         """
-        self.iter_num = 5
-        self.density = 1000
-
-        res = 100
-
-        dom_height = 1
-        dom_width = dom_height / self.sim_height * self.sim_width
-        h = dom_height / res
-
-        numx = int(dom_width / h)
-        numy = int(dom_height / h)
-
-        self.fluid = Fluid(self.density, numx, numy, h)
-        n = self.fluid.num_y
-
-        in_vel = 2.5
-        for j in range(self.fluid.num_y):
-            for i in range(self.fluid.num_x):
-                s = 1  # fluid
-                if i == 0 or j == 0 or j == self.fluid.num_y - 1:
-                    s = 0.0  # solid
-                self.fluid.s[i * n + j] = s
-
-                if i == 1:
-                    self.fluid.u[i * n + j] = in_vel
-        pipe_h = 0.9 * self.fluid.num_y
-        min_j = int(0.5 * self.fluid.num_y - 0.5 * pipe_h)
-        max_j = int(0.5 * self.fluid.num_y + 0.5 * pipe_h)
-
-        for j in range(min_j, max_j):
-            self.fluid.m[j] = 0
-
-        self.set_obstacle(self.obstacle_x, self.obstacle_y, True)
-
-        self.gravity = 0
+        self.tunnel.setup()
+        self.renderer = None
+        self.frames.publish(self.tunnel)
+        self.show_obstacle = True
 
         self.show_pressure = False
         self.show_smoke = True
         self.show_streamlines = False
         self.show_velocities = False
 
-    def draw(self):
+    def draw(self, frame=None):
         """
         Функция отрисовки
+        :param frame: кадр для отрисовки (по умолчанию - последний опубликованный)
         :return:
         """
-        cell_scale = 1
+        if frame is None:
+            frame = self.frames.read()
+        if frame is None:
+            return
+
         self.canvas.fill(Qt.GlobalColor.white)
         self.painter.begin(self.canvas)
-        pen = QPen()
-        pen.setWidth(1)
-        n = self.fluid.num_y
-        h = self.fluid.h
-
-        color = [255, 255, 255]
-
-        for j in range(self.fluid.num_y):
-            for i in range(self.fluid.num_x):
-                if self.show_smoke:
-                    s = self.fluid.m[i * n + j]
-                    color[0] = 255 * s
-                    color[1] = 255 * s
-                    color[2] = 255 * s
-
-                elif self.fluid.s[i * n + j] == 0:
-                    color[0] = 0
-                    color[1] = 0
-                    color[2] = 0
-
-                x = math.floor(self.cX(i * h))
-                y = math.floor(self.cY((j + 1) * h))
-                cx = math.floor(self.cScale * cell_scale * h) + 1
-                cy = math.floor(self.cScale * cell_scale * h) + 1
-
-                r = int(color[0])
-                g = int(color[1])
-                b = int(color[2])
-
-                pen.setColor(QColor(r, g, b, 255))
-                self.painter.setBrush(QColor(r, g, b, 255))
-                self.painter.drawRect(x, y, cx, cy)
+        h = frame.h
+
+        target = QRectF(
+            self.cX(0),
+            self.cY(frame.num_y * h),
+            self.cScale * frame.num_x * h,
+            self.cScale * frame.num_y * h
+        )
+        # изображение строится под размер области на экране, а не под размер сетки
+        width = round(target.width())
+        height = round(target.height())
+        if self.renderer is None or not self.renderer.matches(frame.num_x, frame.num_y, width, height):
+            self.renderer = FieldRenderer(frame.num_x, frame.num_y, width, height)
+        image = self.renderer.render(frame, self.show_smoke, self.show_pressure)
+        self.painter.drawImage(target, image)
+
+        if self.show_velocities or self.show_streamlines:
+            self.painter.setPen(Qt.GlobalColor.black)
+            if self.show_velocities:
+                self.overlay.draw_velocities(self.painter, frame, self.cScale, self.canvas_height)
+            if self.show_streamlines:
+                self.overlay.draw_streamlines(self.painter, frame, self.cScale, self.canvas_height)
 
         if self.show_obstacle:
+            obstacle_x, obstacle_y, obstacle_width, obstacle_height = frame.obstacle
             self.painter.setBrush(Qt.GlobalColor.darkCyan)
             rect = QRect(
-                int(self.cX(self.obstacle_x)),
-                int(self.cY(self.obstacle_y)),
-                int(self.cX(self.obstacle_width)),
-                int(self.cY(self.obstacle_height))
+                int(self.cX(obstacle_x)),
+                int(self.cY(obstacle_y)),
+                int(self.cX(obstacle_width)),
+                int(self.cY(obstacle_height))
             )
             self.painter.drawRect(rect)
+
+        if self.show_stats:
+            self.draw_stats()
         self.painter.end()
         self.label.setPixmap(self.canvas)
+        if self.first_frame_s is None:
+            self.first_frame_s = time.perf_counter() - self.started
 
-    def simulate(self):
+    def draw_stats(self):
         """
-        Запуск симуляции жидкости
+        Отрисовка поверх кадра времени этапов, шагов симуляции в секунду и FPS
         :return:
         """
-        if not self.paused:
-            self.fluid.simulate(self.dt, self.gravity, self.iter_num)
-            self.frame_num += 1
+        perf = self.performance()
+        sim = perf['sim']
+        render = perf['render']
+
+        lines = [f'{name}: {ms:.2f} ms' for name, ms in sim['stages_ms'].items()]
+        lines.append(f'sim: {sim["rate"]:.1f} steps/s')
+        for name, ms in render['stages_ms'].items():
+            lines.append(f'{name}: {ms:.2f} ms')
+        lines.append(f'render: {render["rate"]:.1f} FPS')
+        lines.append(f'res: {self.tunnel.res}')
+        if perf['first_frame_s'] is not None:
+            lines.append(f'first frame: {perf["first_frame_s"]:.3f} s')
+        for name, value in sim['values'].items():
+            if value is not None:
+                lines.append(f'{name}: {value:.6g}')
+
+        self.painter.setPen(Qt.GlobalColor.red)
+        for k, line in enumerate(lines):
+            self.painter.drawText(10, 20 + 16 * k, line)
 
     def update_scene(self) -> None:
         """
-        Функция обновления экрана
+        Функция обновления экрана. В потоковом режиме только показывает
+        последний готовый кадр, иначе сначала выполняет шаг симуляции
         :return:
         """
-        self.simulate()
+        if self.replay is not None:
+            if len(self.replay):
+                self.replay_index = min(self.replay_index, len(self.replay) - 1)
+                self.draw(self.replay.frame(self.replay_index))
+                self.replay_index = (self.replay_index + 1) % len(self.replay)
+            return
+
+        prof = self.render_profiler
+        t = prof.start()
+        if not self.threaded:
+            self.worker.step()
+            t = prof.lap('simulate', t)
         self.draw()
+        prof.lap('draw', t)
+        prof.commit()
 
     def set_obstacle(self, x, y, reset):
         """
-        Размещение препятствия
+        Размещение препятствия (выполняется потоком симуляции)
         :param x: х координата
         :param y: у координата
         :param reset: флаг обновления (препятствие только появилось или просто подвинулось)
         :return:
         """
-        vx = 0
-        vy = 0
+        self.worker.post('set_obstacle', x, y, reset)
+
+    def set_show_pressure(self, enabled):
+        """
+        Слот для отображения давления
+        :param enabled: рисовать давление
+        :return:
+        """
+        self.show_pressure = bool(enabled)
+
+    def set_show_smoke(self, enabled):
+        """
+        Слот для отображения дыма
+        :param enabled: рисовать дым
+        :return:
+        """
+        self.show_smoke = bool(enabled)
+
+    def set_show_velocities(self, enabled):
+        """
+        Слот для отображения стрелок скорости
+        :param enabled: рисовать скорости
+        :return:
+        """
+        self.show_velocities = bool(enabled)
 
-        if not reset:
-            vx = (x - self.obstacle_x) / self.dt
-            vy = (y - self.obstacle_y) / self.dt
+    def set_show_streamlines(self, enabled):
+        """
+        Слот для отображения линий тока
+        :param enabled: рисовать линии тока
+        :return:
+        """
+        self.show_streamlines = bool(enabled)
 
-        self.obstacle_x = x
-        self.obstacle_y = y
+    def set_show_stats(self, enabled):
+        """
+        Включение замеров времени и их вывода поверх кадра.
+        Выключенные замеры заменяются заглушкой и почти ничего не стоят
+        :param enabled: показывать статистику
+        :return:
+        """
+        self.show_stats = bool(enabled)
+        if self.show_stats:
+            self.sim_profiler = StageProfiler(SIM_STAGES)
+            self.render_profiler = StageProfiler(('simulate', 'draw'))
+        else:
+            self.sim_profiler = NULL_PROFILER
+            self.render_profiler = NULL_PROFILER
+        self.worker.post('set_profiler', self.sim_profiler)
+
+    def performance(self):
+        """
+        Данные замеров: времена этапов (мс), частота шагов, счётчики и время до первого кадра
+        :return: словарь {'sim': ..., 'render': ..., 'first_frame_s': ...}; сводки пустые, если замеры выключены
+        """
+        empty = {'stages_ms': {}, 'rate': 0.0, 'values': {}, 'steps': 0}
+        return {
+            'sim': self.sim_profiler.summary() if self.sim_profiler.enabled else empty,
+            'render': self.render_profiler.summary() if self.render_profiler.enabled else empty,
+            'first_frame_s': self.first_frame_s,
+        }
+
+    def set_paused(self, paused):
+        """
+        Пауза симуляции
+        :param paused: True - остановить шаги
+        :return:
+        """
+        self.worker.post('set_paused', paused)
 
-        n = self.fluid.num_y
+    def start_recording(self, path, capacity, every=1):
+        """
+        Начать запись кадров симуляции в файл
+        :param path: путь к файлу записи
+        :param capacity: максимальное число кадров
+        :param every: записывать каждый every-й шаг
+        :return:
+        """
+        self.worker.post('start_recording', path, capacity, every)
+
+    def stop_recording(self):
+        """
+        Закончить запись кадров
+        :return:
+        """
+        self.worker.post('stop_recording')
 
-        for j in range(1, self.fluid.num_y - 2):
-            for i in range(1, self.fluid.num_x - 2):
+    def start_streaming(self, name=None, field='m', address=None, every=1):
+        """
+        Трансляция кадров дыма или давления внешним зрителям (см. src/viewer.py)
+        :param name: имя кольца в общей памяти (None - без кольца)
+        :param field: 'm' - дым, 'p' - давление
+        :param address: адрес сокета 'unix:/путь' или '[host]:port' (None - без сокета)
+        :param every: публиковать каждый every-й шаг
+        :return:
+        """
+        self.worker.post('start_streaming', name, field, address, every)
 
-                self.fluid.s[i * n + j] = 1
+    def stop_streaming(self):
+        """
+        Остановка трансляции кадров
+        :return:
+        """
+        self.worker.post('stop_streaming')
 
-                dx = (i + 0.5) * self.fluid.h - x
-                dy = (j + 0.5) * self.fluid.h - y
+    def save_checkpoint(self, path):
+        """
+        Сохранить контрольную точку (выполняется потоком симуляции между шагами)
+        :param path: путь к файлу
+        :return:
+        """
+        self.worker.post('save_checkpoint', path)
 
-                cur_x = self.cX((i + 0.5) * self.fluid.h)
-                cur_y = self.cY((j + 0.5) * self.fluid.h)
+    def load_checkpoint(self, path):
+        """
+        Продолжить симуляцию с контрольной точки
+        :param path: путь к файлу контрольной точки
+        :return:
+        """
+        self.worker.post('load_checkpoint', path)
 
+    def start_checkpoints(self, path, every):
+        """
+        Периодически сохранять контрольную точку в фоне
+        :param path: путь к файлу
+        :param every: сохранять каждый every-й шаг
+        :return:
+        """
+        self.worker.post('start_checkpoints', path, every)
 
-                if (self.cX(self.obstacle_x) <= cur_x <= self.cX(self.obstacle_x) + self.cX(self.obstacle_width)
-                        and self.cY(self.obstacle_y) <= cur_y <= self.cY(self.obstacle_y) + self.cY(self.obstacle_height)):
-                    self.fluid.s[i * n + j] = 0
-                    self.fluid.m[i*n + j] = 1.0
+    def stop_checkpoints(self):
+        """
+        Остановить периодические контрольные точки
+        :return:
+        """
+        self.worker.post('stop_checkpoints')
 
-                    self.painter.begin(self.canvas)
-                    pen = QPen(Qt.GlobalColor.red)
-                    pen.setWidth(int(self.fluid.h) + 10)
-                    self.painter.setPen(pen)
-                    self.painter.drawPoint(int(self.cX(i * self.fluid.h)), int(self.cY(j * self.fluid.h)))
-                    #print(int(self.cX(i * self.fluid.h)), int(self.cY(j * self.fluid.h)))
-                    self.painter.end()
-                    self.label.setPixmap(self.canvas)
+    def start_replay(self, path):
+        """
+        Режим воспроизведения записи: кадры читаются из файла вместо симуляции
+        :param path: путь к файлу записи
+        :return:
+        """
+        self.replay = FrameReader(path)
+        self.replay_index = 0
+        self.set_paused(True)
 
-                    self.fluid.u[i * n + j] = vx
-                    self.fluid.u[(i + 1) * n + j] = vx
-                    self.fluid.v[i * n + j] = vy
-                    self.fluid.v[i * n + j + 1] = vy
+    def seek(self, index):
+        """
+        Переход к кадру записи
+        :param index: номер кадра
+        :return:
+        """
+        if self.replay is not None:
+            self.replay_index = index
+            self.draw(self.replay.frame(index))
 
-        self.show_obstacle = True
+    def stop_replay(self):
+        """
+        Возврат от воспроизведения к симуляции
+        :return:
+        """
+        self.replay = None
+        self.set_paused(False)
 
+    def shutdown(self):
+        """
+        Остановка таймера и потока симуляции
+        :return:
+        """
+        self.timer.stop()
+        if self.thread is not None:
+            self.worker.stop()
+            self.thread.quit()
+            self.thread.wait()
+            self.thread = None
+        self.tunnel.close()
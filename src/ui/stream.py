@@ -0,0 +1,567 @@
+import os
+import socket
+import struct
+import threading
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# поля, которые можно транслировать: дым и давление
+STREAM_FIELDS = ('m', 'p')
+
+RING_MAGIC = 0x474e4952444c4626
+RING_VERSION = 2
+# ячейки заголовка кольца (int64), WRITER - pid процесса писателя
+MAGIC, VERSION, NUM_X, NUM_Y, SLOTS, FIELD, HEAD, CLOSED, WRITER = range(9)
+RING_HEADER_SIZE = 9
+
+STREAM_MAGIC = b'FLST'
+KEY_FRAME = 0
+DELTA_FRAME = 1
+# magic, тип кадра, номер поля, num_x, num_y, номер в потоке, номер шага, min, max, длина сжатых данных
+MESSAGE_STRUCT = struct.Struct('<4sBBHHQqffI')
+# клиент подтверждает каждый кадр, поэтому в сети не больше одного кадра и буферы сокетов не копят отставание
+ACK = b'\x01'
+ACCEPT_TIMEOUT = 0.5
+
+# кольца, созданные этим процессом: их регистрацию в resource_tracker снимает только unlink писателя
+_owned = set()
+
+
+def _ring_size(num_x, num_y, slots):
+    size = (RING_HEADER_SIZE + 2 * slots) * 8
+    size += -size % 64
+    return size + slots * num_x * num_y * 4
+
+
+def _ring_views(buf, num_x, num_y, slots):
+    """
+    Представления кольца поверх блока общей памяти
+    :return: (заголовок, (номер кадра в потоке, номер шага) по слотам, данные слотов (slots, num_x, num_y))
+    """
+    header = np.ndarray((RING_HEADER_SIZE,), dtype=np.int64, buffer=buf)
+    meta = np.ndarray((slots, 2), dtype=np.int64, buffer=buf, offset=header.nbytes)
+    offset = header.nbytes + meta.nbytes
+    offset += -offset % 64
+    data = np.ndarray((slots, num_x, num_y), dtype=np.float32, buffer=buf, offset=offset)
+    return header, meta, data
+
+
+def _open_shared(name):
+    """
+    Подключение к чужому блоку общей памяти, который не удаляется при выходе читателя
+    :param name: имя блока
+    :return: SharedMemory
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # до Python 3.13 resource_tracker читателя удалил бы блок при выходе
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _owned:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def _process_alive(pid):
+    if os.name == 'nt':
+        # в Windows блок живёт, пока открыт хотя бы одним процессом, а os.kill завершил бы процесс
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # процесс есть, но принадлежит другому пользователю
+        return True
+    return True
+
+
+def _remove_stale_ring(name):
+    """
+    Удаление блока, оставшегося от упавшего писателя. Чужой блок, кольцо живого
+    писателя или кольцо другой версии не трогаются (FileExistsError)
+    :param name: имя блока общей памяти
+    :return:
+    """
+    if name in _owned:
+        raise FileExistsError(f'Shared memory {name!r} is in use by a frame ring of this process, '
+                              'choose a different name')
+    try:
+        shm = _open_shared(name)
+    except FileNotFoundError:
+        # писатель успел удалить блок сам
+        return
+    stale = False
+    error = f'Shared memory {name!r} exists and is not a fluid frame ring'
+    header = None
+    if shm.size >= RING_HEADER_SIZE * 8:
+        header = np.ndarray((RING_HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+    if header is not None and header[MAGIC] == RING_MAGIC:
+        if header[VERSION] != RING_VERSION:
+            error = f'Shared memory {name!r} holds a frame ring of version {int(header[VERSION])}'
+        elif header[CLOSED] or not _process_alive(int(header[WRITER])):
+            stale = True
+        else:
+            error = f'Shared memory {name!r} is in use by a running writer (pid {int(header[WRITER])})'
+    del header
+    shm.close()
+    if not stale:
+        raise FileExistsError(f'{error}, choose a different name')
+    shm = shared_memory.SharedMemory(name=name)
+    shm.close()
+    shm.unlink()
+
+
+class FrameRing:
+    """
+    Кольцо кадров в общей памяти (сторона писателя). Слот пишется без блокировок:
+    его номер обнуляется на время записи и ставится после неё, а заголовок HEAD
+    указывает на последний готовый кадр. Писатель не ждёт читателей: отставший
+    читатель теряет перезаписанные кадры (см. FrameRingReader)
+    """
+
+    def __init__(self, name, num_x, num_y, field='m', slots=8):
+        """
+        :param name: имя блока общей памяти (FileExistsError, если он занят живым писателем или не является кольцом)
+        :param num_x: число ячеек по х (с границами)
+        :param num_y: число ячеек по у (с границами)
+        :param field: транслируемое поле из STREAM_FIELDS
+        :param slots: число кадров в кольце
+        """
+        size = _ring_size(num_x, num_y, slots)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # блок мог остаться от упавшего запуска с тем же именем
+            _remove_stale_ring(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _owned.add(name)
+        self.name = name
+        self.num_x = num_x
+        self.num_y = num_y
+        self.slots = slots
+        self.header, self.meta, self.data = _ring_views(self.shm.buf, num_x, num_y, slots)
+        self.meta.fill(0)
+        self.header[:] = (RING_MAGIC, RING_VERSION, num_x, num_y, slots, STREAM_FIELDS.index(field), 0, 0, os.getpid())
+
+    def matches(self, num_x, num_y):
+        return self.num_x == num_x and self.num_y == num_y
+
+    def write(self, seq, frame_num, grid):
+        """
+        Запись кадра в слот seq % slots
+        :param seq: номер кадра в потоке (растёт с 1)
+        :param frame_num: номер шага симуляции
+        :param grid: поле формы (num_x, num_y)
+        :return:
+        """
+        k = seq % self.slots
+        self.meta[k, 0] = 0
+        np.copyto(self.data[k], grid)
+        self.meta[k, 1] = frame_num
+        self.meta[k, 0] = seq
+        self.header[HEAD] = seq
+
+    def close(self):
+        """
+        Пометить кольцо закрытым (читатели переподключатся по имени) и удалить блок
+        :return:
+        """
+        if self.shm is None:
+            return
+        self.header[CLOSED] = 1
+        self.header = self.meta = self.data = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+        _owned.discard(self.name)
+
+
+class FrameRingReader:
+    """
+    Чтение кольца кадров из другого процесса. Кадр принимается, только если номер
+    слота совпадает до и после копирования, т.е. писатель не начал его перезаписывать.
+    При смене размера сетки писатель создаёт кольцо заново под тем же именем,
+    читатель подключается к нему сам
+    """
+
+    def __init__(self, name):
+        """
+        :param name: имя блока общей памяти (FileNotFoundError, если его ещё нет)
+        """
+        self.name = name
+        self.shm = None
+        self.received = 0
+        self.dropped = 0
+        self._attach()
+
+    def _attach(self):
+        shm = _open_shared(self.name)
+        header = np.ndarray((RING_HEADER_SIZE,), dtype=np.int64, buffer=shm.buf)
+        if header[MAGIC] != RING_MAGIC:
+            del header
+            shm.close()
+            raise ValueError(f'{self.name} is not a fluid frame ring')
+        if header[VERSION] != RING_VERSION:
+            version = int(header[VERSION])
+            del header
+            shm.close()
+            raise ValueError(f'Unsupported frame ring version {version}')
+        self.num_x, self.num_y, self.slots = (int(x) for x in header[[NUM_X, NUM_Y, SLOTS]])
+        self.field = STREAM_FIELDS[int(header[FIELD])]
+        del header
+        self.shm = shm
+        self.header, self.meta, self.data = _ring_views(shm.buf, self.num_x, self.num_y, self.slots)
+        self.frame = np.empty((self.num_x, self.num_y), dtype=np.float32)
+        self.last = 0
+
+    def _detach(self):
+        self.header = self.meta = self.data = None
+        self.shm.close()
+        self.shm = None
+
+    def read(self, latest=True):
+        """
+        Следующий кадр кольца
+        :param latest: True - сразу последний кадр, False - по порядку, пока они не перезаписаны
+        :return: (номер в потоке, номер шага, поле (num_x, num_y)) или None, если нового кадра нет;
+                 массив поля переиспользуется следующим вызовом read
+        """
+        if self.shm is None or self.header[CLOSED]:
+            if self.shm is not None:
+                self._detach()
+            try:
+                self._attach()
+            except FileNotFoundError:
+                return None
+
+        # повтор, если писатель перезаписал слот во время копирования
+        for _ in range(self.slots):
+            head = int(self.header[HEAD])
+            if head == self.last:
+                return None
+            seq = head if latest or not self.last else max(self.last + 1, head - self.slots + 1)
+            k = seq % self.slots
+            if self.meta[k, 0] != seq:
+                continue
+            np.copyto(self.frame, self.data[k])
+            frame_num = int(self.meta[k, 1])
+            if self.meta[k, 0] != seq:
+                continue
+            if self.last:
+                self.dropped += seq - self.last - 1
+            self.last = seq
+            self.received += 1
+            return seq, frame_num, self.frame
+        return None
+
+    def close(self):
+        if self.shm is not None:
+            self._detach()
+
+
+def parse_address(address):
+    """
+    Адрес сокета
+    :param address: 'unix:/путь' или '[host]:port' (по умолчанию host 127.0.0.1)
+    :return: (семейство сокета, адрес)
+    """
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+class DeltaEncoder:
+    """
+    Сжатие кадров для сокета: поле квантуется в uint8 по диапазону кадра
+    (дым - всегда [0, 1]), первый кадр и кадр другого размера передаются целиком,
+    остальные - разностью кодов с предыдущим переданным кадром по модулю 256.
+    Спокойные области дают нулевые разности, которые zlib почти не занимают
+    """
+
+    def __init__(self, level=1):
+        """
+        :param level: уровень сжатия zlib
+        """
+        self.level = level
+        self.codes = None
+        self.previous = None
+
+    def encode(self, seq, frame_num, field, grid):
+        """
+        :param seq: номер кадра в потоке
+        :param frame_num: номер шага симуляции
+        :param field: имя поля из STREAM_FIELDS
+        :param grid: поле формы (num_x, num_y)
+        :return: сообщение (заголовок MESSAGE_STRUCT и сжатые коды)
+        """
+        if field == 'm':
+            low, high = 0.0, 1.0
+        else:
+            low, high = float(grid.min()), float(grid.max())
+        scale = 255.0 / (high - low) if high > low else 0.0
+        values = (grid - low) * scale
+        np.clip(values, 0.0, 255.0, out=values)
+
+        if self.codes is None or self.codes.shape != grid.shape:
+            self.codes = np.empty(grid.shape, dtype=np.uint8)
+            self.previous = None
+        np.rint(values, out=values)
+        self.codes[:] = values
+
+        if self.previous is None:
+            kind = KEY_FRAME
+            payload = self.codes
+            self.previous = self.codes.copy()
+        else:
+            kind = DELTA_FRAME
+            payload = self.codes - self.previous
+            self.previous, self.codes = self.codes, self.previous
+
+        data = zlib.compress(payload.tobytes(), self.level)
+        num_x, num_y = grid.shape
+        header = MESSAGE_STRUCT.pack(STREAM_MAGIC, kind, STREAM_FIELDS.index(field), num_x, num_y,
+                                     seq, frame_num, low, high, len(data))
+        return header + data
+
+
+class DeltaDecoder:
+    """
+    Восстановление кадров DeltaEncoder
+    """
+
+    def __init__(self):
+        self.codes = None
+
+    def decode(self, header, data):
+        """
+        :param header: распакованный MESSAGE_STRUCT
+        :param data: сжатые коды
+        :return: (номер в потоке, номер шага, имя поля, поле float32 (num_x, num_y))
+        """
+        magic, kind, field, num_x, num_y, seq, frame_num, low, high, _ = header
+        if magic != STREAM_MAGIC:
+            raise ValueError('Not a fluid frame stream')
+        codes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(num_x, num_y)
+        if kind == KEY_FRAME:
+            self.codes = codes.copy()
+        elif self.codes is None or self.codes.shape != codes.shape:
+            raise ValueError('Delta frame without a key frame')
+        else:
+            self.codes += codes
+        scale = (high - low) / 255.0
+        return seq, frame_num, STREAM_FIELDS[field], self.codes * np.float32(scale) + np.float32(low)
+
+
+class StreamServer:
+    """
+    Раздача кадров по TCP или Unix-сокету. offer() только сохраняет копию кадра
+    как последний; у каждого клиента свой поток, который сжимает и отправляет
+    последний кадр, когда клиент подтвердил предыдущий (ACK). Медленный клиент
+    пропускает кадры, а поток симуляции никогда не ждёт сеть
+    """
+
+    def __init__(self, address):
+        """
+        :param address: адрес прослушивания (см. parse_address)
+        """
+        family, self.address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.listen()
+        # закрытие сокета не прерывает accept в другом потоке, поэтому он ждёт с таймаутом
+        self.sock.settimeout(ACCEPT_TIMEOUT)
+        if family == socket.AF_INET:
+            self.address = self.sock.getsockname()
+        self.family = family
+
+        self.cond = threading.Condition()
+        self.latest = None
+        self.running = True
+        self.clients = []
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.thread.start()
+
+    def offer(self, seq, frame_num, field, grid):
+        """
+        Новый кадр для клиентов
+        :param seq: номер кадра в потоке
+        :param frame_num: номер шага симуляции
+        :param field: имя поля из STREAM_FIELDS
+        :param grid: поле формы (num_x, num_y), копируется
+        :return:
+        """
+        with self.cond:
+            if not self.clients:
+                return
+            self.latest = (seq, frame_num, field, grid.copy())
+            self.cond.notify_all()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            conn.settimeout(None)
+            thread = threading.Thread(target=self._client_loop, args=(conn,), daemon=True)
+            with self.cond:
+                self.clients.append(conn)
+            thread.start()
+
+    def _client_loop(self, conn):
+        encoder = DeltaEncoder()
+        sent = None
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: not self.running or (self.latest is not None and self.latest[0] != sent))
+                    if not self.running:
+                        break
+                    item = self.latest
+                conn.sendall(encoder.encode(*item))
+                sent = item[0]
+                if conn.recv(1) != ACK:
+                    break
+        except OSError:
+            # клиент отключился
+            pass
+        finally:
+            with self.cond:
+                self.clients.remove(conn)
+            conn.close()
+
+    def close(self):
+        """
+        Отключение клиентов и закрытие сокета
+        :return:
+        """
+        if not self.running:
+            return
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+            for conn in self.clients:
+                # прерывает sendall у зависшего клиента
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.sock.close()
+        self.thread.join()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+class StreamClient:
+    """
+    Приём кадров StreamServer
+    """
+
+    def __init__(self, address, timeout=None):
+        """
+        :param address: адрес сервера (см. parse_address)
+        :param timeout: таймаут подключения и чтения в секундах
+        """
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.decoder = DeltaDecoder()
+        self.last = 0
+        self.received = 0
+        self.dropped = 0
+
+    def _recv(self, size):
+        chunks = []
+        while size:
+            chunk = self.sock.recv(size)
+            if not chunk:
+                raise ConnectionError('Stream closed')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def read(self):
+        """
+        Следующий кадр (блокирует до его прихода)
+        :return: (номер в потоке, номер шага, имя поля, поле float32 (num_x, num_y))
+        """
+        header = MESSAGE_STRUCT.unpack(self._recv(MESSAGE_STRUCT.size))
+        seq, frame_num, field, grid = self.decoder.decode(header, self._recv(header[-1]))
+        self.sock.sendall(ACK)
+        if self.last and seq > self.last:
+            self.dropped += seq - self.last - 1
+        self.last = seq
+        self.received += 1
+        return seq, frame_num, field, grid
+
+    def close(self):
+        self.sock.close()
+
+
+class FramePublisher:
+    """
+    Публикация готовых кадров дыма или давления для внешних зрителей:
+    кольцо в общей памяти (FrameRing) и, если задан адрес, сокет с дельта-сжатием (StreamServer).
+    Номер кадра в потоке растёт непрерывно, в том числе при смене размера сетки
+    """
+
+    def __init__(self, name=None, field='m', address=None, slots=8, every=1):
+        """
+        :param name: имя блока общей памяти (None - без кольца)
+        :param field: транслируемое поле из STREAM_FIELDS
+        :param address: адрес сокета (None - без сокета, см. parse_address)
+        :param slots: число кадров в кольце
+        :param every: публиковать каждый every-й шаг
+        """
+        if field not in STREAM_FIELDS:
+            raise ValueError(f'Unknown stream field: {field!r}, expected one of {STREAM_FIELDS}')
+        if name is None and address is None:
+            raise ValueError('FramePublisher needs a shared memory name or a socket address')
+        self.name = name
+        self.field = field
+        self.slots = slots
+        self.every = every
+        self.seq = 0
+        self.ring = None
+        self.server = None if address is None else StreamServer(address)
+
+    def publish(self, tunnel):
+        """
+        Публикация текущего поля трубы
+        :param tunnel: объект WindTunnel
+        :return:
+        """
+        fluid = tunnel.fluid
+        grid = fluid.grid(self.field)
+        self.seq += 1
+        if self.name is not None:
+            if self.ring is None or not self.ring.matches(fluid.num_x, fluid.num_y):
+                if self.ring is not None:
+                    self.ring.close()
+                self.ring = FrameRing(self.name, fluid.num_x, fluid.num_y, self.field, self.slots)
+            self.ring.write(self.seq, tunnel.frame_num, grid)
+        if self.server is not None:
+            self.server.offer(self.seq, tunnel.frame_num, self.field, grid)
+
+    def close(self):
+        """
+        Удаление кольца и закрытие сокета
+        :return:
+        """
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        if self.server is not None:
+            self.server.close()
+            self.server = None
@@ -1,5 +1,5 @@
 from PyQt6.QtCore import Qt
-from PyQt6.QtWidgets import QWidget, QGridLayout, QLabel, QSlider, QSizePolicy
+from PyQt6.QtWidgets import QWidget, QGridLayout, QLabel, QSlider, QSizePolicy, QCheckBox, QSpinBox
 
 
 class ToolWidget(QWidget):
@@ -31,6 +31,23 @@ class ToolWidget(QWidget):
         self.height_slider.setMinimum(0)
         self.height_slider.setMaximum(100)
 
+        self.stats_checkbox = QCheckBox('Статистика')
+
+        self.res_label = QLabel('Разрешение')
+        self.res_spinbox = QSpinBox()
+        self.res_spinbox.setMinimum(20)
+        self.res_spinbox.setMaximum(400)
+        self.res_spinbox.setValue(100)
+        # значение применяется по Enter или стрелкам, а не на каждую набранную цифру
+        self.res_spinbox.setKeyboardTracking(False)
+        self.auto_res_checkbox = QCheckBox('Авто')
+
+        self.smoke_checkbox = QCheckBox('Дым')
+        self.smoke_checkbox.setChecked(True)
+        self.pressure_checkbox = QCheckBox('Давление')
+        self.velocities_checkbox = QCheckBox('Скорости')
+        self.streamlines_checkbox = QCheckBox('Линии тока')
+
         layout.addWidget(self.x_coord_label, 0, 0)
         layout.addWidget(self.y_coord_label, 1, 0)
         layout.addWidget(self.width_label, 2, 0)
@@ -39,6 +56,14 @@ class ToolWidget(QWidget):
         layout.addWidget(self.y_coord_slider, 1, 1)
         layout.addWidget(self.width_slider, 2, 1)
         layout.addWidget(self.height_slider, 3, 1)
+        layout.addWidget(self.stats_checkbox, 4, 0)
+        layout.addWidget(self.res_label, 5, 0)
+        layout.addWidget(self.res_spinbox, 5, 1)
+        layout.addWidget(self.auto_res_checkbox, 6, 0)
+        layout.addWidget(self.smoke_checkbox, 7, 0)
+        layout.addWidget(self.pressure_checkbox, 7, 1)
+        layout.addWidget(self.velocities_checkbox, 8, 0)
+        layout.addWidget(self.streamlines_checkbox, 8, 1)
         self.setLayout(layout)
 
         self.setSizePolicy(
@@ -0,0 +1,361 @@
+import numpy as np
+
+from .backends import create_fluid
+from .checkpoint import AutoCheckpoint, Checkpoint, CHECKPOINT_FIELDS, tunnel_state, write_checkpoint
+from .fluid import U_FIELD, V_FIELD, S_FIELD
+from .layout import SceneLayout, obstacle_mask
+from .profiling import NULL_PROFILER
+from .recording import FrameRecorder
+from .stream import FramePublisher
+
+
+class WindTunnel:
+    """
+    Модель аэродинамической трубы: жидкость, препятствие и параметры шага.
+    Не зависит от Qt, поэтому может выполняться в рабочем потоке
+    """
+
+    def __init__(self, sim_width, sim_height=1.0, res=100, in_vel=2.5, dt=1.0 / 20.0, iter_num=5,
+                 gravity=0.0, obstacle=(0.1, 0.9, 0.09, 0.21)):
+        """
+        :param sim_width: ширина области симуляции
+        :param sim_height: высота области симуляции
+        :param res: число ячеек по высоте
+        :param in_vel: скорость набегающего потока
+        :param dt: шаг времени
+        :param iter_num: число прогонок решения
+        :param gravity: значение гравитации
+        :param obstacle: препятствие (x, y, ширина, высота)
+        """
+        self.gravity = gravity
+        self.dt = dt
+        self.iter_num = iter_num
+        self.frame_num = 0
+        self.over_relaxation = 1.9
+        self.obstacle_x, self.obstacle_y, self.obstacle_width, self.obstacle_height = obstacle
+        self.paused = False
+        self.backend = 'numpy'
+        self.backend_options = {}
+        self.pressure_solver = 'red_black'
+        self.tolerance = None
+        self.warm_start = False
+        self.warm_start_probe = None
+        self.cfl = None
+        self.step_budget = None
+        self.max_substeps = 8
+        self.density = 1000
+        self.res = res
+        self.in_vel = in_vel
+        self.layout = None
+        self.layout_cache = None
+        self.static_solid = None
+        self.fluid = None
+        self.recorder = None
+        self.checkpointer = None
+        self.publisher = None
+        self.profiler = NULL_PROFILER
+
+        self.sim_height = sim_height
+        self.sim_width = sim_width
+
+    def make_fluid(self):
+        """
+        Создание жидкости для текущего разрешения res с параметрами трубы
+        :return: объект Fluid
+        """
+        dom_height = 1
+        dom_width = dom_height / self.sim_height * self.sim_width
+        h = dom_height / self.res
+
+        numx = int(dom_width / h)
+        numy = int(dom_height / h)
+
+        fluid = create_fluid(self.backend, self.density, numx, numy, h, self.pressure_solver, **self.backend_options)
+        fluid.tolerance = self.tolerance
+        fluid.warm_start = self.warm_start
+        fluid.warm_start_probe = self.warm_start_probe
+        fluid.profiler = self.profiler
+        return fluid
+
+    def scene_layout(self):
+        """
+        Описание сцены: заданное layout или стандартная труба со скоростью потока in_vel
+        :return: SceneLayout
+        """
+        if self.layout is not None:
+            return self.layout
+        return SceneLayout(in_vel=self.in_vel)
+
+    def init_boundaries(self):
+        """
+        Стенки трубы, входящий поток, полоса дыма на входе и неподвижные препятствия (см. SceneLayout)
+        :return:
+        """
+        self.static_solid = self.scene_layout().apply(self.fluid, self.sim_height, self.layout_cache)
+
+    def setup(self):
+        """
+        Подготовка симуляции
+        :return:
+        """
+        if self.fluid is not None:
+            self.fluid.close()
+        self.fluid = self.make_fluid()
+        self.init_boundaries()
+        self.set_obstacle(self.obstacle_x, self.obstacle_y, True)
+
+    def resize(self, res):
+        """
+        Смена разрешения без перезапуска: u, v и m переносятся на новую сетку
+        билинейной интерполяцией (Fluid.sample_fields), стенки, вход потока и
+        препятствие строятся заново, давление начинается с нуля.
+        Запись кадров останавливается: файл рассчитан на один размер сетки
+        :param res: новое число ячеек по высоте
+        :return:
+        """
+        res = max(2, int(res))
+        if self.fluid is None or res == self.res:
+            self.res = res
+            return
+
+        old = self.fluid
+        self.res = res
+        self.stop_recording()
+        fluid = self.fluid = self.make_fluid()
+        fluid.cnt = old.cnt
+
+        h = fluid.h
+        h2 = 0.5 * h
+        i, j = np.indices((fluid.num_x, fluid.num_y))
+        x = i * h
+        y = j * h
+        fluid.grid('u')[:] = old.sample_fields(x, y + h2, U_FIELD)
+        fluid.grid('v')[:] = old.sample_fields(x + h2, y, V_FIELD)
+        fluid.grid('m')[:] = old.sample_fields(x + h2, y + h2, S_FIELD)
+        old.close()
+
+        self.init_boundaries()
+        self.set_obstacle(self.obstacle_x, self.obstacle_y, True)
+
+    def simulate(self):
+        """
+        Один шаг симуляции жидкости
+        :return:
+        """
+        if not self.paused:
+            self.fluid.simulate(self.dt, self.gravity, self.iter_num,
+                                cfl=self.cfl, budget=self.step_budget, max_substeps=self.max_substeps)
+            self.frame_num += 1
+            if self.recorder is not None and self.frame_num % self.recorder.every == 0:
+                self.recorder.record(self)
+            if self.checkpointer is not None and self.frame_num % self.checkpointer.every == 0:
+                self.checkpointer.capture(self)
+            if self.publisher is not None and self.frame_num % self.publisher.every == 0:
+                self.publisher.publish(self)
+
+    def start_recording(self, path, capacity, every=1):
+        """
+        Начать запись кадров в файл (см. FrameRecorder)
+        :param path: путь к файлу записи
+        :param capacity: максимальное число кадров
+        :param every: записывать каждый every-й шаг
+        :return:
+        """
+        self.stop_recording()
+        self.recorder = FrameRecorder(path, self.fluid, self.dt, capacity, every=every)
+
+    def stop_recording(self):
+        """
+        Закончить запись кадров
+        :return:
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def save_checkpoint(self, path):
+        """
+        Сохранение контрольной точки: поля жидкости и параметры сцены (см. checkpoint.py)
+        :param path: путь к файлу
+        :return:
+        """
+        fluid = self.fluid
+        write_checkpoint(path, tunnel_state(self), {name: fluid.grid(name) for name in CHECKPOINT_FIELDS})
+
+    def load_checkpoint(self, path):
+        """
+        Продолжение расчёта с контрольной точки. Жидкость создаётся заново для текущего
+        бэкенда и решателя, поля берутся из файла без копирования (Fluid.load_fields).
+        Запись кадров останавливается: файл рассчитан на один размер сетки
+        :param path: путь к файлу контрольной точки
+        :return:
+        """
+        checkpoint = Checkpoint(path)
+        state = checkpoint.state
+        self.stop_recording()
+        self.res = state['res']
+        self.sim_width = state['sim_width']
+        self.sim_height = state['sim_height']
+        self.density = state['density']
+        self.in_vel = state['in_vel']
+        self.dt = state['dt']
+        self.gravity = state['gravity']
+        self.iter_num = state['iter_num']
+        self.over_relaxation = state['over_relaxation']
+        self.frame_num = state['frame_num']
+        self.obstacle_x, self.obstacle_y, self.obstacle_width, self.obstacle_height = state['obstacle']
+
+        layout = state.get('layout')
+        self.layout = None if layout is None else SceneLayout.from_dict(layout)
+
+        fluid = self.make_fluid()
+        fluid.load_fields(checkpoint.arrays())
+        fluid.cnt = state['cnt']
+        fluid.solid_changed()
+        if self.fluid is not None:
+            self.fluid.close()
+        self.fluid = fluid
+        self.static_solid = self.scene_layout().build(
+            fluid.num_x, fluid.num_y, fluid.h, self.sim_height, self.layout_cache)['static']
+
+    def start_checkpoints(self, path, every):
+        """
+        Периодическое сохранение контрольной точки в фоновом потоке (см. AutoCheckpoint)
+        :param path: путь к файлу, перезаписывается при каждом сохранении
+        :param every: сохранять каждый every-й шаг
+        :return:
+        """
+        self.stop_checkpoints()
+        self.checkpointer = AutoCheckpoint(path, every)
+
+    def stop_checkpoints(self):
+        """
+        Остановка периодических контрольных точек
+        :return:
+        """
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+            self.checkpointer = None
+
+    def start_streaming(self, name=None, field='m', address=None, every=1):
+        """
+        Трансляция кадров внешним зрителям (см. FramePublisher)
+        :param name: имя кольца в общей памяти (None - без кольца)
+        :param field: 'm' - дым, 'p' - давление
+        :param address: адрес сокета 'unix:/путь' или '[host]:port' (None - без сокета)
+        :param every: публиковать каждый every-й шаг
+        :return:
+        """
+        self.stop_streaming()
+        self.publisher = FramePublisher(name, field, address, every=every)
+
+    def stop_streaming(self):
+        """
+        Остановка трансляции кадров
+        :return:
+        """
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+
+    def close(self):
+        """
+        Завершение записи и освобождение ресурсов жидкости
+        :return:
+        """
+        self.stop_recording()
+        self.stop_checkpoints()
+        self.stop_streaming()
+        if self.fluid is not None:
+            self.fluid.close()
+
+    def set_profiler(self, profiler):
+        """
+        Подключение профилировщика этапов Fluid.simulate
+        :param profiler: StageProfiler или NULL_PROFILER (выключено)
+        :return:
+        """
+        self.profiler = profiler
+        if self.fluid is not None:
+            self.fluid.profiler = profiler
+
+    def set_paused(self, paused):
+        """
+        Пауза симуляции
+        :param paused: True - остановить шаги
+        :return:
+        """
+        self.paused = paused
+
+    def move_obstacle(self, x=None, y=None, width=None, height=None, elapsed=None):
+        """
+        Изменение положения и размеров препятствия (None - оставить как есть)
+        :param x: новая х координата
+        :param y: новая у координата
+        :param width: новая ширина
+        :param height: новая высота
+        :param elapsed: время, за которое препятствие сместилось (None - шаг dt)
+        :return:
+        """
+        if width is not None:
+            self.obstacle_width = width
+        if height is not None:
+            self.obstacle_height = height
+        self.set_obstacle(
+            self.obstacle_x if x is None else x,
+            self.obstacle_y if y is None else y,
+            False,
+            elapsed
+        )
+
+    def set_obstacle(self, x, y, reset, elapsed=None):
+        """
+        Размещение препятствия
+        :param x: х координата
+        :param y: у координата
+        :param reset: флаг обновления (препятствие только появилось или просто подвинулось)
+        :param elapsed: время, за которое препятствие сместилось (None - шаг dt)
+        :return:
+        """
+        vx = 0
+        vy = 0
+
+        if not reset:
+            period = elapsed if elapsed else self.dt
+            vx = (x - self.obstacle_x) / period
+            vy = (y - self.obstacle_y) / period
+
+        self.obstacle_x = x
+        self.obstacle_y = y
+
+        fluid = self.fluid
+        nx = fluid.num_x
+        ny = fluid.num_y
+        s = fluid.grid('s')
+
+        inside = obstacle_mask(nx, ny, fluid.h, self.sim_height,
+                               self.obstacle_x, self.obstacle_y, self.obstacle_width, self.obstacle_height)
+        solid = np.zeros((nx, ny), dtype=bool)
+        solid[1:-2, 1:-2] = s[1:-2, 1:-2] == 0.0
+        if self.static_solid is not None:
+            # неподвижные препятствия сцены не принадлежат подвижному и не освобождаются при его сдвиге
+            inside &= ~self.static_solid
+            solid &= ~self.static_solid
+
+        covered = inside & ~solid
+        changed = inside != solid
+        s[covered] = 0.0
+        s[solid & ~inside] = 1.0
+        fluid.grid('m')[covered] = 1.0
+
+        # скорость препятствия - на гранях между ним и жидкостью и на всех гранях только что закрытых ячеек
+        face_u = covered.copy()
+        face_u[1:] |= (inside[1:] != inside[:-1]) | covered[:-1]
+        face_v = covered.copy()
+        face_v[:, 1:] |= (inside[:, 1:] != inside[:, :-1]) | covered[:, :-1]
+        fluid.grid('u')[face_u] = vx
+        fluid.grid('v')[face_v] = vy
+
+        if changed.any():
+            i, j = np.nonzero(changed)
+            fluid.solid_changed((int(i.min()), int(i.max()) + 1, int(j.min()), int(j.max()) + 1))
@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+
+from PyQt6.QtCore import QObject
+
+from .lod import ResolutionGovernor
+
+
+class SimulationWorker(QObject):
+    """
+    Выполнение шагов симуляции вне потока интерфейса.
+    Изменения параметров приходят как команды в очередь и применяются
+    между шагами, готовые кадры публикуются в FrameBuffer
+    """
+
+    def __init__(self, tunnel, frames, parent=None):
+        """
+        :param tunnel: объект WindTunnel
+        :param frames: объект FrameBuffer
+        """
+        super().__init__(parent)
+        self.tunnel = tunnel
+        self.frames = frames
+        self.commands = queue.Queue()
+        self.obstacle_lock = threading.Lock()
+        self.pending_obstacle = {}
+        self.last_step = None
+        self.running = False
+        self.max_rate = 30.0
+        self.resolution = tunnel.res
+        self.governor = None
+
+    def post(self, name, *args, **kwargs):
+        """
+        Постановка команды в очередь (можно вызывать из любого потока)
+        :param name: имя метода WindTunnel
+        :return:
+        """
+        self.commands.put((name, args, kwargs))
+
+    def post_obstacle(self, **params):
+        """
+        Изменение препятствия (x, y, width, height) с объединением: между шагами
+        запоминаются только последние значения, применяются они один раз за шаг
+        :return:
+        """
+        with self.obstacle_lock:
+            self.pending_obstacle.update(params)
+
+    def apply_obstacle(self, elapsed):
+        """
+        Применение накопившегося изменения препятствия
+        :param elapsed: реальное время с предыдущего шага (None - первый шаг)
+        :return:
+        """
+        with self.obstacle_lock:
+            params, self.pending_obstacle = self.pending_obstacle, {}
+        if params:
+            self.tunnel.move_obstacle(elapsed=elapsed, **params)
+
+    def set_resolution(self, res):
+        """
+        Смена разрешения сетки (выполняется потоком симуляции перед следующим шагом)
+        :param res: число ячеек по высоте
+        :return:
+        """
+        self.resolution = res
+        governor = self.governor
+        if governor is not None:
+            governor.target = res
+        self.post('resize', res)
+
+    def set_auto_resolution(self, enabled):
+        """
+        Автоматическое уменьшение разрешения, когда шаг не укладывается в кадр (1 / max_rate),
+        и возврат к заданному, когда запас снова появился (см. ResolutionGovernor).
+        При выключении восстанавливается заданное разрешение
+        :param enabled: включить подбор разрешения
+        :return:
+        """
+        if enabled:
+            self.governor = ResolutionGovernor(self.resolution, 1.0 / self.max_rate)
+        else:
+            self.governor = None
+            self.post('resize', self.resolution)
+
+    def process_commands(self):
+        """
+        Применение команд, накопившихся к началу шага; пришедшие во время
+        обработки ждут следующего шага, поэтому работа за шаг ограничена
+        :return:
+        """
+        for _ in range(self.commands.qsize()):
+            try:
+                name, args, kwargs = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            getattr(self.tunnel, name)(*args, **kwargs)
+
+    def step(self):
+        """
+        Один шаг: команды, изменение препятствия, симуляция, публикация кадра
+        :return:
+        """
+        now = time.perf_counter()
+        elapsed = None if self.last_step is None else now - self.last_step
+        self.last_step = now
+
+        self.process_commands()
+        self.apply_obstacle(elapsed)
+        start = time.perf_counter()
+        self.tunnel.simulate()
+        governor = self.governor
+        if governor is not None:
+            governor.update(self.tunnel, time.perf_counter() - start)
+        self.frames.publish(self.tunnel)
+
+    def run(self):
+        """
+        Цикл потока симуляции, ограниченный max_rate шагами в секунду
+        :return:
+        """
+        self.running = True
+        while self.running:
+            start = time.perf_counter()
+            self.step()
+            if self.max_rate:
+                remaining = 1.0 / self.max_rate - (time.perf_counter() - start)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+    def stop(self):
+        """
+        Остановка цикла потока симуляции
+        :return:
+        """
+        self.running = False
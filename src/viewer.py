@@ -0,0 +1,161 @@
+import argparse
+import threading
+import time
+
+from src.ui.stream import FrameRingReader, StreamClient
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Minimal viewer for frames streamed by a running simulation')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--shm', default=None, help='имя кольца кадров в общей памяти (--stream у headless)')
+    source.add_argument('--connect', default=None,
+                        help="адрес сокета 'unix:/путь' или '[host]:port' (--stream-address у headless)")
+    parser.add_argument('--no-gui', action='store_true', help='без окна: раз в секунду печатать число кадров')
+    parser.add_argument('--duration', type=float, default=None, help='время работы в секундах (по умолчанию до закрытия)')
+    parser.add_argument('--scale', type=int, default=4, help='пикселей на ячейку в окне')
+    return parser.parse_args(argv)
+
+
+class RingSource:
+    """
+    Кадры из кольца в общей памяти: ожидание появления кольца и чтение последнего кадра
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.reader = None
+
+    def read(self):
+        """
+        :return: (номер в потоке, номер шага, имя поля, поле) или None, если нового кадра нет
+        """
+        if self.reader is None:
+            try:
+                self.reader = FrameRingReader(self.name)
+            except FileNotFoundError:
+                return None
+        frame = self.reader.read()
+        if frame is None:
+            return None
+        seq, frame_num, grid = frame
+        return seq, frame_num, self.reader.field, grid
+
+    def counters(self):
+        if self.reader is None:
+            return 0, 0
+        return self.reader.received, self.reader.dropped
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+
+
+class SocketSource:
+    """
+    Кадры из сокета: приём в отдельном потоке, наружу отдаётся только последний,
+    поэтому медленная отрисовка не задерживает приём
+    """
+
+    def __init__(self, address):
+        self.client = StreamClient(address)
+        self.lock = threading.Lock()
+        self.latest = None
+        self.thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self.thread.start()
+
+    def _receive_loop(self):
+        try:
+            while True:
+                frame = self.client.read()
+                with self.lock:
+                    self.latest = frame
+        except (ConnectionError, OSError):
+            pass
+
+    def read(self):
+        with self.lock:
+            frame, self.latest = self.latest, None
+        return frame
+
+    def counters(self):
+        return self.client.received, self.client.dropped
+
+    def close(self):
+        self.client.close()
+
+
+def run_console(source, duration):
+    start = time.perf_counter()
+    report = start + 1.0
+    last = None
+    while duration is None or time.perf_counter() - start < duration:
+        frame = source.read()
+        if frame is None:
+            time.sleep(0.005)
+        else:
+            last = frame
+        if time.perf_counter() >= report and last is not None:
+            received, dropped = source.counters()
+            seq, frame_num, field, grid = last
+            print(f'seq {seq} step {frame_num} {field} {grid.shape[0]}x{grid.shape[1]}: '
+                  f'received {received}, dropped {dropped}')
+            report += 1.0
+
+
+def run_window(source, duration, scale):
+    from types import SimpleNamespace
+
+    import numpy as np
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtGui import QPixmap
+    from PyQt6.QtWidgets import QApplication, QLabel
+
+    from src.ui.renderer import FieldRenderer
+
+    app = QApplication([])
+    label = QLabel()
+    label.setWindowTitle('Fluid stream')
+    label.show()
+    renderer = None
+
+    def update():
+        nonlocal renderer
+        frame = source.read()
+        if frame is None:
+            return
+        seq, frame_num, field, grid = frame
+        num_x, num_y = grid.shape
+        if renderer is None or not renderer.matches(num_x, num_y):
+            renderer = FieldRenderer(num_x, num_y)
+        # в потоке нет маски s: твёрдые ячейки не затемняются
+        view = SimpleNamespace(m=grid.reshape(-1), p=grid.reshape(-1), s=np.ones(grid.size, np.float32))
+        image = renderer.render(view, show_smoke=field == 'm', show_pressure=field == 'p')
+        label.setPixmap(QPixmap.fromImage(image).scaled(num_x * scale, num_y * scale))
+        received, dropped = source.counters()
+        label.setToolTip(f'seq {seq}, step {frame_num}, received {received}, dropped {dropped}')
+
+    timer = QTimer()
+    timer.timeout.connect(update)
+    timer.start(int(1 / 30 * 1000))
+    if duration is not None:
+        QTimer.singleShot(int(duration * 1000), app.quit)
+    app.exec()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    source = RingSource(args.shm) if args.shm else SocketSource(args.connect)
+    try:
+        if args.no_gui:
+            run_console(source, args.duration)
+        else:
+            run_window(source, args.duration, args.scale)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.close()
+
+
+if __name__ == '__main__':
+    main()